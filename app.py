@@ -4,9 +4,9 @@ from chalicelib.routes import routes
 
 cors_config = CORSConfig(
     allow_origin='*',
-    allow_headers=['Content-Type'],
+    allow_headers=['Content-Type', 'If-None-Match', 'Idempotency-Key'],
     max_age=600,
-    expose_headers=['X-Amz-Date']
+    expose_headers=['X-Amz-Date', 'ETag', 'X-Next-Cursor', 'Idempotent-Replayed', 'Retry-After']
 )
 
 app = Chalice(app_name='calculator-backend')
@@ -0,0 +1,127 @@
+"""
+Benchmarks the API hot paths against an offline, seeded SQLite database.
+
+Usage:
+    python benchmarks/bench_api.py [--iterations N] [--records N] [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from harness import ROOT, BenchmarkEnvironment, measure
+
+from chalice.app import AuthRequest
+
+
+def scenarios(environment):
+    """
+    Returns the benchmarked scenarios by name. Each one sends a single request and
+    checks it was answered with the expected status.
+    """
+    def request(method, path, body=None, headers=None, status=200):
+        def scenario():
+            response = environment.request(method, path, body=body, headers=headers)
+            if response['statusCode'] != status:
+                raise AssertionError(f"{method} {path} answered {response['statusCode']}: {response['body']}")
+        return scenario
+
+    def authorize(clear_cache):
+        auth_request = AuthRequest('TOKEN', environment.token, 'arn:aws:execute-api:us-east-2:0:api/*/GET/v1/records')
+
+        def scenario():
+            if clear_cache:
+                environment.authorizer._verified_tokens.clear()
+            if 'policyDocument' not in environment.authorizer.authenticate_request(auth_request):
+                raise AssertionError('Benchmark token was not authorized')
+        return scenario
+
+    operations_etag = environment.request('GET', '/v1/operations')['headers']['ETag']
+    first_page = json.loads(environment.request('GET', '/v1/records?operation_type=&per_page=10')['body'])
+    return {
+        'authorizer (verify)': authorize(clear_cache=True),
+        'authorizer (cached)': authorize(clear_cache=False),
+        'GET /v1/operations': request('GET', '/v1/operations'),
+        'GET /v1/operations (304)': request('GET', '/v1/operations', headers={'If-None-Match': operations_etag},
+                                            status=304),
+        'GET /v1/records': request('GET', '/v1/records?operation_type=&per_page=10'),
+        'GET /v1/records (cursor, no count)': request(
+            'GET', f"/v1/records?operation_type=&per_page=10&count=none&cursor={first_page['next_cursor']}"
+        ),
+        'GET /v1/random-string': request('GET', '/v1/random-string?numeric=false'),
+        'POST /v1/records': request('POST', '/v1/records', body={
+            'operation_id': environment.operations['+'].id, 'num1': '5', 'num2': '10'
+        }),
+        'POST /v1/records/batch (10 items)': request('POST', '/v1/records/batch', body={
+            'items': [{'operation_id': environment.operations['*'].id, 'num1': '6', 'num2': '7'}] * 10
+        }),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results, baseline=None):
+    header = f"{'scenario':<36}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'req/s':>10}{'queries':>9}"
+    print(header)
+    print('-' * len(header))
+    for name, result in results.items():
+        print(f"{name:<36}{result['p50_ms']:>10.3f}{result['p90_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+              f"{result['throughput_rps']:>10.1f}{result['queries_per_request']:>9.1f}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            changes = [
+                f"{metric} {(result[metric] - previous[metric]) / previous[metric] * 100:+.1f}%"
+                for metric in ('p50_ms', 'p99_ms', 'throughput_rps') if previous[metric]
+            ]
+            queries = result['queries_per_request'] - previous['queries_per_request']
+            print(f"{'':<4}vs baseline: {', '.join(changes)}, queries {queries:+.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200, help='Timed requests per scenario.')
+    parser.add_argument('--records', type=int, default=1000, help='Records seeded for the benchmark user.')
+    parser.add_argument('--only', action='append', help='Run only the scenarios containing this text.')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--compare', help='Show the change against results previously written with --output.')
+    args = parser.parse_args()
+
+    environment = BenchmarkEnvironment(records=args.records)
+    try:
+        results = {
+            name: measure(scenario, args.iterations)
+            for name, scenario in scenarios(environment).items()
+            if not args.only or any(text in name for text in args.only)
+        }
+    finally:
+        environment.close()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_report(results, baseline)
+
+    if args.output:
+        report = {
+            'commit': current_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'iterations': args.iterations,
+            'records': args.records,
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Compares perform_operation with the eval() based evaluation it replaced.
+
+Usage:
+    python benchmarks/bench_operations.py [--number N]
+"""
+import argparse
+import math
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('USER_POOL_ID', 'benchmark')
+
+from chalicelib.helpers import perform_operation  # noqa: E402
+
+CASES = [('5', '10', '+'), ('50', '8', '-'), ('12', '12', '*'), ('10', '4', '/'), ('81', '', '√')]
+
+
+def eval_operation(num1, num2, symbol):
+    """
+    The previous implementation of perform_operation, kept as the baseline.
+    """
+    if not num1.isnumeric():
+        return num1
+    expression = f"math.sqrt({int(num1)})" if symbol == "√" else f"{int(num1)} {symbol} {int(num2)}"
+    return eval(expression, {'math': math})
+
+
+def run_cases(function):
+    for num1, num2, symbol in CASES:
+        function(num1, num2, symbol)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000, help='Executions of the whole case list per timing.')
+    args = parser.parse_args()
+
+    for num1, num2, symbol in CASES:
+        assert perform_operation(num1, num2, symbol) == eval_operation(num1, num2, symbol)
+
+    timings = {}
+    for name, function in [('eval', eval_operation), ('registry', perform_operation)]:
+        best = min(timeit.repeat(lambda: run_cases(function), number=args.number, repeat=5))
+        timings[name] = best / (args.number * len(CASES)) * 1e6
+        print(f'{name:>10}: {timings[name]:.3f} us/operation')
+    print(f'   speedup: {timings["eval"] / timings["registry"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Compares serializing a page of records from row tuples with the encoder in chalicelib.encoding
+against the model instances and Chalice's json.dumps it replaced.
+
+Usage:
+    python benchmarks/bench_serialization.py [--records N] [--page-sizes N ...] [--number N]
+"""
+import argparse
+import json
+import timeit
+
+from chalice.app import handle_extra_types
+
+from harness import BenchmarkEnvironment
+from chalicelib.encoding import dumps, orjson
+from chalicelib.queries import serialize_records, user_records_query
+
+
+def model_page(query):
+    """
+    The previous implementation, kept as the baseline.
+    The query is cloned so that each page is fetched, as peewee caches the rows of an executed query.
+    """
+    return json.dumps({'data': [record.to_dict() for record in query.clone()]}, separators=(',', ':'),
+                      default=handle_extra_types)
+
+
+def tuple_page(query):
+    return dumps({'data': serialize_records(query.tuples())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=2000, help='Records seeded for the benchmark user.')
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000], help='Records per page.')
+    parser.add_argument('--number', type=int, default=20, help='Pages serialized per timing.')
+    args = parser.parse_args()
+
+    environment = BenchmarkEnvironment(records=args.records)
+    try:
+        print(f'encoder: {"orjson" if orjson is not None else "json"}')
+        for page_size in args.page_sizes:
+            query = user_records_query(environment.user.cognito_user_id).limit(page_size)
+            assert model_page(query) == tuple_page(query)
+
+            timings = {}
+            for name, function in [('models', model_page), ('tuples', tuple_page)]:
+                best = min(timeit.repeat(lambda: function(query), number=args.number, repeat=5))
+                timings[name] = best / args.number * 1000
+            print(f'{page_size:>6} records: models {timings["models"]:.3f} ms, tuples {timings["tuples"]:.3f} ms, '
+                  f'speedup {timings["models"] / timings["tuples"]:.1f}x')
+    finally:
+        environment.close()
+
+
+if __name__ == '__main__':
+    main()
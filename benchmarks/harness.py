@@ -0,0 +1,195 @@
+"""
+Offline environment for the API benchmarks.
+
+Binds the models to a seeded SQLite database, signs access tokens with a locally
+generated RSA key that the authorizer trusts, and times requests sent through the
+Chalice LocalGateway, so the hot paths can be measured without Postgres or Cognito.
+"""
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault('USER_POOL_ID', 'us-east-2_benchmark')
+os.environ.setdefault('USER_POOL_REGION', 'us-east-2')
+os.environ.setdefault('COGNITO_CLIENT_ID', 'benchmark-client')
+for name in ('POSTGRES_HOST', 'POSTGRES_PORT', 'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_PASSWORD'):
+    os.environ.setdefault(name, 'benchmark')
+
+import jwt  # noqa: E402
+from chalice.config import Config  # noqa: E402
+from chalice.local import LocalGateway  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from peewee import SqliteDatabase  # noqa: E402
+
+from app import app  # noqa: E402
+from chalicelib import routes as routes_module  # noqa: E402
+from chalicelib.catalog import OperationCatalog  # noqa: E402
+from chalicelib.config import COGNITO_CLIENT_ID, COGNITO_ISSUER  # noqa: E402
+from chalicelib.database import ReplicaRoutingMixin  # noqa: E402
+from chalicelib.models import (IdempotencyKey, Operation, RateLimitBucket, RecentWrite, Record,  # noqa: E402
+                               RecordArchive, UsageSummary, User)
+
+MODELS = [User, Operation, Record, RecordArchive, UsageSummary, IdempotencyKey, RateLimitBucket, RecentWrite]
+OPERATIONS = [
+    ('addition', 10, '+'),
+    ('subtraction', 10, '-'),
+    ('multiplication', 20, '*'),
+    ('division', 20, '/'),
+    ('square_root', 30, '√'),
+    ('random_string', 40, 'random'),
+]
+KEY_ID = 'benchmark-key'
+
+
+class BenchmarkDatabase(ReplicaRoutingMixin, SqliteDatabase):
+    """
+    SQLite database with the routing interface of the application database, without replicas.
+    """
+
+
+class QueryCounter(logging.Handler):
+    """
+    Counts the statements peewee logs while it is attached to the 'peewee' logger.
+    """
+
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+    def __enter__(self):
+        self._logger = logging.getLogger('peewee')
+        self._level = self._logger.level
+        self._logger.setLevel(logging.DEBUG)
+        self._logger.addHandler(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._logger.removeHandler(self)
+        self._logger.setLevel(self._level)
+
+
+class BenchmarkEnvironment:
+    """
+    Seeded database, trusted signing key and gateway shared by the benchmark scenarios.
+    """
+
+    def __init__(self, records=1000, balance=10 ** 9):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = BenchmarkDatabase(os.path.join(self.directory.name, 'benchmark.db'),
+                                         pragmas={'journal_mode': 'wal'})
+        self.database.bind(MODELS)
+        routes_module.db = self.database
+        self.database.create_tables(MODELS)
+        self._seed(records, balance)
+        OperationCatalog.get_instance().invalidate()
+
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public_jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwks = {'keys': [{**public_jwk, 'kid': KEY_ID, 'alg': 'RS256', 'use': 'sig'}]}
+        self.authorizer = routes_module.auth_singleton
+        self.authorizer.clear_cache()
+        self.authorizer._fetch_jwks = lambda: jwks
+        # The buckets stay in the database but never run out, so the scenarios measure the
+        # cost of rate limiting without being limited.
+        routes_module.rate_limiter.limits = {route: (10 ** 9, 10 ** 9) for route in routes_module.rate_limiter.limits}
+
+        self.token = self.sign_token(self.user.cognito_user_id)
+        self.gateway = LocalGateway(app, config=Config())
+
+    def _seed(self, records, balance):
+        """
+        Creates the operations, the benchmark user and its record history.
+        """
+        with self.database.atomic():
+            operations = [
+                Operation.create(type=type_, cost=cost, symbol=symbol, is_arithmetic=symbol != 'random')
+                for type_, cost, symbol in OPERATIONS
+            ]
+            self.operations = {operation.symbol: operation for operation in operations}
+            self.user = User.create(username='benchmark@example.com', status=True, balance=balance,
+                                    cognito_user_id='benchmark-user')
+            start = datetime(2023, 1, 1)
+            rows = [
+                {
+                    'operation': operations[index % len(operations)].id,
+                    'user_id': self.user.id,
+                    'amount': operations[index % len(operations)].cost,
+                    'user_balance': balance,
+                    'operation_response': str(index),
+                    'date': start + timedelta(seconds=index),
+                    'active': True,
+                }
+                for index in range(records)
+            ]
+            for offset in range(0, len(rows), 500):
+                Record.insert_many(rows[offset:offset + 500]).execute()
+            UsageSummary.rebuild()
+
+    def sign_token(self, username, expires_in=3600):
+        """
+        Returns an access token for the given user, signed with the benchmark key.
+        """
+        claims = {
+            'sub': username,
+            'username': username,
+            'iss': COGNITO_ISSUER,
+            'token_use': 'access',
+            'client_id': COGNITO_CLIENT_ID,
+            'exp': int(time.time()) + expires_in,
+        }
+        return jwt.encode(claims, self.private_key, algorithm='RS256', headers={'kid': KEY_ID})
+
+    def request(self, method, path, body=None, headers=None):
+        """
+        Sends a request through the local gateway as the benchmark user.
+        Returns the gateway response.
+        """
+        request_headers = {'Content-Type': 'application/json', 'Authorization': self.token, **(headers or {})}
+        return self.gateway.handle_request(method=method, path=path, headers=request_headers,
+                                           body=json.dumps(body) if body is not None else '')
+
+    def close(self):
+        self.database.close()
+        self.directory.cleanup()
+
+
+def measure(scenario, iterations, warmup=10):
+    """
+    Runs a scenario, a callable sending one request, 'warmup' times while counting its
+    statements and then 'iterations' times while timing it.
+    Returns the latency percentiles, throughput and statements per request.
+    """
+    with QueryCounter() as counter:
+        for _ in range(warmup):
+            scenario()
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        request_started = time.perf_counter()
+        scenario()
+        latencies.append((time.perf_counter() - request_started) * 1000)
+    elapsed = time.perf_counter() - started
+
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'iterations': iterations,
+        'mean_ms': round(statistics.fmean(latencies), 4),
+        'p50_ms': round(percentiles[49], 4),
+        'p90_ms': round(percentiles[89], 4),
+        'p99_ms': round(percentiles[98], 4),
+        'max_ms': round(max(latencies), 4),
+        'throughput_rps': round(iterations / elapsed, 2),
+        'queries_per_request': counter.count / warmup if warmup else None,
+    }
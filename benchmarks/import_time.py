@@ -0,0 +1,91 @@
+"""
+Reports the time it takes to import the application, as a Lambda container pays it at init.
+
+Runs 'import app' in fresh interpreters with '-X importtime', prints the slowest modules by
+cumulative import time and fails if the median import time exceeds the budget or if a module
+that should only be imported on demand was imported.
+
+Usage:
+    python benchmarks/import_time.py [--runs N] [--top N] [--budget-ms MS] [--forbid MODULE ...]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENVIRONMENT = {
+    'USER_POOL_ID': 'us-east-2_benchmark',
+    'USER_POOL_REGION': 'us-east-2',
+    'COGNITO_CLIENT_ID': 'benchmark-client',
+    'POSTGRES_HOST': 'benchmark',
+    'POSTGRES_PORT': '5432',
+    'POSTGRES_DB': 'benchmark',
+    'POSTGRES_USER': 'benchmark',
+    'POSTGRES_PASSWORD': 'benchmark',
+}
+# Only needed by some routes, so importing them at init slows down every cold start.
+DEFERRED_MODULES = ['boto3', 'botocore', 'requests', 'numpy', 'jwt', 'cryptography']
+SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(elapsed)
+print(' '.join(sorted(name for name in sys.modules if '.' not in name)))
+"""
+
+
+def import_app():
+    """
+    Imports the application in a fresh interpreter.
+    Returns the import time in milliseconds, the top-level modules loaded and the
+    '-X importtime' lines as (self microseconds, cumulative microseconds, module) tuples.
+    """
+    environment = {**ENVIRONMENT, **os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', SCRIPT], cwd=ROOT, env=environment,
+                            capture_output=True, text=True, check=True)
+    elapsed, modules = result.stdout.strip().splitlines()[-2:]
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        timings.append((int(self_us), int(cumulative_us), module.rstrip()))
+    return float(elapsed) * 1000, set(modules.split()), timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to import the application in.')
+    parser.add_argument('--top', type=int, default=15, help='Slowest modules to show.')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('IMPORT_TIME_BUDGET_MS', 250)),
+                        help='Maximum median import time.')
+    parser.add_argument('--forbid', action='append', help='Module that must not be imported at init. '
+                                                         'Defaults to the modules only some routes need.')
+    args = parser.parse_args()
+
+    runs = [import_app() for _ in range(args.runs)]
+    elapsed = statistics.median(run[0] for run in runs)
+    modules = runs[0][1]
+    timings = runs[-1][2]
+
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for self_us, cumulative_us, module in sorted(timings, key=lambda timing: -timing[1])[:args.top]:
+        print(f'{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {module}')
+    print(f'\nimport app: median {elapsed:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)')
+
+    failures = []
+    if elapsed > args.budget_ms:
+        failures.append(f'import time {elapsed:.1f} ms exceeds the budget of {args.budget_ms:.0f} ms')
+    imported = sorted(set(args.forbid or DEFERRED_MODULES) & modules)
+    if imported:
+        failures.append(f"modules imported at init: {', '.join(imported)}")
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,14 @@
-import os
+import hashlib
+import threading
 import time
-from cognitojwt import decode
-from chalicelib.config import (COGNITO_CLIENT_ID, USER_POOL_ID, USER_POOL_REGION, 
-                                LIVE_ARN_RESOURCES, LOCAL_ARN_RESOURCES)
+from collections import OrderedDict
+from chalicelib.config import (COGNITO_CLIENT_ID, COGNITO_ISSUER, COGNITO_JWKS_URL, JWKS_REFRESH_INTERVAL,
+                               AUTH_TOKEN_CACHE_SIZE, LIVE_ARN_RESOURCES, LOCAL_ARN_RESOURCES)
+
+CLIENT_ID_CLAIMS = {
+    'access': 'client_id',
+    'id': 'aud'
+}
 
 
 class CognitoAuthSingleton:
@@ -23,10 +29,28 @@ class CognitoAuthSingleton:
     def __init__(self):
         """
         Initialize the CognitoAuthSingleton class.
+        The user pool public keys and the policies of already verified tokens are kept
+        for the lifetime of the container, so repeated calls skip the signature check.
+        PyJWT and requests are only imported to verify the first token, so functions that
+        never verify one don't load them at init.
         """
         if CognitoAuthSingleton._instance:
             raise Exception("This class is a singleton!")
         CognitoAuthSingleton._instance = self
+        self._lock = threading.Lock()
+        self._public_keys = {}
+        self._jwks_fetched_at = None
+        self._verified_tokens = OrderedDict()
+        self._policy_template = {
+            'Version': '2012-10-17',
+            'Statement': [
+                {
+                    'Action': 'execute-api:Invoke',
+                    'Effect': 'Allow',
+                    'Resource': LIVE_ARN_RESOURCES + LOCAL_ARN_RESOURCES
+                }
+            ]
+        }
 
     def authenticate_request(self, auth_request):
         """
@@ -43,19 +67,127 @@ class CognitoAuthSingleton:
         """
         token = auth_request.token.replace('Bearer ', '')
         try:
-            decoded_token = self._decode_token(token)
-            self._validate_token(decoded_token)
+            policy_document = self._get_cached_policy(token)
+            if policy_document is None:
+                decoded_token = self._decode_token(token)
+                self._validate_token(decoded_token)
 
-            principal_id = decoded_token['sub']
-            policy_document = self._generate_policy_document(principal_id, decoded_token)
-            return policy_document
+                principal_id = decoded_token['sub']
+                policy_document = self._generate_policy_document(principal_id, decoded_token)
+                self._cache_policy(token, decoded_token['exp'], policy_document)
+
+            # The caller may add entries to the context, so the cached one is not shared.
+            return {**policy_document, 'context': dict(policy_document['context'])}
 
         except Exception as e:
             return {"message": str(e)}
 
+    def clear_cache(self):
+        """
+        Forget the cached public keys and verified tokens.
+        """
+        with self._lock:
+            self._public_keys = {}
+            self._jwks_fetched_at = None
+            self._verified_tokens.clear()
+
+    def _token_key(self, token):
+        """
+        Get the key of a token in the verified tokens cache.
+
+        Args:
+            token (str): The token.
+
+        Returns:
+            str: The SHA-256 digest of the token.
+        """
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _get_cached_policy(self, token):
+        """
+        Get the policy document generated for an already verified token.
+
+        Args:
+            token (str): The token.
+
+        Returns:
+            dict: The policy document, or None if the token was not verified before or has expired since.
+        """
+        key = self._token_key(token)
+        with self._lock:
+            cached = self._verified_tokens.get(key)
+            if cached is None:
+                return None
+            expires_at, policy_document = cached
+            if expires_at < time.time():
+                del self._verified_tokens[key]
+                return None
+            self._verified_tokens.move_to_end(key)
+            return policy_document
+
+    def _cache_policy(self, token, expires_at, policy_document):
+        """
+        Store the policy document of a verified token until the token expires.
+        The least recently used entry is evicted once the cache is full.
+
+        Args:
+            token (str): The token.
+            expires_at (int): The expiration time of the token.
+            policy_document (dict): The policy document.
+        """
+        with self._lock:
+            self._verified_tokens[self._token_key(token)] = (expires_at, policy_document)
+            while len(self._verified_tokens) > AUTH_TOKEN_CACHE_SIZE:
+                self._verified_tokens.popitem(last=False)
+
+    def _fetch_jwks(self):
+        """
+        Fetch the JSON Web Key Set of the user pool.
+
+        Returns:
+            dict: The key set.
+        """
+        import requests
+
+        response = requests.get(COGNITO_JWKS_URL, timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    def _get_public_key(self, kid):
+        """
+        Get the public key with the given key id.
+        The key set is fetched on first use and fetched again when a token is signed with an
+        unknown key, at most once per refresh interval, which picks up rotated keys without
+        letting invalid tokens trigger a request each.
+
+        Args:
+            kid (str): The key id.
+
+        Returns:
+            RSAPublicKey: The public key.
+
+        Raises:
+            Exception: If the key is not in the key set.
+        """
+        with self._lock:
+            public_key = self._public_keys.get(kid)
+            can_refresh = (self._jwks_fetched_at is None or
+                           time.monotonic() - self._jwks_fetched_at > JWKS_REFRESH_INTERVAL)
+            if public_key is None and can_refresh:
+                import jwt
+
+                jwks = self._fetch_jwks()
+                self._public_keys = {key['kid']: jwt.PyJWK(key).key for key in jwks['keys']}
+                self._jwks_fetched_at = time.monotonic()
+                public_key = self._public_keys.get(kid)
+
+        if public_key is None:
+            raise Exception('Public key not found in jwks.json')
+        return public_key
+
     def _decode_token(self, token):
         """
-        Decode the provided token.
+        Decode the provided token and verify its signature.
 
         Args:
             token (str): The token to decode.
@@ -63,11 +195,15 @@ class CognitoAuthSingleton:
         Returns:
             dict: The decoded token.
         """
-        return decode(
-            token=token,
-            region=USER_POOL_REGION,
-            userpool_id=USER_POOL_ID,
-            app_client_id=COGNITO_CLIENT_ID
+        import jwt
+
+        headers = jwt.get_unverified_header(token)
+        public_key = self._get_public_key(headers.get('kid'))
+        return jwt.decode(
+            token,
+            public_key,
+            algorithms=['RS256'],
+            options={'verify_exp': False, 'verify_aud': False}
         )
 
     def _validate_token(self, decoded_token):
@@ -78,15 +214,19 @@ class CognitoAuthSingleton:
             decoded_token (dict): The decoded token.
 
         Raises:
-            Exception: If the token is expired or the issuer is invalid.
+            Exception: If the token is expired, the issuer is invalid or it was issued for another client.
         """
         if decoded_token['exp'] < time.time():
             raise Exception('Token has expired')
 
-        expected_issuer = f'https://cognito-idp.{USER_POOL_REGION}.amazonaws.com/{USER_POOL_ID}'
-        if decoded_token['iss'] != expected_issuer:
+        if decoded_token['iss'] != COGNITO_ISSUER:
             raise Exception('Token issuer is invalid')
 
+        if COGNITO_CLIENT_ID:
+            client_id_claim = CLIENT_ID_CLAIMS.get(decoded_token.get('token_use'))
+            if client_id_claim is None or decoded_token.get(client_id_claim) != COGNITO_CLIENT_ID:
+                raise Exception('Token was not issued for this client id audience')
+
     def _generate_policy_document(self, principal_id, decoded_token):
         """
         Generate the policy document.
@@ -98,19 +238,9 @@ class CognitoAuthSingleton:
         Returns:
             dict: The policy document.
         """
-        resource_list = LIVE_ARN_RESOURCES + LOCAL_ARN_RESOURCES
         policy_document = {
             'principalId': principal_id,
             'context': decoded_token,
-            'policyDocument': {
-                'Version': '2012-10-17',
-                'Statement': [
-                    {
-                        'Action': 'execute-api:Invoke',
-                        'Effect': 'Allow',
-                        'Resource': resource_list
-                    }
-                ]
-            }
+            'policyDocument': self._policy_template
         }
         return policy_document
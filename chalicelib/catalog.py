@@ -0,0 +1,157 @@
+import hashlib
+import json
+import threading
+import time
+from playhouse.shortcuts import model_to_dict
+from chalicelib.config import OPERATIONS_CACHE_TTL, OPERATIONS_RELOAD_INTERVAL
+from chalicelib.encoding import dumps
+from chalicelib.models import Operation
+
+
+class OperationCatalog:
+    """
+    In-memory catalog of the operations table.
+    Operations are reference data that rarely change, so they are loaded once and served
+    from memory until the TTL expires or the catalog is invalidated.
+    """
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        """
+        Get the singleton instance of OperationCatalog class.
+
+        Returns:
+            OperationCatalog: The singleton instance.
+        """
+        if not OperationCatalog._instance:
+            OperationCatalog._instance = OperationCatalog()
+        return OperationCatalog._instance
+
+    def __init__(self, ttl=OPERATIONS_CACHE_TTL, reload_interval=OPERATIONS_RELOAD_INTERVAL):
+        """
+        Initialize the OperationCatalog class.
+
+        Args:
+            ttl (int): Number of seconds the loaded operations are served before reloading them.
+            reload_interval (int): Minimum number of seconds between the reloads caused by unknown ids.
+        """
+        if OperationCatalog._instance:
+            raise Exception("This class is a singleton!")
+        OperationCatalog._instance = self
+        self.ttl = ttl
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._operations = {}
+        self._serialized = []
+        self._encoded = None
+        self._etag = None
+
+    def invalidate(self):
+        """
+        Discard the loaded operations so the next access reloads them from the database.
+        """
+        with self._lock:
+            self._loaded_at = None
+
+    def get(self, operation_id):
+        """
+        Get an operation by its id.
+        An unknown id reloads the operations, at most once per reload interval, so operations
+        added since the last load are found without letting invalid ids trigger a query each.
+
+        Args:
+            operation_id (int | str): The operation id.
+
+        Returns:
+            Operation: The operation.
+
+        Raises:
+            Operation.DoesNotExist: If there is no operation with the given id.
+        """
+        try:
+            operation_id = int(operation_id)
+        except (TypeError, ValueError):
+            raise Operation.DoesNotExist(f'Operation {operation_id} does not exist')
+        operations = self._load()[0]
+        if operation_id not in operations:
+            operations = self._load(reload_after=self.reload_interval)[0]
+        try:
+            return operations[operation_id]
+        except KeyError:
+            raise Operation.DoesNotExist(f'Operation {operation_id} does not exist')
+
+    def matching_ids(self, operation_types=(), operation_ids=None):
+        """
+        Resolve operation filters to the ids of the matching operations, so records can be
+        filtered by an indexed 'operation_id IN (...)' instead of matching the operation type
+        in SQL.
+
+        Args:
+            operation_types (list): Matches the operations whose type contains any of them, ignoring case.
+            operation_ids (set): Matches the operations with any of these ids.
+
+        Returns:
+            set: The ids of the operations matching both filters, or None if neither is given.
+        """
+        if not operation_types:
+            return None if operation_ids is None else set(operation_ids)
+        operations = self._load()[0]
+        candidates = operations.keys() if operation_ids is None else set(operation_ids) & operations.keys()
+        operation_types = [operation_type.lower() for operation_type in operation_types]
+        return {
+            operation_id for operation_id in candidates
+            if any(operation_type in operations[operation_id].type.lower() for operation_type in operation_types)
+        }
+
+    def serialized(self):
+        """
+        Get the dictionary representation of every operation, ordered by id.
+
+        Returns:
+            list: The serialized operations.
+        """
+        return self._load()[1]
+
+    def encoded(self):
+        """
+        Get the JSON body listing every operation, encoded once per load.
+
+        Returns:
+            str: The JSON encoded {'data': serialized operations} body.
+        """
+        return self._load()[3]
+
+    def etag(self):
+        """
+        Get the entity tag of the serialized operations.
+        The tag only depends on the content of the catalog, so every container serving the
+        same operations returns the same tag.
+
+        Returns:
+            str: The quoted entity tag.
+        """
+        return self._load()[2]
+
+    def _load(self, reload_after=None):
+        """
+        Load the operations from the database if they were never loaded or have expired.
+
+        Args:
+            reload_after (int): Also reload the operations if they were loaded more than this many seconds ago.
+
+        Returns:
+            tuple: The operations by id, the serialized operations, the entity tag and the encoded body.
+        """
+        with self._lock:
+            max_age = self.ttl if reload_after is None else min(self.ttl, reload_after)
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > max_age:
+                operations = list(Operation.select().order_by(Operation.id))
+                self._operations = {operation.id: operation for operation in operations}
+                self._serialized = [model_to_dict(operation) for operation in operations]
+                content = json.dumps(self._serialized, sort_keys=True, default=str)
+                self._etag = '"' + hashlib.sha256(content.encode()).hexdigest() + '"'
+                self._encoded = dumps({'data': self._serialized})
+                self._loaded_at = time.monotonic()
+            return self._operations, self._serialized, self._etag, self._encoded
@@ -0,0 +1,82 @@
+import threading
+from chalicelib.config import (USER_POOL_REGION, COGNITO_MAX_POOL_CONNECTIONS, COGNITO_CONNECT_TIMEOUT,
+                               COGNITO_READ_TIMEOUT, COGNITO_MAX_ATTEMPTS)
+
+
+class CognitoClientProvider:
+    """
+    Provider of the Cognito Identity Provider client used by the auth routes.
+    Building a client loads the service model, resolves the endpoint and creates a connection
+    pool, so a single client is created per container and reused, keeping its connections alive
+    between requests. Tests can inject a client of their own, such as one backed by moto.
+    boto3 is only imported when the client is created, so routes that don't use Cognito,
+    such as the authorizer, don't pay for importing it.
+    """
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        """
+        Get the singleton instance of CognitoClientProvider class.
+
+        Returns:
+            CognitoClientProvider: The singleton instance.
+        """
+        if not CognitoClientProvider._instance:
+            CognitoClientProvider._instance = CognitoClientProvider()
+        return CognitoClientProvider._instance
+
+    def __init__(self, region_name=USER_POOL_REGION):
+        """
+        Initialize the CognitoClientProvider class.
+
+        Args:
+            region_name (str): The region of the user pool.
+        """
+        if CognitoClientProvider._instance:
+            raise Exception("This class is a singleton!")
+        CognitoClientProvider._instance = self
+        self.region_name = region_name
+        self.config_options = {
+            'max_pool_connections': COGNITO_MAX_POOL_CONNECTIONS,
+            'connect_timeout': COGNITO_CONNECT_TIMEOUT,
+            'read_timeout': COGNITO_READ_TIMEOUT,
+            'retries': {'mode': 'adaptive', 'max_attempts': COGNITO_MAX_ATTEMPTS},
+            'tcp_keepalive': True,
+        }
+        self._lock = threading.Lock()
+        self._client = None
+
+    def get_client(self):
+        """
+        Get the Cognito client, creating it on first use.
+
+        Returns:
+            botocore.client.CognitoIdentityProvider: The shared client.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+
+                    self._client = boto3.client('cognito-idp', region_name=self.region_name,
+                                                config=Config(**self.config_options))
+        return self._client
+
+    def warm(self):
+        """
+        Create the client ahead of the first request that needs it, such as during the
+        initialization of the container.
+        """
+        self.get_client()
+
+    def set_client(self, client):
+        """
+        Replace the shared client, or discard it with None so the next use creates a new one.
+
+        Args:
+            client (botocore.client.CognitoIdentityProvider | None): The client to use.
+        """
+        with self._lock:
+            self._client = client
@@ -5,13 +5,58 @@ import os
 USER_POOL_REGION = os.environ.get('USER_POOL_REGION')
 COGNITO_CLIENT_ID = os.environ.get('COGNITO_CLIENT_ID')
 USER_POOL_ID = os.environ['USER_POOL_ID']
+COGNITO_ISSUER = f'https://cognito-idp.{USER_POOL_REGION}.amazonaws.com/{USER_POOL_ID}'
+COGNITO_JWKS_URL = f'{COGNITO_ISSUER}/.well-known/jwks.json'
+JWKS_REFRESH_INTERVAL = int(os.environ.get('JWKS_REFRESH_INTERVAL', 10))
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 1024))
+COGNITO_MAX_POOL_CONNECTIONS = int(os.environ.get('COGNITO_MAX_POOL_CONNECTIONS', 10))
+COGNITO_CONNECT_TIMEOUT = float(os.environ.get('COGNITO_CONNECT_TIMEOUT', 2))
+COGNITO_READ_TIMEOUT = float(os.environ.get('COGNITO_READ_TIMEOUT', 5))
+COGNITO_MAX_ATTEMPTS = int(os.environ.get('COGNITO_MAX_ATTEMPTS', 3))
+COGNITO_CLIENT_PREWARM = os.environ.get('COGNITO_CLIENT_PREWARM', 'false').lower() == 'true'
 RAMDON_ORG_URL = 'https://www.random.org/strings/'
+RANDOM_STRING_PROVIDER = os.environ.get('RANDOM_STRING_PROVIDER', 'local')
+RANDOM_ORG_TIMEOUT = float(os.environ.get('RANDOM_ORG_TIMEOUT', 2))
+RANDOM_ORG_POOL_SIZE = int(os.environ.get('RANDOM_ORG_POOL_SIZE', 4))
+RANDOM_ORG_MAX_RETRIES = int(os.environ.get('RANDOM_ORG_MAX_RETRIES', 1))
+RANDOM_ORG_BATCH_SIZE = int(os.environ.get('RANDOM_ORG_BATCH_SIZE', 1000))
+RANDOM_ORG_LOW_WATER = int(os.environ.get('RANDOM_ORG_LOW_WATER', 200))
+RANDOM_STRING_MAX_NUM = int(os.environ.get('RANDOM_STRING_MAX_NUM', 100))
+RANDOM_STRING_MAX_LENGTH = int(os.environ.get('RANDOM_STRING_MAX_LENGTH', 20))
+OPERATIONS_CACHE_TTL = int(os.environ.get('OPERATIONS_CACHE_TTL', 300))
+OPERATIONS_RELOAD_INTERVAL = int(os.environ.get('OPERATIONS_RELOAD_INTERVAL', 10))
+RECORDS_BATCH_MAX_SIZE = int(os.environ.get('RECORDS_BATCH_MAX_SIZE', 50))
+RECORDS_BULK_DELETE_MAX_IDS = int(os.environ.get('RECORDS_BULK_DELETE_MAX_IDS', 1000))
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', 4 * 1024 * 1024))
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+PERF_SAMPLE_RATE = float(os.environ.get('PERF_SAMPLE_RATE', 0.0))
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_PENDING_TIMEOUT = int(os.environ.get('IDEMPOTENCY_PENDING_TIMEOUT', 30))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', 5))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 1024))
+IDEMPOTENCY_CACHE_TTL = int(os.environ.get('IDEMPOTENCY_CACHE_TTL', 300))
+RECORDS_PARTITIONS_AHEAD = int(os.environ.get('RECORDS_PARTITIONS_AHEAD', 3))
+RECORDS_PARTITION_COPY_BATCH_SIZE = int(os.environ.get('RECORDS_PARTITION_COPY_BATCH_SIZE', 10000))
+RECORDS_RETENTION_DAYS = int(os.environ.get('RECORDS_RETENTION_DAYS', 0))
+RECORDS_ARCHIVE_BATCH_SIZE = int(os.environ.get('RECORDS_ARCHIVE_BATCH_SIZE', 1000))
+RECORDS_ARCHIVE_MAX_BATCHES = int(os.environ.get('RECORDS_ARCHIVE_MAX_BATCHES', 100))
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'sql')
+# Token bucket of each rate limited route as '<capacity>/<tokens refilled per second>', or empty to disable it.
+RATE_LIMITS = {
+    'POST /v1/records': os.environ.get('RATE_LIMIT_CREATE_RECORD', '20/5'),
+    'POST /v1/records/batch': os.environ.get('RATE_LIMIT_CREATE_RECORDS_BATCH', '5/1'),
+    'GET /v1/random-string': os.environ.get('RATE_LIMIT_RANDOM_STRING', '10/1'),
+}
 
 LIVE_ARN_RESOURCES = [
     'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/GET/v1/operations',
     'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/POST/v1/records',
+    'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/POST/v1/records/batch',
+    'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/POST/v1/records/bulk-delete',
     'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/GET/v1/records',
+    'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/GET/v1/records/export',
     'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/DELETE/v1/records/*',
+    'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/GET/v1/stats',
     'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/POST/v1/signout',
     'arn:aws:execute-api:us-east-2:583847475803:ky23idqdol/*/GET/v1/random-string'
 ]
@@ -19,8 +64,12 @@ LIVE_ARN_RESOURCES = [
 LOCAL_ARN_RESOURCES = [
     'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/GET/v1/operations',
     'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/POST/v1/records',
+    'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/POST/v1/records/batch',
+    'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/POST/v1/records/bulk-delete',
     'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/GET/v1/records',
+    'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/GET/v1/records/export',
     'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/DELETE/v1/records/*',
+    'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/GET/v1/stats',
     'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/POST/v1/signout',
     'arn:aws:execute-api:mars-west-1:123456789012:ymy8tbxw7b/*/GET/v1/random-string'
 ]
\ No newline at end of file
@@ -1,5 +1,217 @@
+import contextvars
+import logging
 import os
-from peewee import PostgresqlDatabase
+import threading
+import time
+from contextlib import contextmanager
+from peewee import DatabaseError, InterfaceError, OperationalError
+from playhouse.pool import PooledPostgresqlDatabase
+from chalicelib.instrumentation import QueryInstrumentationMixin
+
+logger = logging.getLogger(__name__)
+
+_read_intent = contextvars.ContextVar('read_intent', default=False)
+
+
+class HealthCheckMixin:
+    """
+    Adds health checks to a pooled database.
+    A connection that has been idle in the pool for longer than the health check interval
+    is pinged before being handed out again, so connections dropped by the server or by
+    the network while the container was frozen are discarded instead of failing a query.
+    """
+
+    def __init__(self, *args, health_check_interval=30, **kwargs):
+        self._health_check_interval = health_check_interval
+        self._checked_in_at = {}
+        super().__init__(*args, **kwargs)
+
+    def _ping(self, conn):
+        """
+        Runs a trivial statement on the raw connection.
+        Raises the driver error if the connection is no longer usable.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+        conn.rollback()
+
+    def _is_closed(self, conn):
+        """
+        Called by the pool when checking out a connection.
+        Returns True if the connection is closed or fails its health check.
+        """
+        if super()._is_closed(conn):
+            return True
+        checked_in_at = self._checked_in_at.pop(self.conn_key(conn), None)
+        if checked_in_at is None or time.time() - checked_in_at < self._health_check_interval:
+            return False
+        try:
+            self._ping(conn)
+        except Exception:
+            self._close_raw(conn)
+            return True
+        return False
+
+    def _close(self, conn, close_conn=False):
+        """
+        Called by the pool when checking in a connection.
+        Remembers when the connection became idle, if the pool kept it rather than closing it
+        for being stale or not reusable.
+        """
+        checked_in = not close_conn and self.conn_key(conn) in self._in_use
+        super()._close(conn, close_conn=close_conn)
+        if checked_in and any(pooled is conn for _, _, pooled in self._connections):
+            self._checked_in_at[self.conn_key(conn)] = time.time()
+
+    def _close_raw(self, conn):
+        """
+        Called by the pool when closing a connection.
+        Forgets when the connection became idle, so a new connection with the same key doesn't
+        inherit the time.
+        """
+        self._checked_in_at.pop(self.conn_key(conn), None)
+        super()._close_raw(conn)
+
+
+class ReplicaRoutingMixin:
+    """
+    Routes the reads of a database to its read replicas.
+    SELECT statements run in a read_only block outside of a transaction go to the next healthy
+    replica, and every other statement goes to the database itself, the primary. A replica that
+    fails with a connection error is skipped for the retry interval and the statement runs on
+    the primary instead.
+    Reads by a key, such as a username, that wrote within the read-your-writes window stay on the
+    primary, so users see their own writes despite the replication lag. Writes are remembered in
+    memory and, if 'write_markers' is given, in a table of the primary, so the next request of a
+    user sees its writes whichever container serves it. 'write_markers' is a model with 'mark'
+    and 'expiry' class methods, such as RecentWrite.
+    """
+
+    def __init__(self, *args, replicas=(), read_your_writes_window=5, replica_retry_interval=30, write_markers=None,
+                 **kwargs):
+        self.replicas = list(replicas)
+        self.write_markers = write_markers
+        self._read_your_writes_window = read_your_writes_window
+        self._replica_retry_interval = replica_retry_interval
+        self._replica_lock = threading.Lock()
+        self._recent_writes = {}
+        self._unhealthy_until = {}
+        self._next_replica = 0
+        super().__init__(*args, **kwargs)
+
+    @contextmanager
+    def read_only(self, key=None):
+        """
+        Runs the block with read intent, so its SELECT statements can be served by a replica,
+        unless the given key wrote within the read-your-writes window.
+        """
+        token = _read_intent.set(bool(self.replicas) and not self.wrote_recently(key))
+        try:
+            yield
+        finally:
+            _read_intent.reset(token)
+
+    def record_write(self, key):
+        """
+        Remembers that the given key wrote, so its reads stay on the primary for the
+        read-your-writes window, on this container and, through the write markers, on the others.
+        """
+        if not self.replicas or key is None:
+            return
+        now = time.monotonic()
+        with self._replica_lock:
+            self._recent_writes = {
+                written_key: written_at for written_key, written_at in self._recent_writes.items()
+                if now - written_at < self._read_your_writes_window
+            }
+            self._recent_writes[key] = now
+        if self.write_markers is not None:
+            try:
+                self.write_markers.mark(key, time.time() + self._read_your_writes_window)
+            except DatabaseError as e:
+                logger.warning('Failed to mark the write of %s: %s', key, e)
+
+    def wrote_recently(self, key):
+        """
+        Returns True if the given key wrote within the read-your-writes window, as remembered by
+        this container or, failing that, by the write markers, which are read from the primary.
+        If the write markers can't be read, the key is assumed to have written.
+        """
+        with self._replica_lock:
+            written_at = self._recent_writes.get(key)
+        if written_at is not None and time.monotonic() - written_at < self._read_your_writes_window:
+            return True
+        if self.write_markers is None or key is None:
+            return False
+        token = _read_intent.set(False)
+        try:
+            expires_at = self.write_markers.expiry(key)
+        except DatabaseError as e:
+            logger.warning('Failed to read the write marker of %s, reading from the primary: %s', key, e)
+            return True
+        finally:
+            _read_intent.reset(token)
+        return expires_at is not None and expires_at > time.time()
+
+    def _next_healthy_replica(self):
+        """
+        Returns the next replica in turn that is not being skipped after a failure, or None.
+        """
+        now = time.monotonic()
+        with self._replica_lock:
+            for _ in range(len(self.replicas)):
+                index = self._next_replica % len(self.replicas)
+                self._next_replica = index + 1
+                if self._unhealthy_until.get(index, 0) <= now:
+                    return self.replicas[index]
+        return None
+
+    def _mark_unhealthy(self, replica):
+        """
+        Skips the given replica for the retry interval and discards its connection.
+        """
+        with self._replica_lock:
+            self._unhealthy_until[self.replicas.index(replica)] = time.monotonic() + self._replica_retry_interval
+        try:
+            if not replica.is_closed():
+                replica.close()
+        except Exception:
+            pass
+
+    def execute_sql(self, sql, *args, **kwargs):
+        if _read_intent.get() and not self.in_transaction() and sql.lstrip()[:6].upper() == 'SELECT':
+            replica = self._next_healthy_replica()
+            if replica is not None:
+                try:
+                    return replica.execute_sql(sql, *args, **kwargs)
+                except (OperationalError, InterfaceError) as e:
+                    logger.warning('Read replica failed, reading from the primary: %s', e)
+                    self._mark_unhealthy(replica)
+        return super().execute_sql(sql, *args, **kwargs)
+
+    def close_replicas(self):
+        """
+        Returns the connections of the replicas to their pools.
+        """
+        for replica in self.replicas:
+            if not replica.is_closed():
+                replica.close()
+
+
+class HealthCheckedPooledPostgresqlDatabase(QueryInstrumentationMixin, HealthCheckMixin, PooledPostgresqlDatabase):
+    """
+    Pooled PostgreSQL database whose idle connections are health checked before reuse,
+    and whose statements are counted in the metrics of sampled requests.
+    """
+
+
+class ReplicatedPooledPostgresqlDatabase(ReplicaRoutingMixin, HealthCheckedPooledPostgresqlDatabase):
+    """
+    Health checked pooled PostgreSQL primary database whose reads can be routed to read replicas.
+    """
 
 
 class DatabaseConnection:
@@ -10,24 +222,48 @@ class DatabaseConnection:
     def __init__(self):
         """
         Initializes the DatabaseConnection object.
-        Retrieves the PostgreSQL connection parameters from environment variables and establishes the database connection.
+        Retrieves the PostgreSQL connection parameters from environment variables and creates a pooled database,
+        along with a pooled database for each read replica host in POSTGRES_REPLICA_HOSTS, if any.
+        No connection is opened here: the pool connects lazily on the first query, and connections are
+        reused across requests served by the same container.
         """
         POSTGRES_HOST = os.environ['POSTGRES_HOST']
         POSTGRES_PORT = os.environ['POSTGRES_PORT']
         POSTGRES_DB = os.environ['POSTGRES_DB']
         POSTGRES_USER = os.environ['POSTGRES_USER']
         POSTGRES_PASSWORD = os.environ['POSTGRES_PASSWORD']
-        self.database = PostgresqlDatabase(
+        POSTGRES_MAX_CONNECTIONS = int(os.environ.get('POSTGRES_MAX_CONNECTIONS', 4))
+        POSTGRES_STALE_TIMEOUT = int(os.environ.get('POSTGRES_STALE_TIMEOUT', 300))
+        POSTGRES_POOL_TIMEOUT = int(os.environ.get('POSTGRES_POOL_TIMEOUT', 10))
+        POSTGRES_HEALTH_CHECK_INTERVAL = int(os.environ.get('POSTGRES_HEALTH_CHECK_INTERVAL', 30))
+        POSTGRES_REPLICA_HOSTS = [host.strip() for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')
+                                  if host.strip()]
+        POSTGRES_READ_YOUR_WRITES_WINDOW = float(os.environ.get('POSTGRES_READ_YOUR_WRITES_WINDOW', 5))
+        POSTGRES_REPLICA_RETRY_INTERVAL = float(os.environ.get('POSTGRES_REPLICA_RETRY_INTERVAL', 30))
+        options = {
+            'user': POSTGRES_USER,
+            'password': POSTGRES_PASSWORD,
+            'port': POSTGRES_PORT,
+            'max_connections': POSTGRES_MAX_CONNECTIONS,
+            'stale_timeout': POSTGRES_STALE_TIMEOUT,
+            'timeout': POSTGRES_POOL_TIMEOUT,
+            'health_check_interval': POSTGRES_HEALTH_CHECK_INTERVAL,
+        }
+        replicas = [
+            HealthCheckedPooledPostgresqlDatabase(POSTGRES_DB, host=host, **options)
+            for host in POSTGRES_REPLICA_HOSTS
+        ]
+        self.database = ReplicatedPooledPostgresqlDatabase(
             POSTGRES_DB,
-            user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD,
             host=POSTGRES_HOST,
-            port=POSTGRES_PORT
+            replicas=replicas,
+            read_your_writes_window=POSTGRES_READ_YOUR_WRITES_WINDOW,
+            replica_retry_interval=POSTGRES_REPLICA_RETRY_INTERVAL,
+            **options
         )
-        self.database.connect()
 
     def get_connection(self):
         """
-        Returns the established database connection.
+        Returns the pooled database, which connects on first use.
         """
         return self.database
@@ -0,0 +1,71 @@
+import json
+import math
+import re
+from chalice import Response
+from chalice.app import handle_extra_types
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Characters json.dumps escapes by default (ensure_ascii) and orjson writes as they are.
+_UNESCAPED = re.compile('[\x7f-\U0010ffff]')
+
+
+class _Unsupported(Exception):
+    """
+    Raised while encoding with orjson when the value would not be encoded like json.dumps does.
+    """
+
+
+def _escape(match):
+    """
+    Escapes a character the way json.dumps does, with a surrogate pair outside the BMP.
+    """
+    code = ord(match.group())
+    if code > 0xFFFF:
+        code -= 0x10000
+        return '\\u{0:04x}\\u{1:04x}'.format(0xD800 | (code >> 10), 0xDC00 | (code & 0x3FF))
+    return '\\u{0:04x}'.format(code)
+
+
+def _default(obj):
+    """
+    Converts Decimal values to float, like Chalice does, for orjson.
+    Raises _Unsupported for floats that json.dumps writes differently from orjson: non-finite
+    ones and those it writes in exponent notation.
+    """
+    value = handle_extra_types(obj)
+    if isinstance(value, float) and not (value == 0 or (math.isfinite(value) and 1e-4 <= abs(value) < 1e16)):
+        raise _Unsupported()
+    return value
+
+
+def dumps(body):
+    """
+    Encodes a response body to the same JSON string Chalice writes for it, with orjson when
+    it is installed and json otherwise.
+    Bodies orjson can not encode exactly like json, such as those with integers larger than 64
+    bits, non-string keys or lone surrogates, are encoded with json. Native float values are
+    not checked, so bodies with floats written in exponent notation must not use this encoder.
+    Returns the JSON string.
+    """
+    if orjson is not None:
+        try:
+            encoded = orjson.dumps(body, default=_default)
+        except orjson.JSONEncodeError:
+            pass
+        else:
+            if encoded.isascii() and b'\x7f' not in encoded:
+                return encoded.decode()
+            return _UNESCAPED.sub(_escape, encoded.decode())
+    return json.dumps(body, separators=(',', ':'), default=handle_extra_types)
+
+
+def json_response(body, status_code=200, headers=None):
+    """
+    Builds a response whose body is encoded with dumps instead of by Chalice.
+    Returns the response.
+    """
+    return Response(body=dumps(body), headers=headers or {}, status_code=status_code)
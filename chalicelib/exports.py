@@ -0,0 +1,94 @@
+import csv
+import io
+from chalicelib.encoding import dumps
+from chalicelib.models import Operation, Record
+from chalicelib.queries import RECORD_ROW_COLUMNS, after_position, format_date, row_cursor
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+# Name, position in the rows of user_records_query and conversion of each exported column.
+EXPORT_ROW_COLUMNS = [
+    ('id', RECORD_ROW_COLUMNS[Record, 'id'], None),
+    ('date', RECORD_ROW_COLUMNS[Record, 'date'], format_date),
+    ('operation_id', RECORD_ROW_COLUMNS[Operation, 'id'], None),
+    ('operation_type', RECORD_ROW_COLUMNS[Operation, 'type'], None),
+    ('operation_symbol', RECORD_ROW_COLUMNS[Operation, 'symbol'], None),
+    ('amount', RECORD_ROW_COLUMNS[Record, 'amount'], str),
+    ('user_balance', RECORD_ROW_COLUMNS[Record, 'user_balance'], str),
+    ('operation_response', RECORD_ROW_COLUMNS[Record, 'operation_response'], None),
+]
+EXPORT_COLUMNS = [name for name, _, _ in EXPORT_ROW_COLUMNS]
+
+
+def export_row(row):
+    """
+    Flattens a row returned by a query built with user_records_query and fetched as tuples
+    into an export row.
+    Returns a dictionary with a value for each of the EXPORT_COLUMNS.
+    """
+    return {
+        name: row[index] if convert is None else convert(row[index])
+        for name, index, convert in EXPORT_ROW_COLUMNS
+    }
+
+
+def iterate_records(query, chunk_size):
+    """
+    Iterates over the records of a query built with user_records_query, fetching them as tuples
+    in chunks of 'chunk_size' rows. Each chunk starts after the last record of the previous one,
+    so fetching a chunk costs the same wherever it is, and rows are not cached by the query,
+    so memory use does not grow with the number of records.
+    Yields the rows.
+    """
+    date, record_id = RECORD_ROW_COLUMNS[Record, 'date'], RECORD_ROW_COLUMNS[Record, 'id']
+    chunk_query = query
+    while True:
+        fetched = 0
+        for row in chunk_query.limit(chunk_size).tuples().iterator():
+            fetched += 1
+            yield row
+        if fetched < chunk_size:
+            return
+        chunk_query = after_position(query, row[date], row[record_id])
+
+
+def _format_line(row, export_format):
+    """
+    Formats an export row, or the header row if 'row' is None, as a line of the given format.
+    Returns the line, or an empty string if the format has no header.
+    """
+    if export_format == 'ndjson':
+        return dumps(row) + '\n' if row is not None else ''
+    line = io.StringIO()
+    writer = csv.writer(line, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS if row is None else [row[column] for column in EXPORT_COLUMNS])
+    return line.getvalue()
+
+
+def export_records(query, export_format, max_bytes, chunk_size):
+    """
+    Exports the records of a query built with user_records_query as NDJSON or CSV.
+    Records are read in chunks and written until the body would exceed 'max_bytes', which keeps
+    the response under the Lambda payload limit. Every body is a complete document, so a CSV
+    body always starts with its header row.
+    Returns a tuple with the body and the cursor to pass to continue the export after the last
+    written record, or None if all the records were written.
+    """
+    body = io.StringIO()
+    size = 0
+    header = _format_line(None, export_format)
+    body.write(header)
+    size += len(header.encode())
+    last_row = None
+    for row in iterate_records(query, chunk_size):
+        line = _format_line(export_row(row), export_format)
+        line_size = len(line.encode())
+        if last_row is not None and size + line_size > max_bytes:
+            return body.getvalue(), row_cursor(last_row)
+        body.write(line)
+        size += line_size
+        last_row = row
+    return body.getvalue(), None
@@ -1,21 +1,53 @@
 import math
+import operator
+from collections import namedtuple
 from chalice import ChaliceViewError
 from chalicelib.config import RAMDON_ORG_URL
 
+Operator = namedtuple('Operator', ['function', 'arity', 'vectorized', 'exact_limit'])
+BulkResult = namedtuple('BulkResult', ['values', 'errors'])
 
-def generate_random_url(is_numeric):
+OPERATORS = {}
+ZERO_DIVISOR_MESSAGE = "Divisor can't be zero. Try other random number."
+DIVISIONS = (operator.truediv, operator.floordiv, operator.mod)
+
+
+def register_operator(symbol, function, arity=2, vectorized=None, exact_limit=None):
+    """
+    Registers the callable that evaluates the operation with the given symbol.
+    The 'arity' is the number of operands the callable takes: 1 for unary operations,
+    which only use 'num1', and 2 for binary operations.
+    The optional 'vectorized' is the name of the NumPy function used by perform_operations,
+    which only uses it for operands below 'exact_limit', where NumPy's fixed size arithmetic
+    gives exactly the same result as the callable.
+    """
+    if arity not in (1, 2):
+        raise ValueError(f'Unsupported arity {arity} for operation {symbol}')
+    OPERATORS[symbol] = Operator(function, arity, vectorized, exact_limit)
+
+
+register_operator('+', operator.add, vectorized='add', exact_limit=2 ** 62)
+register_operator('-', operator.sub, vectorized='subtract', exact_limit=2 ** 62)
+register_operator('*', operator.mul, vectorized='multiply', exact_limit=2 ** 31)
+register_operator('/', operator.truediv, vectorized='true_divide', exact_limit=2 ** 53)
+register_operator('√', math.sqrt, arity=1, vectorized='sqrt', exact_limit=2 ** 53)
+
+
+def generate_random_url(is_numeric, num=None, length=None, base_url=RAMDON_ORG_URL):
     """
     Generates a URL for requesting random strings from a random.org API.
     The URL format depends on the value of the 'is_numeric' parameter.
-    If 'is_numeric' is 'true', the URL will request numeric strings.
-    If 'is_numeric' is any other value, the URL will request alphanumeric strings.
+    If 'is_numeric' is 'true', the URL will request numeric strings, two of 3 digits by default.
+    If 'is_numeric' is any other value, the URL will request alphanumeric strings, one of 20 characters by default.
+    The optional 'num' and 'length' replace the default number of strings and their length, and
+    'base_url' replaces the random.org API URL, such as with a local stand-in.
     Returns the generated URL.
     """
-    base_url = RAMDON_ORG_URL
     if is_numeric == 'true':
-        url = base_url + '?num=2&len=3&digits=on&loweralpha=off&unique=on&format=plain&rnd=new'
+        url = base_url + f'?num={num or 2}&len={length or 3}&digits=on&loweralpha=off&unique=on&format=plain&rnd=new'
     else:
-        url = base_url + '?num=1&len=20&digits=on&upperalpha=on&loweralpha=on&unique=on&format=plain&rnd=new'
+        url = base_url + (f'?num={num or 1}&len={length or 20}&digits=on&upperalpha=on&loweralpha=on&unique=on'
+                          '&format=plain&rnd=new')
     return url
 
 
@@ -23,16 +55,113 @@ def perform_operation(num1, num2, symbol):
     """
     Performs a mathematical operation based on the given inputs.
     The operation can be addition, subtraction, multiplication, division, square root or ramdon string generation.
+    The operation is looked up by symbol in the registered operators, and its operands are
+    validated against its arity before it is called.
     Returns the result of the operation.
     If an error occurs during the evaluation, returns an error message.
     """
+    if isinstance(num1, int) and not isinstance(num1, bool):
+        num1 = str(num1)
+    if not isinstance(num1, str):
+        return f"Error: Invalid input or expression: invalid operand {num1!r}"
     if not num1.isnumeric():
         return num1
+    operation = OPERATORS.get(symbol)
+    if operation is None:
+        return f"Error: Invalid input or expression: unsupported operation {symbol}"
     try:
-        expression = f"math.sqrt({int(num1)})" if symbol == "√" else f"{int(num1)} {symbol} {int(num2)}"
-        result = eval(expression)
-        return result
-    except (ValueError, SyntaxError) as e:
+        operands = (int(num1),) if operation.arity == 1 else (int(num1), int(num2))
+        return operation.function(*operands)
+    except (TypeError, ValueError, OverflowError) as e:
         return f"Error: Invalid input or expression: {str(e)}"
     except ZeroDivisionError as e:
-        raise ChaliceViewError("Divisor can't be zero. Try other random number.")
+        raise ChaliceViewError(ZERO_DIVISOR_MESSAGE)
+
+
+def _parse_ascii_digits(values, np):
+    """
+    Parses the strings in the given NumPy unicode array that are made of 1 to 18 ASCII digits,
+    the ones whose int() value fits in an int64. The digits are read straight from the
+    code points of the array, which is much faster than casting the strings.
+    Returns a mask of the parsed strings and their int64 values, zero for the others.
+    """
+    if not values.size:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int64)
+    codes = values.view(np.uint32).reshape(len(values), -1)
+    mask = codes[:, 0] != 0
+    if codes.shape[1] > 18:
+        mask &= codes[:, 18] == 0
+        codes = codes[:, :18]
+    present = codes != 0
+    digits = codes.astype(np.int64) - ord('0')
+    mask &= np.all(~present | ((digits >= 0) & (digits <= 9)), axis=1)
+    # Padding counts as trailing zeros, which the division by the power of ten removes.
+    digits[~present] = 0
+    powers = 10 ** np.arange(codes.shape[1] - 1, -1, -1, dtype=np.int64)
+    padding = codes.shape[1] - present.sum(axis=1)
+    parsed = (digits @ powers) // 10 ** padding
+    return mask, np.where(mask, parsed, 0)
+
+
+def perform_operations(num1, num2, symbols):
+    """
+    Performs many mathematical operations at once, taking one sequence per argument of perform_operation.
+    Operands are given as strings, as they arrive in requests, or as integers.
+    Rows are grouped by symbol and each group is evaluated with NumPy; rows NumPy can not
+    evaluate exactly, such as very large operands, fall back to perform_operation.
+    Returns a BulkResult whose 'values' hold, for each row, what perform_operation returns,
+    and whose 'errors' map the index of every row that failed to its error message. Rows with
+    a zero divisor, or any other row perform_operation raises an error for, have no value.
+    Requires NumPy, which is only imported when this function is called.
+    """
+    import numpy as np
+
+    num1 = np.asarray(num1, dtype=str)
+    num2 = np.asarray(num2, dtype=str)
+    symbols = np.asarray(symbols, dtype=str)
+    if not num1.shape == num2.shape == symbols.shape or num1.ndim != 1:
+        raise ValueError('num1, num2 and symbols must be one-dimensional and have the same length')
+
+    values = np.full(len(symbols), None, dtype=object)
+    errors = {}
+    numeric = np.char.isnumeric(num1)
+    values[~numeric] = num1[~numeric].astype(object)
+    first_parsed, first = _parse_ascii_digits(num1, np)
+    second_parsed, second = _parse_ascii_digits(num2, np)
+
+    unique_symbols, groups = np.unique(symbols, return_inverse=True)
+    for group, symbol in enumerate(unique_symbols.tolist()):
+        rows = np.flatnonzero((groups == group) & numeric)
+        operation = OPERATORS.get(symbol)
+        vectorized = np.zeros(len(rows), dtype=bool)
+        if operation is not None and operation.vectorized is not None:
+            vectorized = first_parsed[rows]
+            operands = [first[rows]]
+            if operation.arity == 2:
+                vectorized &= second_parsed[rows]
+                operands.append(second[rows])
+            vectorized &= np.all([operand < operation.exact_limit for operand in operands], axis=0)
+            operands = [operand[vectorized] for operand in operands]
+
+        if vectorized.any():
+            vectorized_rows = rows[vectorized]
+
+            if operation.function in DIVISIONS:
+                zero_divisor = operands[1] == 0
+                for index in vectorized_rows[zero_divisor].tolist():
+                    errors[index] = ZERO_DIVISOR_MESSAGE
+                vectorized_rows = vectorized_rows[~zero_divisor]
+                operands = [operand[~zero_divisor] for operand in operands]
+
+            values[vectorized_rows] = getattr(np, operation.vectorized)(*operands).astype(object)
+
+        for index in rows[~vectorized].tolist():
+            try:
+                values[index] = perform_operation(str(num1[index]), str(num2[index]), symbol)
+            except (ChaliceViewError, OverflowError) as e:
+                errors[index] = str(e)
+                continue
+            if isinstance(values[index], str) and values[index].startswith('Error: '):
+                errors[index] = values[index]
+
+    return BulkResult(values.tolist(), errors)
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from chalice import BadRequestError, ConflictError, Response, UnprocessableEntityError
+from chalice.app import handle_extra_types
+from chalicelib.config import (IDEMPOTENCY_KEY_TTL, IDEMPOTENCY_PENDING_TIMEOUT, IDEMPOTENCY_WAIT_TIMEOUT,
+                               IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_CACHE_TTL)
+from chalicelib.models import IdempotencyKey
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def request_hash(body):
+    """
+    Returns the SHA-256 digest of a raw request body, which tells apart different requests
+    sent with the same key.
+    """
+    return hashlib.sha256(body or b'').hexdigest()
+
+
+class IdempotencyKeyStore:
+    """
+    Runs requests sent with an Idempotency-Key at most once per user and key.
+    The first request claims the key in the idempotency keys table and stores its response in
+    the same transaction as its own writes; retries get the stored response back. Completed
+    responses are also kept in memory for a short time, so retries hitting the same container
+    don't query the database at all. A retry arriving while the first request is still running
+    waits for it to complete instead of running again.
+    """
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        """
+        Get the singleton instance of IdempotencyKeyStore class.
+
+        Returns:
+            IdempotencyKeyStore: The singleton instance.
+        """
+        if not IdempotencyKeyStore._instance:
+            IdempotencyKeyStore._instance = IdempotencyKeyStore()
+        return IdempotencyKeyStore._instance
+
+    def __init__(self, cache_size=IDEMPOTENCY_CACHE_SIZE, cache_ttl=IDEMPOTENCY_CACHE_TTL):
+        """
+        Initialize the IdempotencyKeyStore class.
+
+        Args:
+            cache_size (int): The number of completed responses kept in memory.
+            cache_ttl (int): The seconds a completed response is kept in memory.
+        """
+        if IdempotencyKeyStore._instance:
+            raise Exception("This class is a singleton!")
+        IdempotencyKeyStore._instance = self
+        self.cache_size = cache_size
+        self.cache_ttl = min(cache_ttl, IDEMPOTENCY_KEY_TTL)
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()
+
+    def run(self, cognito_user_id, key, body_hash, handler):
+        """
+        Run the handler of a request sent with an Idempotency-Key, unless a request of the user
+        with the same key already ran, in which case its response is returned instead.
+        Responses with a server error are not stored, and neither are errors raised by the
+        handler, so retrying those runs the request again.
+
+        Args:
+            cognito_user_id (str): The Cognito user id of the user.
+            key (str): The value of the Idempotency-Key header.
+            body_hash (str): The hash of the request body, as returned by request_hash.
+            handler (callable): The function that serves the request and returns its Response.
+
+        Returns:
+            Response: The response of the handler, or the stored response with the
+            'Idempotent-Replayed' header.
+
+        Raises:
+            BadRequestError: If the key is empty or too long.
+            UnprocessableEntityError: If the key was used with a different request body.
+            ConflictError: If the request that first used the key is still running after waiting.
+        """
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise BadRequestError(f'Idempotency-Key must have between 1 and {IDEMPOTENCY_KEY_MAX_LENGTH} characters')
+
+        stored = self._get_cached((cognito_user_id, key))
+        key_id = None
+        if stored is None:
+            key_id, stored = self._claim_or_wait(cognito_user_id, key, body_hash)
+        if stored is not None:
+            return self._replay(stored, body_hash)
+
+        try:
+            with IdempotencyKey._meta.database.atomic():
+                response = handler()
+                if response.status_code < 500:
+                    # Encoded as Chalice encodes the body it sends, so a replay has the same bytes.
+                    response_body = response.body
+                    if not isinstance(response_body, str):
+                        response_body = json.dumps(response_body, separators=(',', ':'), default=handle_extra_types)
+                    IdempotencyKey.complete(key_id, response.status_code, response_body)
+        except Exception:
+            IdempotencyKey.release(key_id)
+            raise
+        if response.status_code >= 500:
+            IdempotencyKey.release(key_id)
+        else:
+            self._cache((cognito_user_id, key), (body_hash, response.status_code, response_body))
+        return response
+
+    def clear_cache(self):
+        """
+        Forget the responses kept in memory.
+        """
+        with self._lock:
+            self._responses.clear()
+
+    def _claim_or_wait(self, cognito_user_id, key, body_hash):
+        """
+        Claim the key of the user, or wait for the request that claimed it to complete.
+        A pending key older than IDEMPOTENCY_PENDING_TIMEOUT belongs to a request that died
+        before completing, and a completed key older than IDEMPOTENCY_KEY_TTL has expired, so
+        either is deleted and claimed again.
+
+        Returns:
+            tuple: The id of the claimed key and None, or None and the stored
+            (request hash, status code, body) of the completed request.
+        """
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+        delay = 0.05
+        while True:
+            key_id = IdempotencyKey.claim(cognito_user_id, key, body_hash)
+            if key_id is not None:
+                return key_id, None
+
+            existing = IdempotencyKey.get_or_none((IdempotencyKey.cognito_user_id == cognito_user_id) &
+                                                  (IdempotencyKey.key == key))
+            if existing is None:
+                continue
+            age = datetime.now() - existing.created_at
+            if existing.status_code is not None:
+                if age > timedelta(seconds=IDEMPOTENCY_KEY_TTL):
+                    existing.delete_instance()
+                    continue
+                stored = (existing.request_hash, existing.status_code, existing.response_body)
+                self._cache((cognito_user_id, key), stored)
+                return None, stored
+            if existing.request_hash != body_hash:
+                raise UnprocessableEntityError('Idempotency-Key was already used with a different request')
+            if age > timedelta(seconds=IDEMPOTENCY_PENDING_TIMEOUT):
+                IdempotencyKey.release(existing.id)
+                continue
+            if time.monotonic() >= deadline:
+                raise ConflictError('A request with this Idempotency-Key is still in progress')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def _replay(self, stored, body_hash):
+        """
+        Build the response of a retried request from the stored response.
+
+        Returns:
+            Response: The stored response, with the 'Idempotent-Replayed' header.
+
+        Raises:
+            UnprocessableEntityError: If the key was used with a different request body.
+        """
+        stored_hash, status_code, response_body = stored
+        if stored_hash != body_hash:
+            raise UnprocessableEntityError('Idempotency-Key was already used with a different request')
+        return Response(body=response_body, headers={REPLAYED_HEADER: 'true'}, status_code=status_code)
+
+    def _get_cached(self, cache_key):
+        """
+        Get a completed response kept in memory.
+
+        Returns:
+            tuple: The stored (request hash, status code, body), or None if it is not in memory or has expired.
+        """
+        with self._lock:
+            cached = self._responses.get(cache_key)
+            if cached is None:
+                return None
+            expires_at, stored = cached
+            if expires_at < time.monotonic():
+                del self._responses[cache_key]
+                return None
+            return stored
+
+    def _cache(self, cache_key, stored):
+        """
+        Keep a completed response in memory for the cache TTL.
+        The oldest entry is evicted once the cache is full.
+        """
+        with self._lock:
+            self._responses[cache_key] = (time.monotonic() + self.cache_ttl, stored)
+            self._responses.move_to_end(cache_key)
+            while len(self._responses) > self.cache_size:
+                self._responses.popitem(last=False)
@@ -0,0 +1,141 @@
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from chalicelib.config import PERF_SAMPLE_RATE
+
+logger = logging.getLogger('calculator-backend.performance')
+logger.setLevel(logging.INFO)
+
+_current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Timings collected while serving one sampled request.
+    SQL statements are counted and timed by QueryInstrumentationMixin, and the other
+    phases, such as serialization or outbound calls, are timed with the phase context manager.
+    """
+
+    def __init__(self, name):
+        """
+        Initializes the metrics of the request with the given name.
+        """
+        self.name = name
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.query_count = 0
+        self.query_time = 0.0
+
+    def add_phase(self, name, duration):
+        """
+        Adds the given duration, in seconds, to the phase with the given name.
+        """
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def add_query(self, duration):
+        """
+        Counts a SQL statement that took the given duration, in seconds.
+        """
+        self.query_count += 1
+        self.query_time += duration
+
+    def elapsed(self):
+        """
+        Returns the seconds elapsed since the request started.
+        """
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """
+        Returns the value of the Server-Timing header describing the request.
+        """
+        entries = [f'total;dur={self.elapsed() * 1000:.2f}',
+                   f'db;dur={self.query_time * 1000:.2f};desc="{self.query_count} queries"']
+        entries.extend(f'{name};dur={duration * 1000:.2f}' for name, duration in self.phases.items())
+        return ', '.join(entries)
+
+    def to_dict(self):
+        """
+        Returns the structured representation of the metrics, with durations in milliseconds.
+        """
+        return {
+            'request': self.name,
+            'total_ms': round(self.elapsed() * 1000, 3),
+            'db_ms': round(self.query_time * 1000, 3),
+            'db_queries': self.query_count,
+            'phases_ms': {name: round(duration * 1000, 3) for name, duration in self.phases.items()},
+        }
+
+
+class QueryInstrumentationMixin:
+    """
+    Adds the number and duration of executed SQL statements to the metrics of the current request.
+    Statements executed outside a sampled request only pay for a context variable lookup.
+    """
+
+    def execute_sql(self, *args, **kwargs):
+        metrics = _current_metrics.get()
+        if metrics is None:
+            return super().execute_sql(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().execute_sql(*args, **kwargs)
+        finally:
+            metrics.add_query(time.perf_counter() - started)
+
+
+def is_sampled():
+    """
+    Returns True for the share of requests given by PERF_SAMPLE_RATE.
+    """
+    return PERF_SAMPLE_RATE > 0 and random.random() < PERF_SAMPLE_RATE
+
+
+@contextmanager
+def measure_request(name):
+    """
+    Collects the metrics of the request with the given name while the block runs, and
+    logs them as a structured line when it ends.
+    Yields the RequestMetrics of the request.
+    """
+    metrics = RequestMetrics(name)
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+        logger.info(json.dumps({'event': 'request_timing', **metrics.to_dict()}))
+
+
+@contextmanager
+def phase(name):
+    """
+    Times the block as the phase with the given name of the current request.
+    Does nothing if the current request is not sampled.
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_phase(name, time.perf_counter() - started)
+
+
+def log_authorizer_timing(duration, authorized):
+    """
+    Logs the duration, in seconds, of a sampled authorizer invocation as a structured line.
+    The authorizer runs in its own invocation, so its timing can not be added to the
+    Server-Timing header of the request it authorizes.
+    """
+    if is_sampled():
+        logger.info(json.dumps({
+            'event': 'authorizer_timing',
+            'total_ms': round(duration * 1000, 3),
+            'authorized': authorized,
+        }))
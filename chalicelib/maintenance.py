@@ -0,0 +1,264 @@
+"""
+Maintenance of the records table.
+
+On PostgreSQL the records table is partitioned by month of the record date, so listing queries
+restricted to a date range only read the partitions of that range, and the newest records are
+read from the newest partitions first. Records that are no longer listed, soft deleted ones and,
+optionally, those older than the retention period, are moved to the 'records_archive' table.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from peewee import PostgresqlDatabase
+from chalicelib.config import (RECORDS_PARTITIONS_AHEAD, RECORDS_PARTITION_COPY_BATCH_SIZE, RECORDS_RETENTION_DAYS,
+                               RECORDS_ARCHIVE_BATCH_SIZE, RECORDS_ARCHIVE_MAX_BATCHES)
+from chalicelib.models import Record, RecordArchive, UsageSummary
+
+logger = logging.getLogger(__name__)
+
+RECORDS_TABLE = 'records'
+PARTITIONED_TABLE = 'records_partitioned'
+UNPARTITIONED_TABLE = 'records_unpartitioned'
+HISTORY_PARTITION = 'records_history'
+MIRROR_TRIGGER = 'records_mirror_changes'
+# Statements that need an exclusive lock give up after this long instead of blocking the
+# requests queued behind them.
+LOCK_TIMEOUT = '5s'
+
+
+def month_start(value):
+    """
+    Returns the first day of the month of the given date or datetime.
+    """
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    """
+    Returns the first day of the month 'months' months after the month starting at 'month'.
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """
+    Returns the name of the partition holding the records of the month starting at 'month'.
+    """
+    return f'{RECORDS_TABLE}_p{month:%Y_%m}'
+
+
+def month_partition_sql(month, parent=RECORDS_TABLE):
+    """
+    Returns the statement creating the partition of the parent table for the records of the
+    month starting at 'month', unless it exists.
+    """
+    return (f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF "{parent}" '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+
+
+def history_partition_sql(first_month, parent=RECORDS_TABLE):
+    """
+    Returns the statement creating the partition of the parent table for the records older
+    than the month starting at 'first_month', unless it exists.
+    """
+    return (f'CREATE TABLE IF NOT EXISTS "{HISTORY_PARTITION}" PARTITION OF "{parent}" '
+            f"FOR VALUES FROM (MINVALUE) TO ('{first_month.isoformat()}')")
+
+
+def is_partitioned(database, table=RECORDS_TABLE):
+    """
+    Returns True if the given table of a PostgreSQL database is partitioned.
+    """
+    if not isinstance(database, PostgresqlDatabase):
+        return False
+    cursor = database.execute_sql('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', (table,))
+    return cursor.fetchone() is not None
+
+
+def ensure_record_partitions(database, months_ahead=RECORDS_PARTITIONS_AHEAD, today=None):
+    """
+    Creates the missing monthly partitions of the records table from the current month up to
+    'months_ahead' months ahead, so new records always have a partition to go to.
+    There is no default partition, which would keep PostgreSQL from scanning the partitions in
+    date order, so this must run at least once every 'months_ahead' months.
+    Does nothing unless the table is partitioned.
+    Returns the names of the ensured partitions.
+    """
+    if not is_partitioned(database):
+        return []
+    current_month = month_start(today or datetime.now())
+    months = [add_months(current_month, offset) for offset in range(months_ahead + 1)]
+    with database.atomic():
+        database.execute_sql(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        for month in months:
+            database.execute_sql(month_partition_sql(month))
+    return [partition_name(month) for month in months]
+
+
+def _create_partitioned_table(database, months_ahead):
+    """
+    Creates the empty partitioned copy of the records table, with the same columns, foreign
+    keys and listing index, a partition per month of the existing records up to 'months_ahead'
+    months ahead and a partition for anything older.
+    The primary key of a partitioned table must include the partition key, so it is (id, date).
+    Raises a ValueError if the id of the records table is an identity column.
+    """
+    identity = database.execute_sql(
+        "SELECT attidentity FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'id'",
+        (RECORDS_TABLE,)
+    ).fetchone()
+    # LIKE ... INCLUDING DEFAULTS copies the nextval() default of a serial id, which keeps using
+    # the sequence of the records table, but not an identity column: INCLUDING IDENTITY would
+    # give the copy a new sequence starting over at 1.
+    if identity and identity[0]:
+        raise ValueError(f'The id of the {RECORDS_TABLE} table is an identity column, which can not be copied')
+    with database.atomic():
+        if not database.table_exists(PARTITIONED_TABLE):
+            database.execute_sql(f'CREATE TABLE "{PARTITIONED_TABLE}" (LIKE "{RECORDS_TABLE}" INCLUDING DEFAULTS) '
+                                 'PARTITION BY RANGE ("date")')
+            database.execute_sql(f'ALTER TABLE "{PARTITIONED_TABLE}" ADD PRIMARY KEY ("id", "date")')
+            database.execute_sql(f'ALTER TABLE "{PARTITIONED_TABLE}" '
+                                 'ADD FOREIGN KEY ("operation_id") REFERENCES "operations" ("id")')
+            database.execute_sql(f'ALTER TABLE "{PARTITIONED_TABLE}" '
+                                 'ADD FOREIGN KEY ("user_id") REFERENCES "users" ("id")')
+            # LIKE doesn't copy the indexes. The listing index also serves the lookups by user_id,
+            # but the foreign key index on operation_id, used when an operation is deleted or its
+            # id updated, must be created again.
+            database.execute_sql(f'CREATE INDEX ON "{PARTITIONED_TABLE}" ("user_id", "active", "date", "id")')
+            database.execute_sql(f'CREATE INDEX ON "{PARTITIONED_TABLE}" ("operation_id")')
+
+        first, last = database.execute_sql(f'SELECT MIN("date"), MAX("date") FROM "{RECORDS_TABLE}"').fetchone()
+        now = datetime.now()
+        first_month = month_start(first or now)
+        last_month = add_months(month_start(max(last or now, now)), months_ahead)
+        database.execute_sql(history_partition_sql(first_month, PARTITIONED_TABLE))
+        month = first_month
+        while month <= last_month:
+            database.execute_sql(month_partition_sql(month, PARTITIONED_TABLE))
+            month = add_months(month, 1)
+
+
+def _mirror_changes(database):
+    """
+    Installs the trigger that applies every insert, update and delete of the records table to
+    its partitioned copy, so rows changed while they are copied are not lost.
+    """
+    with database.atomic():
+        database.execute_sql(f'''
+            CREATE OR REPLACE FUNCTION "{MIRROR_TRIGGER}"() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM "{PARTITIONED_TABLE}" WHERE "id" = OLD."id";
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO "{PARTITIONED_TABLE}" SELECT NEW.* ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        database.execute_sql(f'DROP TRIGGER IF EXISTS "{MIRROR_TRIGGER}" ON "{RECORDS_TABLE}"')
+        database.execute_sql(f'CREATE TRIGGER "{MIRROR_TRIGGER}" AFTER INSERT OR UPDATE OR DELETE ON "{RECORDS_TABLE}" '
+                             f'FOR EACH ROW EXECUTE PROCEDURE "{MIRROR_TRIGGER}"()')
+
+
+def _copy_rows(database, batch_size):
+    """
+    Copies the rows of the records table to its partitioned copy in batches of ids, each in its
+    own transaction. The copied rows are locked against updates until their batch commits, so
+    an update can't be mirrored before the row it changes is copied.
+    """
+    max_id = database.execute_sql(f'SELECT MAX("id") FROM "{RECORDS_TABLE}"').fetchone()[0] or 0
+    last_id = 0
+    while last_id < max_id:
+        with database.atomic():
+            database.execute_sql(
+                f'WITH batch AS (SELECT * FROM "{RECORDS_TABLE}" WHERE "id" > %s AND "id" <= %s FOR SHARE) '
+                f'INSERT INTO "{PARTITIONED_TABLE}" SELECT * FROM batch ON CONFLICT DO NOTHING',
+                (last_id, last_id + batch_size)
+            )
+        last_id += batch_size
+        logger.info('Copied the records up to id %s of %s', min(last_id, max_id), max_id)
+
+
+def _swap_tables(database):
+    """
+    Replaces the records table with its partitioned copy. The exclusive lock on the records
+    table is only held for the renames, and the swap fails instead of waiting longer than
+    LOCK_TIMEOUT for it.
+    """
+    sequence = database.execute_sql("SELECT pg_get_serial_sequence(%s, 'id')", (RECORDS_TABLE,)).fetchone()[0]
+    with database.atomic():
+        database.execute_sql(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        database.execute_sql(f'LOCK TABLE "{RECORDS_TABLE}" IN ACCESS EXCLUSIVE MODE')
+        database.execute_sql(f'DROP TRIGGER "{MIRROR_TRIGGER}" ON "{RECORDS_TABLE}"')
+        database.execute_sql(f'ALTER TABLE "{RECORDS_TABLE}" RENAME TO "{UNPARTITIONED_TABLE}"')
+        database.execute_sql(f'ALTER TABLE "{PARTITIONED_TABLE}" RENAME TO "{RECORDS_TABLE}"')
+        if sequence:
+            database.execute_sql(f'ALTER SEQUENCE {sequence} OWNED BY "{RECORDS_TABLE}"."id"')
+    database.execute_sql(f'DROP FUNCTION IF EXISTS "{MIRROR_TRIGGER}"()')
+
+
+def partition_records(database, batch_size=RECORDS_PARTITION_COPY_BATCH_SIZE, months_ahead=RECORDS_PARTITIONS_AHEAD):
+    """
+    Turns the records table of a PostgreSQL database into a table partitioned by month of the
+    record date while the application keeps reading and writing it. An empty partitioned copy
+    is created, a trigger mirrors the changes made to the records table into it while the
+    existing rows are copied in short batches, and the tables are then swapped by renaming them.
+    The previous table is kept as 'records_unpartitioned' until it is dropped by hand. Running
+    it again after a failure resumes the copy.
+    Does nothing on other databases or if the table is already partitioned.
+    Returns True if the table was partitioned.
+    """
+    if not isinstance(database, PostgresqlDatabase) or is_partitioned(database):
+        return False
+    _create_partitioned_table(database, months_ahead)
+    _mirror_changes(database)
+    _copy_rows(database, batch_size)
+    _swap_tables(database)
+    return True
+
+
+def archive_records(batch_size=RECORDS_ARCHIVE_BATCH_SIZE, retention_days=RECORDS_RETENTION_DAYS,
+                    max_batches=RECORDS_ARCHIVE_MAX_BATCHES, now=None):
+    """
+    Moves the soft deleted records, and the active records older than 'retention_days' unless it
+    is 0, from the records table to the archive, so listing queries no longer skip over them.
+    Each batch of at most 'batch_size' records is deleted and archived in its own transaction,
+    and the archived active records are removed from the usage summaries of their users. At most
+    'max_batches' batches are moved per run, which bounds the duration of a run.
+    Returns the number of archived records.
+    """
+    now = now or datetime.now()
+    condition = Record.active == False
+    if retention_days:
+        condition |= Record.date < now - timedelta(days=retention_days)
+
+    archived = 0
+    for _ in range(max_batches):
+        ids = [record.id for record in Record.select(Record.id).where(condition).order_by(Record.id).limit(batch_size)]
+        if not ids:
+            break
+        with Record._meta.database.atomic():
+            # The deleted rows are archived as they were deleted, so a record soft deleted
+            # concurrently is archived as inactive and not removed from the summaries twice.
+            deleted = list(Record.delete().where(Record.id.in_(ids)).returning(*Record._meta.sorted_fields).execute())
+            if deleted:
+                RecordArchive.insert_many([{**record.__data__, 'archived_at': now} for record in deleted]).execute()
+            usage = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+            for record in deleted:
+                if record.active:
+                    operation_usage = usage[record.user_id_id][record.operation_id]
+                    operation_usage[0] -= 1
+                    operation_usage[1] -= record.amount
+            for user_id, operations in usage.items():
+                UsageSummary.record_usage(user_id, [
+                    (operation_id, record_count, amount, None)
+                    for operation_id, (record_count, amount) in operations.items()
+                ])
+        archived += len(deleted)
+        if len(ids) < batch_size:
+            break
+    logger.info('Archived %s records', archived)
+    return archived
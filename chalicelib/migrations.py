@@ -0,0 +1,190 @@
+"""
+Schema migrations.
+
+Migrations are applied in order and recorded in the 'schema_migrations' table, so running
+them again only applies the new ones. Run them with:
+
+    python -m chalicelib.migrations
+"""
+from datetime import datetime
+from peewee import CharField, DateTimeField, PostgresqlDatabase
+from playhouse.migrate import SchemaMigrator, make_index_name, migrate
+from chalicelib.maintenance import partition_records
+from chalicelib.models import (BaseModel, IdempotencyKey, Operation, RateLimitBucket, RecentWrite, Record,
+                               RecordArchive, UsageSummary, User, db)
+
+
+class SchemaMigration(BaseModel):
+    """
+    Model representing an applied migration.
+    """
+    class Meta:
+        table_name = 'schema_migrations'
+
+    name = CharField(primary_key=True)
+    applied_at = DateTimeField(default=datetime.now)
+
+
+def non_atomic(migration):
+    """
+    Marks a migration that manages its own transactions, such as one copying a large table in
+    batches, so it is not run in a single transaction. It must be safe to run again if it fails.
+    Returns the migration.
+    """
+    migration.atomic = False
+    return migration
+
+
+def drop_invalid_index(database, name):
+    """
+    Drops the index of a PostgreSQL database with the given name if it is invalid, as a failed
+    or interrupted CREATE INDEX CONCURRENTLY leaves it, so it can be built again.
+    Returns True if the index was dropped.
+    """
+    cursor = database.execute_sql('SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) AND NOT indisvalid',
+                                  (name,))
+    if cursor.fetchone() is None:
+        return False
+    database.execute_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+    return True
+
+
+def add_index_if_missing(migrator, table, columns, unique=False):
+    """
+    Adds an index on the given columns of the table, unless an index with the same columns and
+    uniqueness already exists, such as one created by create_tables from the model declarations,
+    which are named after the model instead of the table.
+    On PostgreSQL the index is built with CREATE INDEX CONCURRENTLY, which does not block writes
+    to the table but can't run in a transaction, so it must be called from a non-atomic migration.
+    An invalid index left by a previous failed build is dropped and built again.
+    Returns True if the index was added.
+    """
+    database = migrator.database
+    name = make_index_name(table, columns)
+    concurrently = isinstance(database, PostgresqlDatabase)
+    if concurrently:
+        drop_invalid_index(database, name)
+    for index in database.get_indexes(table):
+        if list(index.columns) == list(columns) and index.unique == unique:
+            return False
+    if concurrently:
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        database.execute_sql(f'CREATE {"UNIQUE " if unique else ""}INDEX CONCURRENTLY "{name}" '
+                             f'ON "{table}" ({column_list})')
+    else:
+        migrate(migrator.add_index(table, columns, unique=unique))
+    return True
+
+
+@non_atomic
+def add_hot_query_indexes(migrator):
+    """
+    Adds the indexes used by the hot queries: users are looked up by 'cognito_user_id' on every
+    authorized request and by 'username' on sign in, and the records of a user are listed by
+    'active' state, newest first, with the id breaking ties between equal dates.
+    The unique index on 'cognito_user_id' requires existing users to have distinct ids.
+    The indexes are built one at a time, without blocking writes on PostgreSQL.
+    """
+    add_index_if_missing(migrator, 'users', ['cognito_user_id'], unique=True)
+    add_index_if_missing(migrator, 'users', ['username'])
+    add_index_if_missing(migrator, 'records', ['user_id', 'active', 'date', 'id'])
+
+
+def add_usage_summaries(migrator):
+    """
+    Creates the usage summaries table and fills it from the existing records.
+    """
+    models = [User, Operation, Record, UsageSummary]
+    with migrator.database.bind_ctx(models):
+        migrator.database.create_tables([UsageSummary])
+        UsageSummary.rebuild()
+
+
+def add_idempotency_keys(migrator):
+    """
+    Creates the idempotency keys table, with its unique index on the user and key.
+    """
+    with migrator.database.bind_ctx([IdempotencyKey]):
+        migrator.database.create_tables([IdempotencyKey])
+
+
+def add_rate_limit_buckets(migrator):
+    """
+    Creates the rate limit buckets table, unlogged on PostgreSQL: its writes skip the WAL, and
+    losing the buckets after a crash only resets the limits.
+    """
+    with migrator.database.bind_ctx([RateLimitBucket]):
+        migrator.database.create_tables([RateLimitBucket])
+    if isinstance(migrator.database, PostgresqlDatabase):
+        migrator.database.execute_sql(f'ALTER TABLE "{RateLimitBucket._meta.table_name}" SET UNLOGGED')
+
+
+def add_records_archive(migrator):
+    """
+    Creates the table the archival job moves the records that are no longer listed to.
+    """
+    with migrator.database.bind_ctx([User, Operation, RecordArchive]):
+        migrator.database.create_tables([RecordArchive])
+
+
+@non_atomic
+def partition_records_by_month(migrator):
+    """
+    Partitions the records table by month on PostgreSQL, copying the existing rows in batches
+    while the table stays available, as described in chalicelib.maintenance.partition_records.
+    """
+    partition_records(migrator.database)
+
+
+def add_recent_writes(migrator):
+    """
+    Creates the table of the write markers that keep the reads of a user on the primary after a
+    write, unlogged on PostgreSQL like the rate limit buckets.
+    """
+    with migrator.database.bind_ctx([RecentWrite]):
+        migrator.database.create_tables([RecentWrite])
+    if isinstance(migrator.database, PostgresqlDatabase):
+        migrator.database.execute_sql(f'ALTER TABLE "{RecentWrite._meta.table_name}" SET UNLOGGED')
+
+
+MIGRATIONS = [
+    ('0001_add_hot_query_indexes', add_hot_query_indexes),
+    ('0002_add_usage_summaries', add_usage_summaries),
+    ('0003_add_idempotency_keys', add_idempotency_keys),
+    ('0004_add_rate_limit_buckets', add_rate_limit_buckets),
+    ('0005_add_records_archive', add_records_archive),
+    ('0006_partition_records_by_month', partition_records_by_month),
+    ('0007_add_recent_writes', add_recent_writes),
+]
+
+
+def run_migrations(database=None, migrations=MIGRATIONS):
+    """
+    Applies the migrations that have not been applied to the database yet, each one in its own
+    transaction along with its entry in the 'schema_migrations' table, except for the non-atomic
+    ones, whose entry is added once they complete.
+    Returns the names of the applied migrations.
+    """
+    database = database or db
+    migrator = SchemaMigrator.from_database(database)
+    with database.bind_ctx([SchemaMigration]):
+        database.create_tables([SchemaMigration])
+        applied = {migration.name for migration in SchemaMigration.select(SchemaMigration.name)}
+        newly_applied = []
+        for name, migration in migrations:
+            if name in applied:
+                continue
+            if getattr(migration, 'atomic', True):
+                with database.atomic():
+                    migration(migrator)
+                    SchemaMigration.create(name=name)
+            else:
+                migration(migrator)
+                SchemaMigration.create(name=name)
+            newly_applied.append(name)
+    return newly_applied
+
+
+if __name__ == '__main__':
+    for name in run_migrations():
+        print(f'Applied {name}')
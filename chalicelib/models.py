@@ -1,4 +1,7 @@
-from peewee import Model, DecimalField, CharField, BooleanField, DateTimeField, ForeignKeyField
+from collections import defaultdict
+from datetime import datetime, timedelta
+from peewee import (EXCLUDED, Case, CompositeKey, Model, DecimalField, CharField, BooleanField, DateTimeField,
+                    DoubleField, ForeignKeyField, IntegerField, IntegrityError, TextField, fn)
 from chalicelib.database import DatabaseConnection
 from chalice import ChaliceViewError
 
@@ -20,10 +23,10 @@ class User(BaseModel):
     class Meta:
         table_name = 'users'
 
-    username = CharField()
+    username = CharField(index=True)
     status = BooleanField()
     balance = DecimalField(default=5000)
-    cognito_user_id = CharField()
+    cognito_user_id = CharField(unique=True)
 
     def to_dict(self):
         """
@@ -41,13 +44,32 @@ class User(BaseModel):
     def update_balance(self, value):
         """
         Updates the user's balance by subtracting the given value.
-        Saves the updated user model to the database.
+        The balance is debited in the database with a single conditional UPDATE, so concurrent
+        debits neither lose updates nor overdraw the balance.
         Returns the updated balance.
+        Raises an error if the user has insufficient balance for the debit.
         """
-        self.balance = self.balance - value
-        self.save()
+        self.balance = User.debit(self.id, value)
         return self.balance
 
+    @classmethod
+    def debit(cls, user_id, value):
+        """
+        Subtracts the given value from the balance of the user with the given id, as long as
+        the balance covers it, and reads the new balance back in the same statement.
+        Returns the updated balance.
+        Raises an error if the user has insufficient balance for the debit.
+        """
+        query = (
+            cls.update(balance=cls.balance - value)
+            .where((cls.id == user_id) & (cls.balance >= value))
+            .returning(cls.balance)
+        )
+        updated_users = list(query.execute())
+        if not updated_users:
+            raise ChaliceViewError("Insufficient balance for the operation.")
+        return updated_users[0].balance
+
 
 class Operation(BaseModel):
     """
@@ -80,6 +102,9 @@ class Record(BaseModel):
     """
     class Meta:
         table_name = 'records'
+        indexes = (
+            (('user_id', 'active', 'date', 'id'), False),
+        )
 
     operation = ForeignKeyField(Operation, backref='records')
     user_id = ForeignKeyField(User, backref='users')
@@ -87,22 +112,85 @@ class Record(BaseModel):
     user_balance = DecimalField()
     operation_response = CharField()
     date = DateTimeField()
-    active = BooleanField()
+    active = BooleanField(default=True)
 
     def save(self, *args, **kwargs):
         """
         Overrides the save method to update the user's balance before saving the record.
+        The debit and the insert run in the same transaction, so a failed insert does not
+        charge the user.
         Raises an error if the user has insufficient balance for the operation.
         """
         if self._pk is None:
-            operation = self.operation
-            user = self.user_id
+            with self._meta.database.atomic():
+                self.user_balance = self.user_id.update_balance(self.operation.cost)
+                saved = super().save(*args, **kwargs)
+                UsageSummary.record_usage(self.user_id.id, [(self.operation.id, 1, self.amount, self.date)])
+                return saved
+        return super().save(*args, **kwargs)
+
+    @classmethod
+    def soft_delete_where(cls, cognito_user_id, *conditions):
+        """
+        Marks as inactive the active records of the user with the given Cognito id that match
+        all the given conditions, and removes them from the usage summaries of the user.
+        Records are matched and updated by a single UPDATE that returns the deleted rows, in the
+        same transaction as the summaries update, and records of other users are never touched.
+        Returns the ids of the deleted records.
+        """
+        owner = User.select(User.id).where(User.cognito_user_id == cognito_user_id)
+        query = cls.update(active=False).where(cls.user_id.in_(owner) & (cls.active == True), *conditions)
+        with cls._meta.database.atomic():
+            deleted = list(query.returning(cls.id, cls.user_id, cls.operation, cls.amount).execute())
+            usage = defaultdict(lambda: [0, 0])
+            for record in deleted:
+                operation_usage = usage[record.operation_id]
+                operation_usage[0] -= 1
+                operation_usage[1] -= record.amount
+            if deleted:
+                UsageSummary.record_usage(deleted[0].user_id_id, [
+                    (operation_id, record_count, amount, None)
+                    for operation_id, (record_count, amount) in usage.items()
+                ])
+        return [record.id for record in deleted]
+
+    @classmethod
+    def create_many(cls, user, records):
+        """
+        Creates several records of the given user at once.
+        The total cost is debited with a single balance update and the records are inserted
+        with a single statement, in one transaction. Each record keeps the balance the user
+        had right after its own operation, as if they had been created one by one.
+        Returns the created records.
+        Raises an error if the user has insufficient balance for all the operations.
+        """
+        if not records:
+            return []
+
+        total_cost = sum(record.operation.cost for record in records)
+        with cls._meta.database.atomic():
+            balance = User.debit(user.id, total_cost) + total_cost
+            for record in records:
+                balance -= record.operation.cost
+                record.user_id = user
+                record.amount = record.operation.cost
+                record.user_balance = balance
 
-            if user.balance < operation.cost:
-                raise ChaliceViewError("Insufficient balance for the operation.")
+            rows = [record.__data__ for record in records]
+            inserted = cls.insert_many(rows).returning(cls.id).execute()
+            for record, inserted_record in zip(records, inserted):
+                record.id = inserted_record.id
 
-            self.user_balance = user.update_balance(operation.cost)
-        super().save(*args, **kwargs)
+            usage = defaultdict(lambda: [0, 0, None])
+            for record in records:
+                operation_usage = usage[record.operation.id]
+                operation_usage[0] += 1
+                operation_usage[1] += record.amount
+                operation_usage[2] = max(operation_usage[2] or record.date, record.date)
+            UsageSummary.record_usage(user.id, [(operation_id, *values) for operation_id, values in usage.items()])
+
+        user.balance = balance
+        return records
 
     def to_dict(self):
         """
@@ -118,3 +206,231 @@ class Record(BaseModel):
             'operation_response': self.operation_response,
             'date': self.date.strftime('%Y-%m-%d %H:%M:%S'),
         }
+
+
+class RecordArchive(BaseModel):
+    """
+    Model representing a record moved out of the records table by the archival job, either
+    because it was soft deleted or because it is older than the retention period.
+    Archived records keep their id and are no longer listed or counted in the usage summaries.
+    """
+    class Meta:
+        table_name = 'records_archive'
+
+    id = IntegerField(primary_key=True)
+    operation = ForeignKeyField(Operation, backref='archived_records')
+    user_id = ForeignKeyField(User, backref='archived_records')
+    amount = DecimalField()
+    user_balance = DecimalField()
+    operation_response = CharField()
+    date = DateTimeField()
+    active = BooleanField()
+    archived_at = DateTimeField(default=datetime.now)
+
+
+class UsageSummary(BaseModel):
+    """
+    Model representing the usage of an operation by a user: the number and total amount of
+    the user's active records of the operation, and the date of the latest one created.
+    Rows are kept up to date in the same transaction as the records they summarize.
+    """
+    class Meta:
+        table_name = 'usage_summaries'
+        primary_key = CompositeKey('user_id', 'operation')
+
+    user_id = ForeignKeyField(User, backref='usage_summaries')
+    operation = ForeignKeyField(Operation, backref='usage_summaries')
+    record_count = IntegerField(default=0)
+    total_amount = DecimalField(default=0)
+    last_activity = DateTimeField(null=True)
+
+    @classmethod
+    def record_usage(cls, user_id, changes):
+        """
+        Adds usage changes to the summaries of the user with the given id, creating the missing ones.
+        Each change is an (operation_id, record_count, amount, date) tuple, where the count and
+        amount are added to the summary and the date, if not None, replaces an older last activity.
+        All the changes are applied with a single upsert, so they must be for distinct operations.
+        """
+        if not changes:
+            return
+        rows = [
+            {
+                'user_id': user_id,
+                'operation': operation_id,
+                'record_count': record_count,
+                'total_amount': amount,
+                'last_activity': date,
+            }
+            for operation_id, record_count, amount, date in changes
+        ]
+        (
+            cls.insert_many(rows)
+            .on_conflict(
+                conflict_target=[cls.user_id, cls.operation],
+                update={
+                    cls.record_count: cls.record_count + EXCLUDED.record_count,
+                    cls.total_amount: cls.total_amount + EXCLUDED.total_amount,
+                    cls.last_activity: Case(None, [
+                        (EXCLUDED.last_activity.is_null(), cls.last_activity),
+                        (cls.last_activity >= EXCLUDED.last_activity, cls.last_activity),
+                    ], EXCLUDED.last_activity),
+                }
+            )
+            .execute()
+        )
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recomputes every summary from the records table, replacing the existing ones.
+        Used to backfill the summaries of records created before they were maintained, or by
+        anything that writes records without going through the model.
+        """
+        active = Case(None, [(Record.active == True, 1)], 0)
+        active_amount = Case(None, [(Record.active == True, Record.amount)], 0)
+        query = (
+            Record.select(Record.user_id, Record.operation, fn.SUM(active), fn.SUM(active_amount), fn.MAX(Record.date))
+            .group_by(Record.user_id, Record.operation)
+        )
+        with cls._meta.database.atomic():
+            cls.delete().execute()
+            cls.insert_from(
+                query,
+                [cls.user_id, cls.operation, cls.record_count, cls.total_amount, cls.last_activity]
+            ).execute()
+
+
+class IdempotencyKey(BaseModel):
+    """
+    Model representing an Idempotency-Key sent by a user, along with the response of the request
+    that first used it once that request completes. A key without a status code is still pending.
+    """
+    class Meta:
+        table_name = 'idempotency_keys'
+        indexes = (
+            (('cognito_user_id', 'key'), True),
+        )
+
+    cognito_user_id = CharField()
+    key = CharField()
+    request_hash = CharField()
+    status_code = IntegerField(null=True)
+    response_body = TextField(null=True)
+    created_at = DateTimeField(default=datetime.now)
+
+    @classmethod
+    def claim(cls, cognito_user_id, key, request_hash):
+        """
+        Inserts the key of the user as pending. The unique index makes a single request win
+        when several use the same key at once.
+        Returns the id of the claimed key, or None if the key already existed.
+        """
+        try:
+            with cls._meta.database.atomic():
+                return cls.create(cognito_user_id=cognito_user_id, key=key, request_hash=request_hash).id
+        except IntegrityError:
+            return None
+
+    @classmethod
+    def complete(cls, key_id, status_code, response_body):
+        """
+        Stores the response of the request that claimed the key with the given id.
+        """
+        cls.update(status_code=status_code, response_body=response_body).where(cls.id == key_id).execute()
+
+    @classmethod
+    def release(cls, key_id):
+        """
+        Deletes the key with the given id if it is still pending, so the next request using it
+        runs again.
+        """
+        cls.delete().where((cls.id == key_id) & cls.status_code.is_null()).execute()
+
+    @classmethod
+    def purge_expired(cls, ttl):
+        """
+        Deletes the keys created more than 'ttl' seconds ago.
+        Returns the number of deleted keys.
+        """
+        return cls.delete().where(cls.created_at < datetime.now() - timedelta(seconds=ttl)).execute()
+
+
+class RateLimitBucket(BaseModel):
+    """
+    Model representing the token bucket of a user on a rate limited route, shared by every
+    container. The table holds no data worth recovering, so it is unlogged on PostgreSQL.
+    """
+    class Meta:
+        table_name = 'rate_limit_buckets'
+
+    key = CharField(primary_key=True)
+    tokens = DoubleField()
+    # A Unix timestamp, which a single precision REAL column would round to minutes.
+    updated_at = DoubleField()
+    allowed = BooleanField()
+
+    @classmethod
+    def take(cls, key, capacity, refill_rate, now, cost=1):
+        """
+        Refills the bucket with the given key for the time elapsed since its last update and takes
+        'cost' tokens from it if it has enough, creating it full if it doesn't exist.
+        The bucket is read and updated by a single upsert, so concurrent requests can't take the
+        same tokens.
+        Returns a tuple with whether the tokens were taken and the tokens left in the bucket.
+        """
+        elapsed = Case(None, [(cls.updated_at < now, now - cls.updated_at)], 0)
+        refilled = cls.tokens + elapsed * refill_rate
+        refilled = Case(None, [(refilled > capacity, capacity)], refilled)
+        allowed = refilled >= cost
+        query = (
+            cls.insert(key=key, tokens=capacity - cost, updated_at=now, allowed=capacity >= cost)
+            .on_conflict(
+                conflict_target=[cls.key],
+                update={
+                    cls.tokens: Case(None, [(allowed, refilled - cost)], refilled),
+                    cls.updated_at: now,
+                    cls.allowed: allowed,
+                }
+            )
+            .returning(cls.tokens, cls.allowed)
+        )
+        bucket = list(query.execute())[0]
+        return bucket.allowed, bucket.tokens
+
+
+class RecentWrite(BaseModel):
+    """
+    Model representing the latest write of a user, whose reads are served by the primary until
+    the marker expires, whichever container serves them. There is at most one marker per user.
+    The table holds no data worth recovering, so it is unlogged on PostgreSQL.
+    """
+    class Meta:
+        table_name = 'recent_writes'
+
+    key = CharField(primary_key=True)
+    # A Unix timestamp, which a single precision REAL column would round to minutes.
+    expires_at = DoubleField()
+
+    @classmethod
+    def mark(cls, key, expires_at):
+        """
+        Sets the expiry, as a Unix timestamp, of the marker with the given key, creating it if it
+        doesn't exist, with a single upsert.
+        """
+        (
+            cls.insert(key=key, expires_at=expires_at)
+            .on_conflict(conflict_target=[cls.key], update={cls.expires_at: EXCLUDED.expires_at})
+            .execute()
+        )
+
+    @classmethod
+    def expiry(cls, key):
+        """
+        Returns the expiry of the marker with the given key, or None if there is none.
+        """
+        return cls.select(cls.expires_at).where(cls.key == key).scalar()
+
+
+# The writes recorded by any container keep the reads of their user on the primary.
+db.write_markers = RecentWrite
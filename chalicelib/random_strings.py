@@ -0,0 +1,318 @@
+import json
+import logging
+import secrets
+import string
+import threading
+from collections import deque
+from chalicelib.config import (RAMDON_ORG_URL, RANDOM_STRING_PROVIDER, RANDOM_ORG_TIMEOUT, RANDOM_ORG_POOL_SIZE,
+                               RANDOM_ORG_MAX_RETRIES, RANDOM_ORG_BATCH_SIZE, RANDOM_ORG_LOW_WATER)
+from chalicelib.helpers import generate_random_url
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_ALPHABET = string.digits
+ALPHANUMERIC_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase
+DEFAULT_FORMATS = {
+    True: (2, 3),
+    False: (1, 20),
+}
+# The most strings random.org returns for a single request.
+RANDOM_ORG_MAX_NUM = 10000
+
+
+class RandomStringError(Exception):
+    """
+    Raised when a provider can not generate the requested strings.
+    """
+
+
+def default_format(numeric, num=None, length=None):
+    """
+    Completes a request for random strings with the defaults of its kind: two unique
+    3-digit strings when numeric, one 20-character alphanumeric string otherwise.
+    Returns a tuple with the number of strings and their length.
+    """
+    default_num, default_length = DEFAULT_FORMATS[bool(numeric)]
+    return num or default_num, length or default_length
+
+
+def max_unique_strings(numeric, length):
+    """
+    Returns how many distinct strings of the given kind and length exist.
+    """
+    return len(NUMERIC_ALPHABET if numeric else ALPHANUMERIC_ALPHABET) ** length
+
+
+class LocalRandomStringProvider:
+    """
+    Generates random strings in the process with the operating system's CSPRNG,
+    with the same formats as random.org.
+    """
+    name = 'local'
+
+    def generate(self, numeric, num, length):
+        """
+        Generates 'num' unique strings of 'length' digits, or of digits and letters if not 'numeric'.
+        Returns the list of strings.
+        Raises RandomStringError if there are fewer distinct strings than requested.
+        """
+        alphabet = NUMERIC_ALPHABET if numeric else ALPHANUMERIC_ALPHABET
+        if num > max_unique_strings(numeric, length):
+            raise RandomStringError(f'There are fewer than {num} unique strings of length {length}')
+        strings = {}
+        while len(strings) < num:
+            strings[''.join(secrets.choice(alphabet) for _ in range(length))] = None
+        return list(strings)
+
+
+class RandomOrgProvider:
+    """
+    Generates random strings with the random.org API.
+    Requests share a pooled session with a timeout and retries on server errors, and if
+    random.org still fails, the strings are generated by the fallback provider instead.
+    """
+    name = 'random_org'
+
+    def __init__(self, fallback=None, timeout=RANDOM_ORG_TIMEOUT, session=None, base_url=RAMDON_ORG_URL):
+        """
+        Initializes the provider.
+        The session is created on first use unless one is given.
+        """
+        self.fallback = fallback
+        self.timeout = timeout
+        self.base_url = base_url
+        self._session = session
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """
+        Returns the session shared by the requests to random.org, creating it on first use.
+        """
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    from urllib3.util.retry import Retry
+
+                    session = requests.Session()
+                    retries = Retry(total=RANDOM_ORG_MAX_RETRIES, backoff_factor=0.1,
+                                    status_forcelist=(500, 502, 503, 504), allowed_methods=('GET',))
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RANDOM_ORG_POOL_SIZE, max_retries=retries)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def generate(self, numeric, num, length):
+        """
+        Requests 'num' unique strings of 'length' digits, or of digits and letters if not 'numeric'.
+        Returns the list of strings.
+        Raises RandomStringError if random.org fails and there is no fallback provider.
+        """
+        url = generate_random_url('true' if numeric else 'false', num=num, length=length, base_url=self.base_url)
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            if not response.ok:
+                raise RandomStringError(f'random.org answered {response.status_code}')
+            strings = response.text.split('\n')[:-1]
+            if len(strings) != num:
+                raise RandomStringError(f'random.org returned {len(strings)} strings instead of {num}')
+            return strings
+        except Exception as e:
+            if self.fallback is None:
+                raise RandomStringError(f'Failed to generate random strings: {e}') from e
+            logger.warning('random.org failed, falling back to the %s provider: %s', self.fallback.name, e)
+            return self.fallback.generate(numeric, num, length)
+
+
+class BufferedRandomStringProvider:
+    """
+    Serves random strings from an in-memory buffer filled with large batches from a remote
+    provider, so most requests don't wait for an HTTP round trip.
+    There is a buffer per kind and length of string. Each buffered value is handed out once and
+    values in a buffer are unique, so the strings of a response are always unique too. When a
+    buffer drops below the low-water mark it is refilled in a background thread; a request the
+    buffer can't serve goes to the remote provider directly, and to the fallback if that fails.
+    """
+
+    def __init__(self, source, fallback=None, batch_size=RANDOM_ORG_BATCH_SIZE, low_water=RANDOM_ORG_LOW_WATER):
+        """
+        Initializes the provider.
+        The 'source' is the remote provider, called without a fallback of its own so that its
+        failures are counted, and 'batch_size' is the number of strings fetched per refill.
+        """
+        self.name = f'buffered_{source.name}'
+        self.source = source
+        self.fallback = fallback
+        self.batch_size = min(batch_size, RANDOM_ORG_MAX_NUM)
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._refilling = set()
+        self._metrics = {'hits': 0, 'misses': 0, 'refills': 0, 'refill_errors': 0, 'fallbacks': 0}
+
+    def generate(self, numeric, num, length):
+        """
+        Takes 'num' unique strings of 'length' digits, or of digits and letters if not 'numeric',
+        from the buffer, or generates them directly if the buffer doesn't have enough.
+        Returns the list of strings.
+        Raises RandomStringError if the strings can not be generated and there is no fallback provider.
+        """
+        key = (numeric, length)
+        with self._lock:
+            buffer = self._buffers.setdefault(key, deque())
+            if len(buffer) >= num:
+                strings = [buffer.popleft() for _ in range(num)]
+                self._metrics['hits'] += 1
+            else:
+                strings = None
+                self._metrics['misses'] += 1
+            low_water = min(self.low_water, self._batch_size(numeric, length) // 2)
+            refill = len(buffer) < low_water and key not in self._refilling
+            if refill:
+                self._refilling.add(key)
+
+        if refill:
+            threading.Thread(target=self._refill, args=(numeric, length), daemon=True).start()
+        if strings is not None:
+            return strings
+
+        try:
+            return self.source.generate(numeric, num, length)
+        except Exception as e:
+            if self.fallback is None:
+                raise RandomStringError(f'Failed to generate random strings: {e}') from e
+            with self._lock:
+                self._metrics['fallbacks'] += 1
+            logger.warning('%s failed, falling back to the %s provider: %s', self.source.name, self.fallback.name, e)
+            return self.fallback.generate(numeric, num, length)
+
+    def _batch_size(self, numeric, length):
+        """
+        Returns the number of strings fetched per refill for the given kind and length of string,
+        which is capped by the number of unique strings that exist.
+        """
+        return min(self.batch_size, max_unique_strings(numeric, length))
+
+    def _refill(self, numeric, length):
+        """
+        Fetches a batch of strings for the buffer of the given kind and length, skipping any
+        value the buffer already holds.
+        """
+        key = (numeric, length)
+        try:
+            batch = self.source.generate(numeric, self._batch_size(numeric, length), length)
+        except Exception as e:
+            batch = None
+            logger.warning('Failed to refill the random strings buffer from %s: %s', self.source.name, e)
+        with self._lock:
+            self._refilling.discard(key)
+            if batch is None:
+                self._metrics['refill_errors'] += 1
+                return
+            buffer = self._buffers[key]
+            buffered = set(buffer)
+            buffer.extend(value for value in dict.fromkeys(batch) if value not in buffered)
+            self._metrics['refills'] += 1
+        logger.info(json.dumps({'event': 'random_strings_refill', **self.metrics()}))
+
+    def metrics(self):
+        """
+        Returns the number of requests served from the buffer ('hits') or not ('misses'), of
+        refills and failed refills, of requests served by the fallback provider, and the number
+        of strings buffered for each kind and length of string.
+        """
+        with self._lock:
+            return {
+                **self._metrics,
+                'buffered': {
+                    f"{'numeric' if numeric else 'alphanumeric'}:{length}": len(buffer)
+                    for (numeric, length), buffer in self._buffers.items()
+                },
+            }
+
+
+def random_org_provider():
+    """
+    Creates the random.org provider, buffered unless RANDOM_ORG_BATCH_SIZE is zero.
+    """
+    if RANDOM_ORG_BATCH_SIZE > 0:
+        return BufferedRandomStringProvider(RandomOrgProvider(), fallback=LocalRandomStringProvider())
+    return RandomOrgProvider(fallback=LocalRandomStringProvider())
+
+
+PROVIDERS = {
+    LocalRandomStringProvider.name: lambda: LocalRandomStringProvider(),
+    RandomOrgProvider.name: random_org_provider,
+}
+
+
+class RandomStringGenerator:
+    """
+    Generates random strings with the provider selected by RANDOM_STRING_PROVIDER.
+    """
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        """
+        Get the singleton instance of RandomStringGenerator class.
+
+        Returns:
+            RandomStringGenerator: The singleton instance.
+        """
+        if not RandomStringGenerator._instance:
+            RandomStringGenerator._instance = RandomStringGenerator()
+        return RandomStringGenerator._instance
+
+    def __init__(self, provider_name=RANDOM_STRING_PROVIDER):
+        """
+        Initialize the RandomStringGenerator class.
+
+        Args:
+            provider_name (str): The name of the provider, one of PROVIDERS.
+        """
+        if RandomStringGenerator._instance:
+            raise Exception("This class is a singleton!")
+        RandomStringGenerator._instance = self
+        if provider_name not in PROVIDERS:
+            raise ValueError(f"Unknown random string provider: {provider_name}")
+        self.provider = PROVIDERS[provider_name]()
+
+    def generate(self, numeric, num=None, length=None):
+        """
+        Generate unique random strings.
+
+        Args:
+            numeric (bool): Whether the strings only have digits, or digits and letters.
+            num (int): The number of strings, two numeric or one alphanumeric by default.
+            length (int): The length of the strings, 3 numeric or 20 alphanumeric by default.
+
+        Returns:
+            list: The generated strings.
+
+        Raises:
+            RandomStringError: If the strings can not be generated.
+        """
+        num, length = default_format(numeric, num, length)
+        return self.provider.generate(bool(numeric), num, length)
+
+    def metrics(self):
+        """
+        Get the metrics of the provider, such as the hits and refills of a buffered provider.
+
+        Returns:
+            dict: The metrics, empty if the provider has none.
+        """
+        return self.provider.metrics() if hasattr(self.provider, 'metrics') else {}
+
+    def set_provider(self, provider):
+        """
+        Replace the provider, such as with a stub in tests.
+
+        Args:
+            provider: An object with a generate(numeric, num, length) method.
+        """
+        self.provider = provider
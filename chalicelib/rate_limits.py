@@ -0,0 +1,144 @@
+import logging
+import math
+import threading
+import time
+from chalicelib.config import RATE_LIMIT_STORE, RATE_LIMITS
+from chalicelib.models import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+
+def parse_limit(value):
+    """
+    Parses a rate limit written as '<capacity>/<tokens refilled per second>'.
+    Returns a tuple with the capacity and refill rate, or None if the value is empty.
+    Raises ValueError if the value is not a valid limit.
+    """
+    if not value:
+        return None
+    capacity, refill_rate = (float(part) for part in value.split('/'))
+    if capacity < 1 or refill_rate <= 0:
+        raise ValueError(f'Invalid rate limit: {value}')
+    return capacity, refill_rate
+
+
+class InMemoryBucketStore:
+    """
+    Keeps the token buckets in the process, so each container limits the requests it serves
+    on its own. Used by tests and single-process deployments.
+    """
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, capacity, refill_rate, now, cost=1):
+        """
+        Refills the bucket with the given key for the time elapsed since its last update and takes
+        'cost' tokens from it if it has enough, creating it full if it doesn't exist.
+        Returns a tuple with whether the tokens were taken and the tokens left in the bucket.
+        """
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(now - updated_at, 0) * refill_rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            return allowed, tokens
+
+
+class SqlBucketStore:
+    """
+    Keeps the token buckets in the 'rate_limit_buckets' table, so every container shares them.
+    """
+    name = 'sql'
+
+    def take(self, key, capacity, refill_rate, now, cost=1):
+        """
+        Refills the bucket with the given key and takes 'cost' tokens from it, as RateLimitBucket.take does.
+        Returns a tuple with whether the tokens were taken and the tokens left in the bucket.
+        """
+        return RateLimitBucket.take(key, capacity, refill_rate, now, cost)
+
+
+STORES = {
+    InMemoryBucketStore.name: InMemoryBucketStore,
+    SqlBucketStore.name: SqlBucketStore,
+}
+
+
+class RateLimiter:
+    """
+    Limits the requests of each user to the rate limited routes with a token bucket per user
+    and route, in the store selected by RATE_LIMIT_STORE.
+    """
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        """
+        Get the singleton instance of RateLimiter class.
+
+        Returns:
+            RateLimiter: The singleton instance.
+        """
+        if not RateLimiter._instance:
+            RateLimiter._instance = RateLimiter()
+        return RateLimiter._instance
+
+    def __init__(self, store_name=RATE_LIMIT_STORE, limits=RATE_LIMITS):
+        """
+        Initialize the RateLimiter class.
+
+        Args:
+            store_name (str): The name of the bucket store, one of STORES.
+            limits (dict): The limit of each route, keyed by method and path, as parsed by parse_limit.
+        """
+        if RateLimiter._instance:
+            raise Exception("This class is a singleton!")
+        RateLimiter._instance = self
+        if store_name not in STORES:
+            raise ValueError(f"Unknown rate limit store: {store_name}")
+        self.store = STORES[store_name]()
+        self.limits = {}
+        for route, limit in limits.items():
+            parsed = parse_limit(limit)
+            if parsed is not None:
+                self.limits[route] = parsed
+
+    def check(self, username, route):
+        """
+        Take a token from the bucket of the user on the route.
+        If the store fails, the request is let through rather than failing it.
+
+        Args:
+            username (str): The username of the user.
+            route (str): The method and path of the route, such as 'POST /v1/records'.
+
+        Returns:
+            int: The seconds to wait before the bucket has a token again, or None if the
+            request is allowed or the route is not rate limited.
+        """
+        limit = self.limits.get(route)
+        if limit is None or username is None:
+            return None
+        capacity, refill_rate = limit
+        try:
+            allowed, tokens = self.store.take(f'{username}:{route}', capacity, refill_rate, time.time())
+        except Exception as e:
+            logger.warning('Rate limit store %s failed, allowing the request: %s', self.store.name, e)
+            return None
+        if allowed:
+            return None
+        return max(1, math.ceil((1 - tokens) / refill_rate))
+
+    def set_store(self, store):
+        """
+        Replace the bucket store, such as with an in-memory store in tests.
+
+        Args:
+            store: An object with a take(key, capacity, refill_rate, now, cost=1) method.
+        """
+        self.store = store
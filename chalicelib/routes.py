@@ -1,18 +1,106 @@
-import boto3
-import requests
-from chalice import BadRequestError, Blueprint, ChaliceViewError, Response
+from chalice import BadRequestError, Blueprint, ChaliceViewError, Rate, Response
 from chalicelib.authorizers import CognitoAuthSingleton
-from chalicelib.helpers import generate_random_url, perform_operation
-from chalicelib.models import Operation, Record, User
+from chalicelib.catalog import OperationCatalog
+from chalicelib.clients import CognitoClientProvider
+from chalicelib.encoding import json_response
+from chalicelib.exports import EXPORT_CONTENT_TYPES, EXPORT_FORMATS, export_records
+from chalicelib.helpers import perform_operation
+from chalicelib.idempotency import IdempotencyKeyStore, request_hash
+from chalicelib.instrumentation import is_sampled, log_authorizer_timing, measure_request, phase
+from chalicelib.maintenance import archive_records, ensure_record_partitions
+from chalicelib.models import IdempotencyKey, Operation, Record, UsageSummary, User, db
+from chalicelib.queries import (COUNT_MODES, after_cursor, in_date_range, parse_date, parse_ids, query_values,
+                                record_conditions, row_cursor, serialize_records, split_values, user_records_query,
+                                user_records_total)
+from chalicelib.rate_limits import RateLimiter
+from chalicelib.random_strings import (RandomStringError, RandomStringGenerator, default_format,
+                                       max_unique_strings)
 from datetime import datetime
-from peewee import fn
-from playhouse.shortcuts import model_to_dict
-from chalicelib.config import USER_POOL_REGION, COGNITO_CLIENT_ID
+from time import perf_counter
+from chalicelib.config import (COGNITO_CLIENT_ID, COGNITO_CLIENT_PREWARM, RECORDS_BATCH_MAX_SIZE, EXPORT_MAX_BYTES,
+                               EXPORT_CHUNK_SIZE, RECORDS_BULK_DELETE_MAX_IDS, RANDOM_STRING_MAX_NUM,
+                               RANDOM_STRING_MAX_LENGTH, IDEMPOTENCY_KEY_TTL)
 
 routes = Blueprint(__name__)
 api_version = 'v1'
 base_path = f'/{api_version}'
 auth_singleton = CognitoAuthSingleton.get_instance()
+operation_catalog = OperationCatalog.get_instance()
+cognito_clients = CognitoClientProvider.get_instance()
+random_strings = RandomStringGenerator.get_instance()
+idempotency_keys = IdempotencyKeyStore.get_instance()
+rate_limiter = RateLimiter.get_instance()
+if COGNITO_CLIENT_PREWARM:
+    cognito_clients.warm()
+
+
+@routes.middleware('http')
+def performance_instrumentation(event, get_response):
+    """
+    Measures a sample of the requests, as set by PERF_SAMPLE_RATE.
+    Sampled responses get a 'Server-Timing' header with the total time, the number and time
+    of SQL statements and the time of each measured phase, which are also logged.
+    Registered before the other middleware so it wraps them.
+    """
+    if not is_sampled():
+        return get_response(event)
+    with measure_request(f'{event.method} {event.path}') as metrics:
+        response = get_response(event)
+        response.headers['Server-Timing'] = metrics.server_timing()
+        return response
+
+
+@routes.middleware('http')
+def database_connection(event, get_response):
+    """
+    Checks out a pooled database connection for the duration of the request.
+    The connection is returned to the pool afterwards, so warm containers reuse it
+    for the next request instead of opening a new one.
+    """
+    with phase('connect'):
+        db.connect(reuse_if_open=True)
+    try:
+        return get_response(event)
+    finally:
+        if not db.is_closed():
+            db.close()
+        db.close_replicas()
+
+
+@routes.middleware('http')
+def rate_limiting(event, get_response):
+    """
+    Limits the requests of each user to the routes in RATE_LIMITS with a token bucket.
+    Returns a 429 response with a 'Retry-After' header once the user's bucket is empty.
+    """
+    username = (event.context.get('authorizer') or {}).get('username')
+    with phase('rate_limit'):
+        retry_after = rate_limiter.check(username, f'{event.method} {event.path}')
+    if retry_after is not None:
+        return Response(
+            body={'message': 'Too many requests'},
+            headers={'Retry-After': str(retry_after)},
+            status_code=429
+        )
+    return get_response(event)
+
+
+@routes.middleware('http')
+def read_replica_routing(event, get_response):
+    """
+    Serves the reads of GET requests from the read replicas, if any are configured, and
+    remembers the writes of the user of other requests so that the user's next reads are
+    served by the primary, whichever container serves them.
+    """
+    username = (event.context.get('authorizer') or {}).get('username')
+    if event.method == 'GET':
+        with db.read_only(username):
+            return get_response(event)
+    response = get_response(event)
+    if response.status_code < 400:
+        db.record_write(username)
+    return response
+
 
 @routes.authorizer()
 def cognito_auth_wrapper(auth_request):
@@ -20,83 +108,202 @@ def cognito_auth_wrapper(auth_request):
     Wrapper function for Cognito authentication.
     Authenticates the request and returns the policy document.
     """
+    started = perf_counter()
     policy_document = auth_singleton.authenticate_request(auth_request)
+    log_authorizer_timing(perf_counter() - started, 'policyDocument' in policy_document)
     return policy_document
 
 
 @routes.route(f'{base_path}/operations', methods=['GET'], authorizer=cognito_auth_wrapper)
 def get_operations():
     """
-    Retrieves all operations.
-    Returns a response containing the serialized data.
+    Retrieves all operations from the operation catalog.
+    Returns a response containing the serialized data and its ETag, or an empty
+    304 response if the 'If-None-Match' header already matches the ETag.
     """
-    operations = Operation.select().execute()
-    serialized_data = [model_to_dict(op) for op in operations]
+    etag = operation_catalog.etag()
+    if_none_match = routes.current_request.headers.get('If-None-Match', '')
+    client_etags = [tag.strip().replace('W/', '', 1) for tag in if_none_match.split(',')]
+    if etag in client_etags or '*' in client_etags:
+        return Response(
+            body='',
+            headers={'ETag': etag},
+            status_code=304
+        )
+
     return Response(
-        body={'data': serialized_data},
+        body=operation_catalog.encoded(),
+        headers={'ETag': etag},
         status_code=200
     )
 
 
+def _operation_ids(operation_types, operation_ids):
+    """
+    Resolves the values of the 'operation_type' and 'operation_id' filters to the ids of the
+    matching operations with the operation catalog.
+    Returns the set of operation ids, or None if neither filter is given.
+    Raises ValueError if an operation id is not an integer.
+    """
+    return operation_catalog.matching_ids(
+        operation_types,
+        parse_ids(operation_ids, 'operation_id') if operation_ids else None
+    )
+
+
 @routes.route(f'{base_path}/records', methods=['GET'], authorizer=cognito_auth_wrapper)
 def get_records():
     """
     Retrieves paginated records based on the query parameters.
-    Returns a response containing the serialized data and total record count.
+    Records can be filtered by 'operation_type', matching the operations whose type contains
+    it, by 'operation_id' and by a 'date_from' and 'date_to' range. The operation filters can be
+    repeated or hold comma-separated values to match any of them.
+    Pages are selected either with 'page' or with the opaque 'cursor' returned as
+    'next_cursor' by the previous page, which avoids scanning the skipped rows.
+    The 'count' parameter selects how 'total_records' is computed: 'exact' reads it from the
+    usage summaries of the user, or counts the matching records when filtering by date,
+    'window' computes it in the page query of the first page and like 'exact' for a cursor page,
+    whose query only sees the rows after the cursor, and 'none' skips it.
+    Returns a response containing the serialized data, total record count and next cursor.
     """
-    page = int(routes.current_request.query_params.get('page', 1))
-    per_page = int(routes.current_request.query_params.get('per_page', 10))
-    operation_type = routes.current_request.query_params.get('operation_type')
+    query_params = routes.current_request.query_params or {}
+    page = int(query_params.get('page', 1))
+    per_page = int(query_params.get('per_page', 10))
+    cursor = query_params.get('cursor')
+    count_mode = query_params.get('count', 'exact')
     cognito_user_id = routes.current_request.context['authorizer']['username']
 
-    query = (
-        Record.select()
-        .join(Operation)
-        .join(User, on=(Record.user_id == User.id))
-        .where(
-            (User.cognito_user_id == cognito_user_id) &
-            fn.lower(Operation.type).contains(operation_type.lower()) &
-            (Record.active == True)
-        )
+    if count_mode not in COUNT_MODES:
+        raise BadRequestError(f"Invalid count mode: {count_mode}. Expected one of {', '.join(COUNT_MODES)}")
+    if page < 1 or per_page < 1:
+        raise BadRequestError('page and per_page must be positive')
+    try:
+        operation_ids = _operation_ids(query_values(query_params, 'operation_type'),
+                                       query_values(query_params, 'operation_id'))
+        date_from = parse_date(query_params.get('date_from'), 'date_from')
+        date_to = parse_date(query_params.get('date_to'), 'date_to')
+    except ValueError as e:
+        raise BadRequestError(str(e))
+
+    def count_records():
+        if date_from is None and date_to is None:
+            return user_records_total(cognito_user_id, operation_ids)
+        return in_date_range(user_records_query(cognito_user_id, operation_ids), date_from, date_to).count()
+
+    window_count = count_mode == 'window' and not cursor
+    query = in_date_range(
+        user_records_query(cognito_user_id, operation_ids, with_total=window_count),
+        date_from,
+        date_to
     )
 
-    offset = (page - 1) * per_page
-    limit = per_page
+    if cursor:
+        try:
+            paginated_results = after_cursor(query, cursor)
+        except ValueError as e:
+            raise BadRequestError(str(e))
+    else:
+        paginated_results = query.offset((page - 1) * per_page)
+
+    # One extra row tells whether a next page exists without another query.
+    rows = list(paginated_results.limit(per_page + 1).tuples())
+    has_next_page = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if window_count:
+        # The window count is the last column of each row.
+        total_count = rows[0][-1] if rows else count_records()
+    elif count_mode != 'none':
+        total_count = count_records()
+    else:
+        total_count = None
+
+    with phase('serialize'):
+        return json_response(
+            body={
+                'data': serialize_records(rows),
+                'total_records': total_count,
+                'next_cursor': row_cursor(rows[-1]) if has_next_page else None
+            },
+            status_code=200
+        )
+
 
-    paginated_results = query.offset(offset).limit(limit)
-    total_count = query.count()
+@routes.route(f'{base_path}/records/export', methods=['GET'], authorizer=cognito_auth_wrapper)
+def export_user_records():
+    """
+    Exports the full record history of the user as NDJSON or CSV, selected by the 'format'
+    parameter, optionally filtered like get_records by 'operation_type', 'operation_id' and
+    a 'date_from' and 'date_to' range.
+    Records are read in chunks, and a body is cut before it would exceed EXPORT_MAX_BYTES; the
+    'X-Next-Cursor' header then holds the 'cursor' parameter that continues the export.
+    Returns a response containing the exported records.
+    """
+    query_params = routes.current_request.query_params or {}
+    export_format = query_params.get('format', 'ndjson')
+    cursor = query_params.get('cursor')
+    cognito_user_id = routes.current_request.context['authorizer']['username']
 
-    serialized_data = [record.to_dict() for record in paginated_results]
+    if export_format not in EXPORT_FORMATS:
+        raise BadRequestError(f"Invalid format: {export_format}. Expected one of {', '.join(EXPORT_FORMATS)}")
 
-    return Response(
-        body={
-            'data': serialized_data,
-            'total_records': total_count
-        },
-        status_code=200
-    )
+    try:
+        operation_ids = _operation_ids(query_values(query_params, 'operation_type'),
+                                       query_values(query_params, 'operation_id'))
+        query = in_date_range(
+            user_records_query(cognito_user_id, operation_ids),
+            parse_date(query_params.get('date_from'), 'date_from'),
+            parse_date(query_params.get('date_to'), 'date_to')
+        )
+        if cursor:
+            query = after_cursor(query, cursor)
+    except ValueError as e:
+        raise BadRequestError(str(e))
+
+    with phase('serialize'):
+        body, next_cursor = export_records(query, export_format, EXPORT_MAX_BYTES, EXPORT_CHUNK_SIZE)
+
+    headers = {'Content-Type': EXPORT_CONTENT_TYPES[export_format]}
+    if next_cursor is not None:
+        headers['X-Next-Cursor'] = next_cursor
+    return Response(body=body, headers=headers, status_code=200)
 
 
 @routes.route(f'{base_path}/records', methods=['POST'], authorizer=cognito_auth_wrapper)
 def create_record():
     """
     Creates a new record based on the request data.
+    Requests with an 'Idempotency-Key' header run once per user and key: retries get the
+    response of the first request back, with the 'Idempotent-Replayed' header, without
+    performing the operation or charging the user again.
+    Returns a response containing the created record data.
+    """
+    request = routes.current_request
+    cognito_user_id = request.context['authorizer']['username']
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is None:
+        return _create_record(request.json_body, cognito_user_id)
+    return idempotency_keys.run(cognito_user_id, idempotency_key, request_hash(request.raw_body),
+                                lambda: _create_record(request.json_body, cognito_user_id))
+
+
+def _create_record(request_data, cognito_user_id):
+    """
+    Creates a new record of the user with the given Cognito id based on the request data.
     Returns a response containing the created record data.
     """
-    request_data = routes.current_request.json_body
     operation_id = request_data['operation_id']
     num1 = request_data['num1']
     num2 = request_data['num2']
-    cognito_user_id = routes.current_request.context['authorizer']['username']
 
     try:
-        operation = Operation.get(Operation.id == operation_id)
+        operation = operation_catalog.get(operation_id)
         amount = operation.cost
         user = User.get(User.cognito_user_id == cognito_user_id)
         operation_response = perform_operation(num1, num2, operation.symbol)
 
         new_record = Record.create(
-            operation=operation_id,
+            operation=operation,
             user_id=user,
             amount=amount,
             operation_response=operation_response,
@@ -120,47 +327,227 @@ def create_record():
         )
 
 
+@routes.schedule(Rate(1, unit=Rate.HOURS))
+def purge_idempotency_keys(event):
+    """
+    Deletes the idempotency keys older than IDEMPOTENCY_KEY_TTL, which are no longer replayed.
+    """
+    with db.connection_context():
+        IdempotencyKey.purge_expired(IDEMPOTENCY_KEY_TTL)
+
+
+@routes.schedule(Rate(1, unit=Rate.DAYS))
+def maintain_records(event):
+    """
+    Creates the upcoming monthly partitions of the records table and moves the records that are
+    no longer listed to the archive, a bounded number of batches per run.
+    """
+    with db.connection_context():
+        ensure_record_partitions(db)
+        archive_records()
+
+
+@routes.route(f'{base_path}/records/batch', methods=['POST'], authorizer=cognito_auth_wrapper)
+def create_records_batch():
+    """
+    Creates several records at once from the 'items' list of the request data, where each
+    item has the same 'operation_id', 'num1' and 'num2' fields as a single record request.
+    The total cost of the valid items is debited with one balance update and their records
+    are inserted together; items that fail are reported without affecting the others.
+    Returns a response containing, in request order, the created record or the error of each item.
+    """
+    items = (routes.current_request.json_body or {}).get('items')
+    cognito_user_id = routes.current_request.context['authorizer']['username']
+
+    if not isinstance(items, list) or not items:
+        raise BadRequestError('Missing required parameter: items')
+    if len(items) > RECORDS_BATCH_MAX_SIZE:
+        raise BadRequestError(f'A batch can have at most {RECORDS_BATCH_MAX_SIZE} items')
+
+    results = [None] * len(items)
+    new_records = []
+    positions = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict) or not {'operation_id', 'num1', 'num2'} <= item.keys():
+                raise BadRequestError('Each item requires operation_id, num1 and num2')
+            operation = operation_catalog.get(item['operation_id'])
+            operation_response = perform_operation(item['num1'], item['num2'], operation.symbol)
+            new_records.append(Record(
+                operation=operation,
+                operation_response=operation_response,
+                date=datetime.now()
+            ))
+            positions.append(index)
+        except (ChaliceViewError, Operation.DoesNotExist, ZeroDivisionError) as e:
+            results[index] = {'error': str(e)}
+
+    try:
+        user = User.get(User.cognito_user_id == cognito_user_id)
+        Record.create_many(user, new_records)
+    except (ChaliceViewError, User.DoesNotExist) as e:
+        return Response(
+            body={
+                'error': str(e),
+                'message': 'Failed to create records'
+            },
+            status_code=400
+        )
+
+    for index, record in zip(positions, new_records):
+        results[index] = {'data': record.to_dict()}
+
+    return Response(
+        body={
+            'message': f'{len(new_records)} of {len(items)} records created successfully',
+            'data': results
+        },
+        status_code=200 if new_records else 400
+    )
+
+
 @routes.route(f'{base_path}/records/{{record_id}}', methods=['DELETE'], authorizer=cognito_auth_wrapper)
 def soft_delete_record(record_id):
     """
-    Soft deletes a record with the given record_id.
+    Soft deletes the record with the given record_id, if it is an active record of the user.
     Returns a response indicating the success or failure of the deletion.
     """
-    try:
-        record = Record.get(Record.id == record_id)
-        record.active = False
-        record.save()
+    cognito_user_id = routes.current_request.context['authorizer']['username']
+    if not record_id.isdigit():
+        raise BadRequestError(f'Invalid record id: {record_id}')
 
+    if Record.soft_delete_where(cognito_user_id, Record.id == int(record_id)):
         return Response(
             body={'message': f'Record {record_id} was deleted successfully'}
         )
-    except Record.DoesNotExist:
-        return Response(
-            body={'message': f'Record {record_id} not found'},
-            status_code=404
-        )
+    return Response(
+        body={'message': f'Record {record_id} not found'},
+        status_code=404
+    )
+
+
+@routes.route(f'{base_path}/records/bulk-delete', methods=['POST'], authorizer=cognito_auth_wrapper)
+def bulk_soft_delete_records():
+    """
+    Soft deletes several records of the user at once, selected either by the 'ids' list of the
+    request data or by its 'filter' object, which takes the 'operation_type', 'operation_id',
+    'date_from' and 'date_to' filters of the export, the operation ones as a value or a list of
+    values. An empty filter deletes the whole history of the user.
+    Returns a response containing the ids of the deleted records.
+    """
+    request_data = routes.current_request.json_body or {}
+    ids = request_data.get('ids')
+    record_filter = request_data.get('filter')
+    cognito_user_id = routes.current_request.context['authorizer']['username']
+
+    if (ids is None) == (record_filter is None):
+        raise BadRequestError('Provide either ids or filter')
+    if ids is not None:
+        if not isinstance(ids, list) or not ids or not all(type(record_id) is int for record_id in ids):
+            raise BadRequestError('ids must be a non-empty list of record ids')
+        if len(ids) > RECORDS_BULK_DELETE_MAX_IDS:
+            raise BadRequestError(f'At most {RECORDS_BULK_DELETE_MAX_IDS} ids can be deleted at once')
+        conditions = [Record.id.in_(ids)]
+    else:
+        if not isinstance(record_filter, dict):
+            raise BadRequestError('filter must be an object')
+        try:
+            conditions = record_conditions(
+                operation_ids=_operation_ids(split_values(record_filter.get('operation_type')),
+                                             split_values(record_filter.get('operation_id'))),
+                date_from=parse_date(record_filter.get('date_from'), 'date_from'),
+                date_to=parse_date(record_filter.get('date_to'), 'date_to')
+            )
+        except ValueError as e:
+            raise BadRequestError(str(e))
+
+    deleted_ids = Record.soft_delete_where(cognito_user_id, *conditions)
+
+    return Response(
+        body={
+            'message': f'{len(deleted_ids)} records were deleted successfully',
+            'data': {'deleted_ids': deleted_ids}
+        },
+        status_code=200
+    )
+
+
+@routes.route(f'{base_path}/stats', methods=['GET'], authorizer=cognito_auth_wrapper)
+def get_stats():
+    """
+    Retrieves the usage statistics of the user from its usage summaries, which hold one row per
+    operation used, so the cost does not grow with the number of records.
+    Returns a response containing the record count, spent amount and last activity of each
+    operation type, and their totals.
+    """
+    cognito_user_id = routes.current_request.context['authorizer']['username']
+    # Operations are joined rather than read from the catalog, which may not have loaded an
+    # operation another container has already recorded usage of.
+    summaries = (
+        UsageSummary.select(UsageSummary, Operation)
+        .join(User)
+        .switch(UsageSummary)
+        .join(Operation)
+        .where(User.cognito_user_id == cognito_user_id)
+        .order_by(UsageSummary.operation)
+    )
+
+    operations = []
+    for summary in summaries:
+        operations.append({
+            'operation': summary.operation.to_dict(),
+            'record_count': summary.record_count,
+            'total_amount': str(summary.total_amount),
+            'last_activity': summary.last_activity.strftime('%Y-%m-%d %H:%M:%S') if summary.last_activity else None,
+        })
+    last_activities = [operation['last_activity'] for operation in operations if operation['last_activity']]
+
+    return Response(
+        body={
+            'data': {
+                'operations': operations,
+                'record_count': sum(operation['record_count'] for operation in operations),
+                'total_amount': str(sum(summary.total_amount for summary in summaries)),
+                'last_activity': max(last_activities, default=None),
+            }
+        },
+        status_code=200
+    )
 
 
 @routes.route(f'{base_path}/random-string', methods=['GET'], authorizer=cognito_auth_wrapper)
 def random_string():
     """
-    Generates random strings based on the query parameter 'numeric'.
+    Generates random strings based on the query parameter 'numeric', with the provider set by
+    RANDOM_STRING_PROVIDER. The optional 'num' and 'len' parameters select the number of strings
+    and their length.
     Returns a response containing the generated strings.
     """
-    query_params = routes.current_request.query_params
+    query_params = routes.current_request.query_params or {}
     is_numeric = query_params.get('numeric')
 
     if is_numeric is None:
         raise BadRequestError('Missing required parameter: numeric')
 
-    url = generate_random_url(is_numeric.lower())
-    response = requests.get(url)
+    numeric = is_numeric.lower() == 'true'
+    try:
+        num = int(query_params.get('num', 0)) or None
+        length = int(query_params.get('len', 0)) or None
+    except ValueError:
+        raise BadRequestError('num and len must be integers')
+    num, length = default_format(numeric, num, length)
+    if not 1 <= num <= RANDOM_STRING_MAX_NUM or not 1 <= length <= RANDOM_STRING_MAX_LENGTH:
+        raise BadRequestError(f'num must be between 1 and {RANDOM_STRING_MAX_NUM} '
+                              f'and len between 1 and {RANDOM_STRING_MAX_LENGTH}')
+    if num > max_unique_strings(numeric, length):
+        raise BadRequestError(f'There are fewer than {num} unique strings of length {length}')
 
-    if response.ok:
-        strings = response.text.split('\n')[:-1]
-        return Response(body={'data': strings})
-    else:
-        return Response(body={'error': 'Failed to generate random strings'}, status_code=response.status_code)
+    try:
+        with phase('random_string'):
+            strings = random_strings.generate(numeric, num, length)
+    except RandomStringError:
+        return Response(body={'error': 'Failed to generate random strings'}, status_code=502)
+    return Response(body={'data': strings})
 
 
 @routes.route(f'{base_path}/signup', methods=['POST'])
@@ -172,20 +559,22 @@ def signup():
     request_body = routes.current_request.json_body
     username = request_body['username']
     password = request_body['password']
-    client = boto3.client('cognito-idp', region_name=USER_POOL_REGION)
+    client = cognito_clients.get_client()
 
     try:
-        response = client.sign_up(
-            ClientId=COGNITO_CLIENT_ID,
-            Username=username,
-            Password=password
-        )
+        with phase('cognito'):
+            response = client.sign_up(
+                ClientId=COGNITO_CLIENT_ID,
+                Username=username,
+                Password=password
+            )
         user = User.create(
             username=username,
             status=True,
             cognito_user_id=response['UserSub']
         )
         user.save()
+        db.record_write(username)
         return Response(
             body={'message': 'Sign up successful', 'data': response},
             status_code=200
@@ -211,18 +600,24 @@ def signin():
     request_body = routes.current_request.json_body
     username = request_body['username']
     password = request_body['password']
-    client = boto3.client('cognito-idp', region_name=USER_POOL_REGION)
+    client = cognito_clients.get_client()
 
     try:
-        response = client.initiate_auth(
-            ClientId=COGNITO_CLIENT_ID,
-            AuthFlow='USER_PASSWORD_AUTH',
-            AuthParameters={
-                'USERNAME': username,
-                'PASSWORD': password
-            }
-        )
-        user = User.get(User.username == username)
+        with phase('cognito'):
+            response = client.initiate_auth(
+                ClientId=COGNITO_CLIENT_ID,
+                AuthFlow='USER_PASSWORD_AUTH',
+                AuthParameters={
+                    'USERNAME': username,
+                    'PASSWORD': password
+                }
+            )
+        # The user may have signed up on another container, so a replica that has not
+        # caught up yet is not taken as the user not existing.
+        with db.read_only(username):
+            user = User.get_or_none(User.username == username)
+        if user is None:
+            user = User.get(User.username == username)
 
         return Response(
             body={
@@ -257,12 +652,13 @@ def signout():
     Returns a response indicating the success or failure of the sign out.
     """
     access_token = routes.current_request.json_body['access_token']
-    client = boto3.client('cognito-idp', region_name=USER_POOL_REGION)
+    client = cognito_clients.get_client()
 
     try:
-        response = client.global_sign_out(
-            AccessToken=access_token
-        )
+        with phase('cognito'):
+            response = client.global_sign_out(
+                AccessToken=access_token
+            )
 
         return Response(
             body={'message': 'Sign out successful'},
@@ -285,14 +681,15 @@ def confirm():
     request_body = routes.current_request.json_body
     username = request_body['username']
     confirmation_code = request_body['confirmation_code']
-    client = boto3.client('cognito-idp', region_name=USER_POOL_REGION)
+    client = cognito_clients.get_client()
 
     try:
-        response = client.confirm_sign_up(
-            ClientId=COGNITO_CLIENT_ID,
-            Username=username,
-            ConfirmationCode=confirmation_code
-        )
+        with phase('cognito'):
+            response = client.confirm_sign_up(
+                ClientId=COGNITO_CLIENT_ID,
+                Username=username,
+                ConfirmationCode=confirmation_code
+            )
 
         return Response(
             body={'message': 'User confirmed successfully. You can now sign in.'},
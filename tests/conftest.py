@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from peewee import SqliteDatabase
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('USER_POOL_ID', 'us-east-2_test')
+os.environ.setdefault('USER_POOL_REGION', 'us-east-2')
+os.environ.setdefault('COGNITO_CLIENT_ID', 'test-client-id')
+for name in ('POSTGRES_HOST', 'POSTGRES_PORT', 'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_PASSWORD'):
+    os.environ.setdefault(name, 'test')
+
+from chalice.config import Config
+from chalice.local import LocalGateway
+from app import app
+from chalicelib import routes as routes_module
+from chalicelib.catalog import OperationCatalog
+from chalicelib.config import COGNITO_CLIENT_ID, COGNITO_ISSUER
+from chalicelib.database import ReplicaRoutingMixin
+from chalicelib.instrumentation import QueryInstrumentationMixin
+from chalicelib.rate_limits import InMemoryBucketStore
+from chalicelib.models import (IdempotencyKey, Operation, RateLimitBucket, RecentWrite, Record, RecordArchive,
+                               UsageSummary, User)
+
+MODELS = [User, Operation, Record, RecordArchive, UsageSummary, IdempotencyKey, RateLimitBucket, RecentWrite]
+
+
+class InstrumentedSqliteDatabase(ReplicaRoutingMixin, QueryInstrumentationMixin, SqliteDatabase):
+    pass
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    test_db = InstrumentedSqliteDatabase(str(tmp_path / 'test.db'), write_markers=RecentWrite)
+    monkeypatch.setattr(routes_module, 'db', test_db)
+    with test_db.bind_ctx(MODELS):
+        test_db.create_tables(MODELS)
+        OperationCatalog.get_instance().invalidate()
+        yield test_db
+    test_db.close()
+
+
+@pytest.fixture
+def user(database):
+    return User.create(username='test@test.com', status=True, cognito_user_id='test-user')
+
+
+@pytest.fixture
+def operations(database):
+    return {
+        symbol: Operation.create(type=type_, cost=cost, symbol=symbol, is_arithmetic=True)
+        for type_, cost, symbol in [
+            ('addition', 10, '+'),
+            ('subtraction', 10, '-'),
+            ('multiplication', 20, '*'),
+            ('division', 20, '/'),
+            ('square_root', 30, '√'),
+        ]
+    }
+
+
+@pytest.fixture
+def records(user, operations):
+    start = datetime(2023, 1, 1)
+    rows = []
+    for index in range(30):
+        operation = list(operations.values())[index % len(operations)]
+        rows.append({
+            'operation': operation.id,
+            'user_id': user.id,
+            'amount': operation.cost,
+            'user_balance': 5000 - index,
+            'operation_response': str(index),
+            'date': start + timedelta(minutes=index),
+            'active': True,
+        })
+    Record.insert_many(rows).execute()
+    UsageSummary.rebuild()
+    return rows
+
+
+@pytest.fixture
+def gateway(monkeypatch, user):
+    def decode_token(token):
+        return {
+            'sub': token,
+            'username': token,
+            'exp': time.time() + 3600,
+            'iss': COGNITO_ISSUER,
+            'token_use': 'access',
+            'client_id': COGNITO_CLIENT_ID,
+        }
+
+    routes_module.auth_singleton.clear_cache()
+    monkeypatch.setattr(routes_module.auth_singleton, '_decode_token', decode_token)
+    monkeypatch.setattr(routes_module.rate_limiter, 'store', InMemoryBucketStore())
+    return LocalGateway(app, config=Config())
+
+
+@pytest.fixture
+def auth_headers(user):
+    return {'Content-Type': 'application/json', 'Authorization': user.cognito_user_id}
@@ -0,0 +1,144 @@
+import json
+import time
+from types import SimpleNamespace
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from chalicelib import authorizers
+from chalicelib.authorizers import CognitoAuthSingleton
+from chalicelib.config import COGNITO_CLIENT_ID, COGNITO_ISSUER
+
+
+def generate_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    return private_key, {**jwk, 'kid': kid, 'alg': 'RS256', 'use': 'sig'}
+
+
+@pytest.fixture
+def key_set():
+    return {kid: generate_key(kid) for kid in ('key-1', 'key-2')}
+
+
+@pytest.fixture
+def authorizer(monkeypatch, key_set):
+    published = {'kids': ['key-1'], 'fetches': 0}
+
+    def fetch_jwks():
+        published['fetches'] += 1
+        return {'keys': [key_set[kid][1] for kid in published['kids']]}
+
+    singleton = CognitoAuthSingleton.get_instance()
+    singleton.clear_cache()
+    monkeypatch.setattr(singleton, '_fetch_jwks', fetch_jwks)
+    yield singleton, published
+    singleton.clear_cache()
+
+
+def make_token(key_set, kid='key-1', **claims):
+    payload = {
+        'sub': 'user-sub',
+        'username': 'user-sub',
+        'iss': COGNITO_ISSUER,
+        'token_use': 'access',
+        'client_id': COGNITO_CLIENT_ID,
+        'exp': int(time.time()) + 3600,
+        **claims,
+    }
+    return jwt.encode(payload, key_set[kid][0], algorithm='RS256', headers={'kid': kid})
+
+
+def authenticate(singleton, token):
+    return singleton.authenticate_request(SimpleNamespace(token=f'Bearer {token}'))
+
+
+def test_valid_token_is_allowed(authorizer, key_set):
+    singleton, _ = authorizer
+    policy = authenticate(singleton, make_token(key_set))
+
+    assert policy['principalId'] == 'user-sub'
+    assert policy['context']['username'] == 'user-sub'
+    assert policy['policyDocument']['Statement'][0]['Effect'] == 'Allow'
+
+
+def test_repeated_token_skips_verification(authorizer, key_set, monkeypatch):
+    singleton, published = authorizer
+    token = make_token(key_set)
+    first_policy = authenticate(singleton, token)
+
+    def fail_decode(token):
+        raise AssertionError('token decoded twice')
+
+    monkeypatch.setattr(singleton, '_decode_token', fail_decode)
+    second_policy = authenticate(singleton, token)
+    second_policy['context']['principalId'] = 'mutated'
+
+    assert second_policy == {**first_policy, 'context': {**first_policy['context'], 'principalId': 'mutated'}}
+    assert 'principalId' not in authenticate(singleton, token)['context']
+    assert published['fetches'] == 1
+
+
+def test_unknown_kid_refreshes_key_set(authorizer, key_set, monkeypatch):
+    singleton, published = authorizer
+    monkeypatch.setattr(authorizers, 'JWKS_REFRESH_INTERVAL', 0)
+    authenticate(singleton, make_token(key_set))
+    published['kids'] = ['key-1', 'key-2']
+
+    policy = authenticate(singleton, make_token(key_set, kid='key-2', sub='other-sub'))
+
+    assert policy['principalId'] == 'other-sub'
+    assert published['fetches'] == 2
+
+
+def test_unknown_kid_refresh_is_rate_limited(authorizer, key_set):
+    singleton, published = authorizer
+    authenticate(singleton, make_token(key_set))
+
+    for _ in range(3):
+        assert authenticate(singleton, make_token(key_set, kid='key-2')) == {
+            'message': 'Public key not found in jwks.json'
+        }
+    assert published['fetches'] == 1
+
+
+@pytest.mark.parametrize('claims, message', [
+    ({'exp': int(time.time()) - 10}, 'Token has expired'),
+    ({'iss': 'https://example.com'}, 'Token issuer is invalid'),
+    ({'client_id': 'other-client'}, 'Token was not issued for this client id audience'),
+])
+def test_invalid_claims_are_denied(authorizer, key_set, claims, message):
+    singleton, _ = authorizer
+
+    assert authenticate(singleton, make_token(key_set, **claims)) == {'message': message}
+
+
+def test_forged_signature_is_denied(authorizer, key_set):
+    singleton, _ = authorizer
+    header, payload, _ = make_token(key_set).split('.')
+    forged_signature = make_token(key_set, kid='key-2').split('.')[2]
+
+    assert authenticate(singleton, f'{header}.{payload}.{forged_signature}') == {
+        'message': 'Signature verification failed'
+    }
+
+
+def test_cached_token_expires_with_token(authorizer, key_set, monkeypatch):
+    singleton, _ = authorizer
+    token = make_token(key_set, exp=int(time.time()) + 60)
+    authenticate(singleton, token)
+
+    monkeypatch.setattr(authorizers.time, 'time', lambda: 10 ** 10)
+
+    assert authenticate(singleton, token) == {'message': 'Token has expired'}
+
+
+def test_verified_tokens_cache_is_bounded(authorizer, key_set, monkeypatch):
+    singleton, _ = authorizer
+    monkeypatch.setattr(authorizers, 'AUTH_TOKEN_CACHE_SIZE', 2)
+
+    for index in range(5):
+        authenticate(singleton, make_token(key_set, sub=f'user-{index}'))
+
+    assert len(singleton._verified_tokens) == 2
@@ -0,0 +1,69 @@
+import json
+
+import boto3
+import pytest
+from moto import mock_cognitoidp
+
+from chalicelib import routes as routes_module
+from chalicelib.clients import CognitoClientProvider
+from chalicelib.models import User
+
+
+@pytest.fixture
+def cognito(monkeypatch, gateway):
+    """
+    Injects a client backed by moto, with a user pool and an app client for the auth routes.
+    """
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    provider = CognitoClientProvider.get_instance()
+    with mock_cognitoidp():
+        client = boto3.client('cognito-idp', region_name='us-east-2')
+        user_pool_id = client.create_user_pool(PoolName='test')['UserPool']['Id']
+        client_id = client.create_user_pool_client(
+            UserPoolId=user_pool_id, ClientName='test', ExplicitAuthFlows=['USER_PASSWORD_AUTH']
+        )['UserPoolClient']['ClientId']
+        monkeypatch.setattr(routes_module, 'COGNITO_CLIENT_ID', client_id)
+        provider.set_client(client)
+        yield client, user_pool_id
+    provider.set_client(None)
+
+
+def post(gateway, path, body):
+    response = gateway.handle_request(method='POST', path=path, headers={'Content-Type': 'application/json'},
+                                      body=json.dumps(body))
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_client_is_created_once():
+    provider = CognitoClientProvider.get_instance()
+    provider.set_client(None)
+    try:
+        client = provider.get_client()
+        assert provider.get_client() is client
+        assert client.meta.config.max_pool_connections == provider.config_options['max_pool_connections']
+        assert client.meta.config.retries['mode'] == 'adaptive'
+    finally:
+        provider.set_client(None)
+
+
+def test_auth_routes_use_the_injected_client(gateway, cognito):
+    client, user_pool_id = cognito
+    credentials = {'username': 'new@test.com', 'password': 'Passw0rd!'}
+
+    status, body = post(gateway, '/v1/signup', credentials)
+    assert status == 200
+    assert User.get(User.username == 'new@test.com').cognito_user_id == body['data']['UserSub']
+
+    status, body = post(gateway, '/v1/signin', credentials)
+    assert status == 401
+    assert body['message'] == 'User is not confirmed. Please confirm your account.'
+
+    client.admin_confirm_sign_up(UserPoolId=user_pool_id, Username='new@test.com')
+    status, body = post(gateway, '/v1/signin', credentials)
+    assert status == 200
+    assert body['user']['username'] == 'new@test.com'
+
+    status, body = post(gateway, '/v1/signup', credentials)
+    assert status == 400
+    assert body['message'] == 'Username already exists'
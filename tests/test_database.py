@@ -0,0 +1,87 @@
+import json
+
+from peewee import OperationalError
+from playhouse.pool import PooledSqliteDatabase
+
+from chalicelib.database import DatabaseConnection, HealthCheckMixin
+from chalicelib.models import db
+
+
+class HealthCheckedPooledSqliteDatabase(HealthCheckMixin, PooledSqliteDatabase):
+    pass
+
+
+def test_database_connects_lazily():
+    assert db.is_closed()
+    assert not db._in_use and not db._connections
+
+
+def test_database_pool_settings(monkeypatch):
+    monkeypatch.setenv('POSTGRES_MAX_CONNECTIONS', '2')
+    monkeypatch.setenv('POSTGRES_STALE_TIMEOUT', '60')
+    monkeypatch.setenv('POSTGRES_POOL_TIMEOUT', '5')
+    database = DatabaseConnection().get_connection()
+
+    assert database._max_connections == 2
+    assert database._stale_timeout == 60
+    assert database._wait_timeout == 5
+    assert database.is_closed()
+
+
+def test_idle_connection_failing_health_check_is_replaced(tmp_path, monkeypatch):
+    database = HealthCheckedPooledSqliteDatabase(str(tmp_path / 'pool.db'), health_check_interval=0)
+    database.connect()
+    first_connection = database.connection()
+    database.close()
+
+    def broken_ping(conn):
+        raise OperationalError('server closed the connection unexpectedly')
+
+    monkeypatch.setattr(database, '_ping', broken_ping)
+    database.connect()
+
+    assert database.connection() is not first_connection
+    database.close_all()
+
+
+def test_healthy_idle_connection_is_reused(tmp_path):
+    database = HealthCheckedPooledSqliteDatabase(str(tmp_path / 'pool.db'), health_check_interval=0)
+    database.connect()
+    first_connection = database.connection()
+    database.close()
+    database.connect()
+
+    assert database.connection() is first_connection
+    database.close_all()
+
+
+def test_only_pooled_connections_keep_their_check_in_time(tmp_path, monkeypatch):
+    database = HealthCheckedPooledSqliteDatabase(str(tmp_path / 'pool.db'), stale_timeout=60)
+    database.connect()
+    database.close()
+    assert list(database._checked_in_at) == [database.conn_key(database._connections[0][2])]
+
+    database.connect()
+    monkeypatch.setattr(database, '_is_stale', lambda timestamp: True)
+    database.close()
+
+    assert not database._connections
+    assert not database._checked_in_at
+
+
+def test_closed_connections_forget_their_check_in_time(tmp_path):
+    database = HealthCheckedPooledSqliteDatabase(str(tmp_path / 'pool.db'))
+    database.connect()
+    database.close()
+
+    database.close_all()
+
+    assert not database._checked_in_at
+
+
+def test_request_returns_connection_to_pool(gateway, auth_headers, database, operations):
+    response = gateway.handle_request(method='GET', path='/v1/operations', headers=auth_headers, body='')
+
+    assert response['statusCode'] == 200
+    assert len(json.loads(response['body'])['data']) == len(operations)
+    assert database.is_closed()
@@ -0,0 +1,71 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from chalice.app import handle_extra_types
+
+from chalicelib import encoding
+from chalicelib.catalog import OperationCatalog
+from chalicelib.models import Record
+from chalicelib.queries import serialize_records, user_records_query
+
+BODIES = [
+    {'data': [], 'total_records': 0, 'next_cursor': None},
+    {'text': 'plain ascii', 'escapes': '"quoted" \\ / \n\r\t\b\f \x00 \x1f \x7f'},
+    {'unicode': '√ é 中文     ﻿', 'astral': '😀 𝄞'},
+    {'decimals': [Decimal('5000'), Decimal('4990.50'), Decimal('0.0001'), Decimal('0'), Decimal('-12.5')]},
+    {'decimals': [Decimal('1e16'), Decimal('0.00001'), Decimal('NaN'), Decimal('Infinity')]},
+    {'numbers': [0, -1, 2 ** 63 - 1, 2 ** 64, 10 ** 30, True, False, 0.5, 1 / 3]},
+    {1: 'integer key', 'nested': {'list': [[], {}, [None]]}},
+    {'surrogate': '\ud800'},
+]
+
+
+def chalice_dumps(body):
+    return json.dumps(body, separators=(',', ':'), default=handle_extra_types)
+
+
+@pytest.mark.parametrize('body', BODIES)
+def test_dumps_matches_chalice(body):
+    assert encoding.dumps(body) == chalice_dumps(body)
+
+
+@pytest.mark.parametrize('body', BODIES)
+def test_dumps_matches_chalice_without_orjson(body, monkeypatch):
+    monkeypatch.setattr(encoding, 'orjson', None)
+    assert encoding.dumps(body) == chalice_dumps(body)
+
+
+def test_serialize_records_matches_to_dict(database, user, operations):
+    responses = ['5', '0.3333333333333333', 'aB3 √ é', '"quoted"\n', '']
+    for index, response in enumerate(responses):
+        for operation in operations.values():
+            Record.create(operation=operation, user_id=user, amount=operation.cost, operation_response=response,
+                          date=datetime(2023, 1, 1, 12, index, 30, 123456))
+    query = user_records_query(user.cognito_user_id)
+
+    expected = [record.to_dict() for record in query]
+    rows = serialize_records(query.tuples())
+
+    assert rows == expected
+    assert encoding.dumps(rows) == chalice_dumps(expected)
+
+
+def test_get_records_body_matches_the_model_serialization(gateway, auth_headers, records):
+    response = gateway.handle_request(method='GET', path='/v1/records?operation_type=&per_page=10&count=none',
+                                      headers=auth_headers, body='')
+
+    page = list(user_records_query('test-user').limit(11))
+    assert response['body'] == chalice_dumps({
+        'data': [record.to_dict() for record in page[:10]],
+        'total_records': None,
+        'next_cursor': json.loads(response['body'])['next_cursor'],
+    })
+    assert 'Content-Type' not in response['headers']
+
+
+def test_get_operations_body_matches_the_model_serialization(gateway, auth_headers, operations):
+    response = gateway.handle_request(method='GET', path='/v1/operations', headers=auth_headers, body='')
+
+    assert response['body'] == chalice_dumps({'data': OperationCatalog.get_instance().serialized()})
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+
+import pytest
+from playhouse.test_utils import count_queries
+
+from chalicelib import routes as routes_module
+from chalicelib.exports import EXPORT_COLUMNS
+
+
+def export(gateway, headers, query=''):
+    response = gateway.handle_request(method='GET', path=f'/v1/records/export?{query}', headers=headers, body='')
+    return response['statusCode'], response['headers'], response['body']
+
+
+def test_export_ndjson_returns_every_record(gateway, auth_headers, records):
+    status, headers, body = export(gateway, auth_headers)
+
+    assert status == 200
+    assert headers['Content-Type'] == 'application/x-ndjson'
+    assert 'X-Next-Cursor' not in headers
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert [row['operation_response'] for row in rows] == [str(index) for index in reversed(range(30))]
+    assert set(rows[0]) == set(EXPORT_COLUMNS)
+
+
+def test_export_csv_has_a_header_row(gateway, auth_headers, records):
+    status, headers, body = export(gateway, auth_headers, 'format=csv')
+
+    assert status == 200
+    assert headers['Content-Type'] == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(body)))
+    assert len(rows) == 30
+    assert list(rows[0]) == EXPORT_COLUMNS
+    assert rows[0]['operation_response'] == '29'
+
+
+def test_export_filters_by_operation_type_and_date_range(gateway, auth_headers, records):
+    status, _, body = export(gateway, auth_headers,
+                             'operation_type=addition&date_from=2023-01-01T00:05:00&date_to=2023-01-01T00:20:00')
+
+    assert status == 200
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert [row['operation_response'] for row in rows] == ['15', '10', '5']
+
+
+def test_export_reads_records_in_chunks(gateway, auth_headers, records, monkeypatch):
+    monkeypatch.setattr(routes_module, 'EXPORT_CHUNK_SIZE', 7)
+    with count_queries() as counter:
+        status, _, body = export(gateway, auth_headers)
+
+    assert status == 200
+    assert len(body.splitlines()) == 30
+    assert counter.count == 5
+
+
+@pytest.mark.parametrize('export_format', ['ndjson', 'csv'])
+def test_export_continues_after_the_size_limit(gateway, auth_headers, records, monkeypatch, export_format):
+    monkeypatch.setattr(routes_module, 'EXPORT_MAX_BYTES', 1000)
+    responses = []
+    query = f'format={export_format}'
+    while True:
+        status, headers, body = export(gateway, auth_headers, query)
+        assert status == 200
+        assert len(body.encode()) <= 1000
+        responses.append(body)
+        if 'X-Next-Cursor' not in headers:
+            break
+        query = f"format={export_format}&cursor={headers['X-Next-Cursor']}"
+
+    assert len(responses) > 1
+    if export_format == 'csv':
+        rows = [row for body in responses for row in csv.DictReader(io.StringIO(body))]
+    else:
+        rows = [json.loads(line) for body in responses for line in body.splitlines()]
+    assert [row['operation_response'] for row in rows] == [str(index) for index in reversed(range(30))]
+
+
+@pytest.mark.parametrize('query', ['format=xml', 'date_from=yesterday', 'cursor=invalid'])
+def test_export_rejects_invalid_parameters(gateway, auth_headers, records, query):
+    status, _, _ = export(gateway, auth_headers, query)
+    assert status == 400
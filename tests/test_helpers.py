@@ -0,0 +1,101 @@
+import math
+
+import pytest
+from chalice import ChaliceViewError
+
+from chalicelib import helpers
+from chalicelib.helpers import perform_operation, register_operator
+
+
+def eval_operation(num1, num2, symbol):
+    expression = f"math.sqrt({int(num1)})" if symbol == "√" else f"{int(num1)} {symbol} {int(num2)}"
+    return eval(expression)
+
+
+@pytest.mark.parametrize('symbol', ['+', '-', '*', '/', '√'])
+@pytest.mark.parametrize('num1, num2', [('5', '10'), ('10', '3'), ('0', '7'), ('123456789123456789', '987'), ('2', '')])
+def test_perform_operation_matches_expression_evaluation(num1, num2, symbol):
+    if num2 == '' and symbol != '√':
+        assert perform_operation(num1, num2, symbol).startswith('Error: Invalid input or expression')
+    else:
+        assert perform_operation(num1, num2, symbol) == eval_operation(num1, num2, symbol)
+
+
+def test_perform_operation_returns_non_numeric_input():
+    assert perform_operation('aB3dE', None, '?') == 'aB3dE'
+
+
+def test_perform_operation_accepts_integer_operands():
+    assert perform_operation(6, 7, '*') == 42
+
+
+def test_perform_operation_rejects_unknown_symbol():
+    assert perform_operation('1', '2', '^') == 'Error: Invalid input or expression: unsupported operation ^'
+
+
+@pytest.mark.parametrize('symbol', ['/', '√'])
+def test_perform_operation_rejects_operands_too_large_for_a_float(symbol):
+    result = perform_operation('1' * 400, '3', symbol)
+
+    assert result.startswith('Error: Invalid input or expression: ')
+
+
+def test_perform_operation_rejects_zero_divisor():
+    with pytest.raises(ChaliceViewError, match="Divisor can't be zero"):
+        perform_operation('1', '0', '/')
+
+
+def test_register_operator(monkeypatch):
+    monkeypatch.setattr(helpers, 'OPERATORS', dict(helpers.OPERATORS))
+    register_operator('%', lambda a, b: a % b)
+    register_operator('!', math.factorial, arity=1)
+
+    assert perform_operation('17', '5', '%') == 2
+    assert perform_operation('5', None, '!') == 120
+    with pytest.raises(ValueError):
+        register_operator('?', max, arity=3)
+
+
+def test_perform_operations_matches_perform_operation():
+    np = pytest.importorskip('numpy')
+    rng = np.random.default_rng(1015)
+    size = 5000
+    pool = ['0', '1', '7', '12', '99', '4096', '2147483647', '2147483648', '9007199254740993',
+            '123456789012345678', '1234567890123456789012', '', 'abc', '٣', '²', '-4', ' 5', '007']
+    num1 = rng.choice(pool, size).tolist() + [12, 7]
+    num2 = rng.choice(pool, size).tolist() + ['3', 0]
+    symbols = rng.choice(['+', '-', '*', '/', '√', '^'], size).tolist() + ['*', '/']
+
+    result = helpers.perform_operations(num1, num2, symbols)
+
+    assert result.errors[size + 1] == "Divisor can't be zero. Try other random number."
+    for index, row in enumerate(zip(num1, num2, symbols)):
+        try:
+            expected = perform_operation(*row)
+        except ChaliceViewError as e:
+            assert result.values[index] is None
+            assert result.errors[index] == str(e)
+            continue
+        assert result.values[index] == expected
+        assert type(result.values[index]) is type(expected)
+        if isinstance(expected, str) and expected.startswith('Error: '):
+            assert result.errors[index] == expected
+        else:
+            assert index not in result.errors
+
+
+def test_perform_operations_reports_operands_too_large_for_a_float():
+    pytest.importorskip('numpy')
+
+    result = helpers.perform_operations(['1' * 400, '4'], ['3', '2'], ['/', '/'])
+
+    assert result.values[1] == 2
+    assert result.errors[0].startswith('Error: Invalid input or expression: ')
+    assert list(result.errors) == [0]
+
+
+def test_perform_operations_rejects_mismatched_columns():
+    pytest.importorskip('numpy')
+
+    with pytest.raises(ValueError):
+        helpers.perform_operations(['1', '2'], ['1'], ['+', '+'])
@@ -0,0 +1,182 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from chalice import Response
+from playhouse.test_utils import count_queries
+
+from chalicelib import idempotency
+from chalicelib.idempotency import IdempotencyKeyStore, request_hash
+from chalicelib.models import IdempotencyKey, Record, User
+
+
+@pytest.fixture(autouse=True)
+def store():
+    store = IdempotencyKeyStore.get_instance()
+    store.clear_cache()
+    yield store
+    store.clear_cache()
+
+
+def post_record(gateway, auth_headers, operation, key='key-1', num1='5', num2='10'):
+    headers = {**auth_headers, 'Idempotency-Key': key} if key is not None else auth_headers
+    body = json.dumps({'operation_id': operation.id, 'num1': num1, 'num2': num2})
+    return gateway.handle_request(method='POST', path='/v1/records', headers=headers, body=body)
+
+
+def test_retry_replays_the_stored_response(gateway, auth_headers, user, operations):
+    first = post_record(gateway, auth_headers, operations['+'])
+    retry = post_record(gateway, auth_headers, operations['+'])
+
+    assert first['statusCode'] == retry['statusCode'] == 200
+    assert retry['body'] == first['body']
+    assert retry['headers']['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first['headers']
+    assert Record.select().count() == 1
+    assert User.get_by_id(user.id).balance == 4990
+
+
+@pytest.mark.parametrize('num1, num2, result', [('1', '100000', '1e-05'), ('100000000000000000', '1', '1e+17')])
+def test_retry_replays_float_results_byte_for_byte(gateway, auth_headers, store, operations, num1, num2, result):
+    first = post_record(gateway, auth_headers, operations['/'], num1=num1, num2=num2)
+    store.clear_cache()
+    retry = post_record(gateway, auth_headers, operations['/'], num1=num1, num2=num2)
+
+    assert f'"operation_response":{result}' in first['body']
+    assert retry['body'] == first['body']
+
+
+def test_retry_from_memory_runs_no_queries(gateway, auth_headers, operations):
+    post_record(gateway, auth_headers, operations['+'])
+
+    with count_queries() as counter:
+        response = post_record(gateway, auth_headers, operations['+'])
+
+    assert response['statusCode'] == 200
+    assert counter.count == 0
+
+
+def test_retry_on_another_container_only_reads_the_key(gateway, auth_headers, store, operations):
+    first = post_record(gateway, auth_headers, operations['+'])
+    store.clear_cache()
+
+    with count_queries() as counter:
+        retry = post_record(gateway, auth_headers, operations['+'])
+
+    assert retry['body'] == first['body']
+    statements = [query.msg[0] for query in counter.get_queries()]
+    assert len(statements) == 2
+    assert all('"idempotency_keys"' in sql for sql in statements)
+    assert not [sql for sql in statements for table in ('"users"', '"records"', '"operations"') if table in sql]
+
+
+def test_key_reused_with_another_request_is_rejected(gateway, auth_headers, store, operations):
+    post_record(gateway, auth_headers, operations['+'])
+    from_memory = post_record(gateway, auth_headers, operations['+'], num1='6')
+    store.clear_cache()
+    from_table = post_record(gateway, auth_headers, operations['+'], num1='6')
+
+    assert from_memory['statusCode'] == from_table['statusCode'] == 422
+    assert Record.select().count() == 1
+
+
+def test_keys_are_scoped_to_the_user(gateway, auth_headers, user, operations):
+    other = User.create(username='other@test.com', status=True, cognito_user_id='other-user')
+
+    post_record(gateway, auth_headers, operations['+'])
+    response = post_record(gateway, {**auth_headers, 'Authorization': other.cognito_user_id}, operations['+'])
+
+    assert 'Idempotent-Replayed' not in response['headers']
+    assert Record.select().count() == 2
+
+
+def test_requests_without_a_key_always_run(gateway, auth_headers, operations):
+    post_record(gateway, auth_headers, operations['+'], key=None)
+    post_record(gateway, auth_headers, operations['+'], key=None)
+
+    assert Record.select().count() == 2
+    assert IdempotencyKey.select().count() == 0
+
+
+@pytest.mark.parametrize('key', ['', 'k' * 256])
+def test_invalid_key_is_rejected(gateway, auth_headers, operations, key):
+    response = post_record(gateway, auth_headers, operations['+'], key=key)
+
+    assert response['statusCode'] == 400
+    assert Record.select().count() == 0
+
+
+def test_failed_request_releases_the_key(gateway, auth_headers, user, operations):
+    headers = {**auth_headers, 'Idempotency-Key': 'key-1'}
+    response = gateway.handle_request(method='POST', path='/v1/records', headers=headers,
+                                      body=json.dumps({'operation_id': operations['+'].id}))
+    assert response['statusCode'] == 500
+    assert IdempotencyKey.select().count() == 0
+
+    assert post_record(gateway, auth_headers, operations['+'])['statusCode'] == 200
+    assert Record.select().count() == 1
+
+
+def test_concurrent_duplicate_waits_for_the_first_request(database, store):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    responses = []
+
+    def handler():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return Response(body={'value': len(calls)}, status_code=200)
+
+    def send():
+        responses.append(store.run('test-user', 'key-1', request_hash(b'{}'), handler))
+
+    first = threading.Thread(target=send)
+    first.start()
+    started.wait(5)
+    duplicate = threading.Thread(target=send)
+    duplicate.start()
+    duplicate.join(0.2)
+    assert duplicate.is_alive()
+
+    release.set()
+    first.join(5)
+    duplicate.join(5)
+
+    assert len(calls) == 1
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[1].body == '{"value":1}'
+    assert responses[1].headers == {'Idempotent-Replayed': 'true'}
+
+
+def test_duplicate_gives_up_waiting_with_a_conflict(gateway, auth_headers, monkeypatch, operations):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_WAIT_TIMEOUT', 0)
+    body = json.dumps({'operation_id': operations['+'].id, 'num1': '5', 'num2': '10'})
+    IdempotencyKey.create(cognito_user_id='test-user', key='key-1', request_hash=request_hash(body.encode()))
+
+    response = post_record(gateway, auth_headers, operations['+'])
+
+    assert response['statusCode'] == 409
+    assert Record.select().count() == 0
+
+
+def test_abandoned_pending_key_is_claimed_again(gateway, auth_headers, operations):
+    body = json.dumps({'operation_id': operations['+'].id, 'num1': '5', 'num2': '10'})
+    IdempotencyKey.create(cognito_user_id='test-user', key='key-1', request_hash=request_hash(body.encode()),
+                          created_at=datetime.now() - timedelta(hours=1))
+
+    response = post_record(gateway, auth_headers, operations['+'])
+
+    assert response['statusCode'] == 200
+    assert Record.select().count() == 1
+
+
+def test_expired_keys_are_purged(database):
+    IdempotencyKey.create(cognito_user_id='test-user', key='old', request_hash='', status_code=200,
+                          created_at=datetime.now() - timedelta(days=2))
+    IdempotencyKey.create(cognito_user_id='test-user', key='new', request_hash='', status_code=200)
+
+    assert IdempotencyKey.purge_expired(24 * 60 * 60) == 1
+    assert [key.key for key in IdempotencyKey.select()] == ['new']
+
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(statement):
+    script = f"import sys\n{statement}\nprint(' '.join(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=os.environ.copy(),
+                            capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+def test_importing_the_app_defers_heavy_dependencies():
+    modules = imported_modules('import app')
+
+    assert 'chalicelib.routes' in modules
+    assert not {'boto3', 'botocore', 'requests', 'numpy', 'jwt'} & modules
+
+
+def test_importing_the_app_does_not_connect_to_the_database():
+    modules = imported_modules('import app\nfrom chalicelib.models import db\nassert db.is_closed()')
+
+    assert 'chalicelib.models' in modules
@@ -0,0 +1,51 @@
+import json
+import logging
+
+from chalicelib import instrumentation
+
+
+def server_timing(response):
+    entries = {}
+    for entry in response['headers']['Server-Timing'].split(', '):
+        name, *fields = entry.split(';')
+        entries[name] = dict(field.split('=', 1) for field in fields)
+    return entries
+
+
+def test_no_server_timing_when_sampling_is_off(gateway, auth_headers, operations, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'PERF_SAMPLE_RATE', 0.0)
+    response = gateway.handle_request(method='GET', path='/v1/records?operation_type=', headers=auth_headers,
+                                      body='')
+    assert response['statusCode'] == 200
+    assert 'Server-Timing' not in response['headers']
+
+
+def test_server_timing_counts_queries_and_phases(gateway, auth_headers, operations, monkeypatch, caplog):
+    monkeypatch.setattr(instrumentation, 'PERF_SAMPLE_RATE', 1.0)
+    caplog.set_level(logging.INFO, logger=instrumentation.logger.name)
+    response = gateway.handle_request(method='GET', path='/v1/records?operation_type=', headers=auth_headers,
+                                      body='')
+    assert response['statusCode'] == 200
+
+    entries = server_timing(response)
+    # The page query and the exact count.
+    assert entries['db']['desc'] == '"2 queries"'
+    assert {'total', 'connect', 'serialize'} <= entries.keys()
+    assert float(entries['total']['dur']) >= float(entries['db']['dur'])
+
+    lines = [json.loads(record.getMessage()) for record in caplog.records]
+    timing = next(line for line in lines if line['event'] == 'request_timing')
+    assert timing['request'] == 'GET /v1/records'
+    assert timing['db_queries'] == 2
+
+
+def test_queries_outside_sampled_requests_are_not_counted(database):
+    database.execute_sql('SELECT 1')
+    with instrumentation.measure_request('test') as metrics:
+        database.execute_sql('SELECT 1')
+        with instrumentation.phase('work'):
+            database.execute_sql('SELECT 1')
+    assert metrics.query_count == 2
+    assert set(metrics.phases) == {'work'}
+    database.execute_sql('SELECT 1')
+    assert metrics.query_count == 2
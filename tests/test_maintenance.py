@@ -0,0 +1,84 @@
+import json
+from datetime import date, datetime
+
+from chalicelib.maintenance import (add_months, archive_records, ensure_record_partitions, month_partition_sql,
+                                    partition_name, partition_records)
+from chalicelib.migrations import run_migrations
+from chalicelib.models import Record, RecordArchive, UsageSummary
+
+
+def get_records(gateway, headers, query='operation_type='):
+    response = gateway.handle_request(method='GET', path=f'/v1/records?{query}', headers=headers, body='')
+    return json.loads(response['body'])
+
+
+def usage(user):
+    return {
+        summary.operation_id: (summary.record_count, summary.total_amount)
+        for summary in UsageSummary.select().where(UsageSummary.user_id == user.id)
+        if summary.record_count
+    }
+
+
+def test_archive_records_moves_the_deleted_records(gateway, auth_headers, user, records):
+    deleted_ids = [record.id for record in Record.select().order_by(Record.id).limit(4)]
+    Record.soft_delete_where(user.cognito_user_id, Record.id.in_(deleted_ids))
+    listed = get_records(gateway, auth_headers)
+    summaries = usage(user)
+
+    assert archive_records() == 4
+
+    assert sorted(record.id for record in RecordArchive.select()) == deleted_ids
+    assert not RecordArchive.select().where(RecordArchive.active == True).exists()
+    assert Record.select().count() == len(records) - 4
+    assert get_records(gateway, auth_headers) == listed
+    assert usage(user) == summaries
+
+
+def test_archive_records_moves_the_records_older_than_the_retention(user, records):
+    archived = archive_records(retention_days=30, now=datetime(2023, 1, 31, 0, 20))
+
+    assert archived == 20
+    assert Record.select().count() == len(records) - 20
+    assert RecordArchive.select().where(RecordArchive.active == True).count() == 20
+    summaries = usage(user)
+    UsageSummary.rebuild()
+    assert usage(user) == summaries
+
+
+def test_archive_records_moves_batches_up_to_max_batches(user, records):
+    Record.update(active=False).execute()
+
+    assert archive_records(batch_size=7, max_batches=2) == 14
+    assert archive_records(batch_size=7, max_batches=10) == len(records) - 14
+    assert archive_records(batch_size=7) == 0
+    assert RecordArchive.select().count() == len(records)
+
+
+def test_archive_records_keeps_the_active_records_without_retention(records):
+    assert archive_records() == 0
+    assert Record.select().count() == len(records)
+
+
+def test_month_partitions():
+    assert add_months(date(2023, 11, 1), 3) == date(2024, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert partition_name(date(2024, 2, 1)) == 'records_p2024_02'
+    assert month_partition_sql(date(2023, 12, 1)) == (
+        'CREATE TABLE IF NOT EXISTS "records_p2023_12" PARTITION OF "records" '
+        "FOR VALUES FROM ('2023-12-01') TO ('2024-01-01')"
+    )
+
+
+def test_partitioning_is_skipped_on_sqlite(database, records):
+    assert partition_records(database) is False
+    assert ensure_record_partitions(database) == []
+    assert Record.select().count() == len(records)
+
+
+def test_run_migrations_creates_the_records_archive(database):
+    database.drop_tables([RecordArchive])
+
+    run_migrations(database)
+
+    assert database.table_exists('records_archive')
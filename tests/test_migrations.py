@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import pytest
+
+from chalicelib.migrations import MIGRATIONS, SchemaMigration, run_migrations
+from chalicelib.models import Record, UsageSummary, User
+from chalicelib.queries import after_position, user_records_query
+
+MIGRATION_NAMES = [name for name, _ in MIGRATIONS]
+
+
+def explain(database, query):
+    sql, params = query.sql()
+    return ' '.join(row[-1] for row in database.execute_sql(f'EXPLAIN QUERY PLAN {sql}', params))
+
+
+@pytest.fixture
+def legacy_database(database):
+    """
+    Recreates the tables without the indexes declared by the models, as the deployed schema was.
+    """
+    for model in (Record, User):
+        for index in database.get_indexes(model._meta.table_name):
+            database.execute_sql(f'DROP INDEX "{index.name}"')
+    return database
+
+
+def test_run_migrations_adds_the_hot_query_indexes(legacy_database):
+    assert run_migrations(legacy_database) == MIGRATION_NAMES
+
+    users_indexes = {(tuple(index.columns), index.unique) for index in legacy_database.get_indexes('users')}
+    records_indexes = {tuple(index.columns) for index in legacy_database.get_indexes('records')}
+    assert (('cognito_user_id',), True) in users_indexes
+    assert (('username',), False) in users_indexes
+    assert ('user_id', 'active', 'date', 'id') in records_indexes
+
+
+def test_run_migrations_only_applies_new_migrations(legacy_database):
+    run_migrations(legacy_database)
+    indexes = legacy_database.get_indexes('users') + legacy_database.get_indexes('records')
+
+    assert run_migrations(legacy_database) == []
+    assert legacy_database.get_indexes('users') + legacy_database.get_indexes('records') == indexes
+    with legacy_database.bind_ctx([SchemaMigration]):
+        assert [migration.name for migration in SchemaMigration.select()] == MIGRATION_NAMES
+
+
+def test_run_migrations_skips_indexes_declared_by_the_models(database):
+    indexes = database.get_indexes('users') + database.get_indexes('records')
+
+    assert run_migrations(database) == MIGRATION_NAMES
+    assert database.get_indexes('users') + database.get_indexes('records') == indexes
+
+
+def test_records_query_plan_uses_the_indexes(legacy_database, user):
+    query = after_position(user_records_query(user.cognito_user_id), datetime(2023, 1, 1), 10).limit(10)
+    plan = explain(legacy_database, query)
+    assert 'records_user_id_active_date_id' not in plan
+
+    run_migrations(legacy_database)
+    plan = explain(legacy_database, query)
+    assert 'users_cognito_user_id' in plan
+    assert 'records_user_id_active_date_id' in plan
+
+
+def test_records_query_plan_uses_the_indexes_with_operation_filters(legacy_database, user):
+    run_migrations(legacy_database)
+    query = user_records_query(user.cognito_user_id, {1, 2}).limit(10)
+
+    plan = explain(legacy_database, query)
+
+    assert 'users_cognito_user_id' in plan
+    assert 'records_user_id_active_date_id' in plan
+
+
+def test_signin_query_plan_uses_the_username_index(legacy_database):
+    query = User.select().where(User.username == 'test@test.com')
+    assert 'users_username' not in explain(legacy_database, query)
+
+    run_migrations(legacy_database)
+    assert 'users_username' in explain(legacy_database, query)
+
+
+def test_run_migrations_backfills_the_usage_summaries(database, records):
+    database.drop_tables([UsageSummary])
+
+    run_migrations(database)
+
+    addition = UsageSummary.get(UsageSummary.operation == records[0]['operation'])
+    assert addition.record_count == 6
+    assert addition.total_amount == 60
+    assert addition.last_activity == max(row['date'] for row in records if row['operation'] == addition.operation_id)
@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from chalice import ChaliceViewError
+
+from chalicelib.models import Record, User
+
+
+def create_record(database, user_id, operation):
+    try:
+        Record.create(
+            operation=operation,
+            user_id=User.get_by_id(user_id),
+            amount=operation.cost,
+            operation_response='1',
+            date=datetime.now()
+        )
+        return True
+    except ChaliceViewError:
+        return False
+    finally:
+        database.close()
+
+
+def test_record_debits_user_balance(user, operations):
+    record = Record.create(
+        operation=operations['+'],
+        user_id=user,
+        amount=operations['+'].cost,
+        operation_response='3',
+        date=datetime.now()
+    )
+
+    assert record.user_balance == user.balance == Decimal(4990)
+    assert User.get_by_id(user.id).balance == Decimal(4990)
+
+
+def test_insufficient_balance_creates_nothing(user, operations):
+    User.update(balance=5).execute()
+    user = User.get_by_id(user.id)
+
+    with pytest.raises(ChaliceViewError, match='Insufficient balance'):
+        Record.create(
+            operation=operations['+'],
+            user_id=user,
+            amount=operations['+'].cost,
+            operation_response='3',
+            date=datetime.now()
+        )
+
+    assert Record.select().count() == 0
+    assert User.get_by_id(user.id).balance == Decimal(5)
+
+
+def test_failed_insert_rolls_back_debit(user, operations):
+    with pytest.raises(Exception):
+        Record.create(operation=operations['+'], user_id=user, amount=operations['+'].cost, date=datetime.now())
+
+    assert User.get_by_id(user.id).balance == Decimal(5000)
+
+
+def test_concurrent_debits_do_not_lose_updates(database, user, operations):
+    User.update(balance=1000).execute()
+    operation = operations['+']
+    database.close()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: create_record(database, user.id, operation), range(150)))
+
+    assert results.count(True) == 100
+    assert Record.select().count() == 100
+    assert User.get_by_id(user.id).balance == Decimal(0)
+    assert sorted(record.user_balance for record in Record.select()) == [Decimal(10 * i) for i in range(100)]
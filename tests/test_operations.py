@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from playhouse.test_utils import count_queries
+
+from chalicelib.catalog import OperationCatalog
+from chalicelib.models import Operation
+
+
+def get_operations(gateway, headers):
+    return gateway.handle_request(method='GET', path='/v1/operations', headers=headers, body='')
+
+
+def test_get_operations_returns_etag(gateway, auth_headers, operations):
+    response = get_operations(gateway, auth_headers)
+
+    assert response['statusCode'] == 200
+    assert response['headers']['ETag'].startswith('"')
+    assert [operation['symbol'] for operation in json.loads(response['body'])['data']] == list(operations)
+
+
+def test_get_operations_answers_if_none_match_without_queries(gateway, auth_headers, operations):
+    etag = get_operations(gateway, auth_headers)['headers']['ETag']
+
+    with count_queries() as counter:
+        response = get_operations(gateway, {**auth_headers, 'If-None-Match': f'W/{etag}'})
+
+    assert response['statusCode'] == 304
+    assert response['body'] == ''
+    assert response['headers']['ETag'] == etag
+    assert counter.count == 0
+
+
+def test_operations_etag_changes_after_invalidation(gateway, auth_headers, operations):
+    etag = get_operations(gateway, auth_headers)['headers']['ETag']
+    Operation.update(cost=15).where(Operation.symbol == '+').execute()
+
+    assert get_operations(gateway, {**auth_headers, 'If-None-Match': etag})['statusCode'] == 304
+
+    OperationCatalog.get_instance().invalidate()
+    response = get_operations(gateway, {**auth_headers, 'If-None-Match': etag})
+
+    assert response['statusCode'] == 200
+    assert response['headers']['ETag'] != etag
+
+
+def test_create_record_reads_operation_from_catalog(gateway, auth_headers, operations):
+    OperationCatalog.get_instance().serialized()
+    body = json.dumps({'operation_id': operations['+'].id, 'num1': '5', 'num2': '10'})
+
+    with count_queries() as counter:
+        response = gateway.handle_request(method='POST', path='/v1/records', headers=auth_headers, body=body)
+
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['data']['operation_response'] == 15
+    assert not [query for query in counter.get_queries() if '"operation"' in query.msg[0]]
+
+
+def test_create_record_reloads_the_catalog_for_a_new_operation(gateway, auth_headers, operations, monkeypatch):
+    catalog = OperationCatalog.get_instance()
+    catalog.serialized()
+    operation = Operation.create(type='modulo', cost=5, symbol='/', is_arithmetic=True)
+    body = json.dumps({'operation_id': operation.id, 'num1': '6', 'num2': '3'})
+
+    monkeypatch.setattr(catalog, 'reload_interval', 3600)
+    response = gateway.handle_request(method='POST', path='/v1/records', headers=auth_headers, body=body)
+    assert response['statusCode'] == 400
+
+    monkeypatch.setattr(catalog, 'reload_interval', 0)
+    response = gateway.handle_request(method='POST', path='/v1/records', headers=auth_headers, body=body)
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['data']['operation']['type'] == 'modulo'
+
+
+def test_unknown_operations_reload_the_catalog_at_most_once_per_interval(operations, monkeypatch):
+    catalog = OperationCatalog.get_instance()
+    catalog.serialized()
+    monkeypatch.setattr(catalog, 'reload_interval', 3600)
+
+    with count_queries() as counter:
+        for _ in range(3):
+            with pytest.raises(Operation.DoesNotExist):
+                catalog.get(999)
+
+    assert counter.count == 0
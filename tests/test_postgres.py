@@ -0,0 +1,273 @@
+"""
+Tests of the PostgreSQL specific schema changes, which run against the database of the
+TEST_POSTGRES_URL environment variable, such as postgresql://postgres@localhost/calculator_test,
+and are skipped without it. The public schema of that database is dropped by every test.
+"""
+import os
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+from peewee import IntegrityError
+from playhouse.db_url import connect
+from playhouse.migrate import SchemaMigrator
+
+from chalicelib.maintenance import archive_records, ensure_record_partitions, is_partitioned, partition_records
+from chalicelib.migrations import MIGRATIONS, add_hot_query_indexes, run_migrations
+from chalicelib.models import (IdempotencyKey, Operation, RateLimitBucket, RecentWrite, Record, RecordArchive,
+                               UsageSummary, User)
+from chalicelib.queries import in_date_range, user_records_query
+
+POSTGRES_URL = os.environ.get('TEST_POSTGRES_URL')
+MODELS = [User, Operation, Record, RecordArchive, UsageSummary, IdempotencyKey, RateLimitBucket, RecentWrite]
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URL, reason='TEST_POSTGRES_URL is not set')
+
+
+@pytest.fixture
+def postgres():
+    database = connect(POSTGRES_URL)
+    database.execute_sql('DROP SCHEMA public CASCADE')
+    database.execute_sql('CREATE SCHEMA public')
+    with database.bind_ctx(MODELS):
+        database.create_tables(MODELS)
+        yield database
+    database.close()
+
+
+@pytest.fixture
+def legacy_postgres(postgres):
+    """
+    Drops the indexes declared by the models, as the deployed schema was.
+    """
+    for model in (Record, User):
+        for index in postgres.get_indexes(model._meta.table_name):
+            if not index.name.endswith('_pkey'):
+                postgres.execute_sql(f'DROP INDEX "{index.name}"')
+    return postgres
+
+
+def valid_indexes(database, table):
+    cursor = database.execute_sql(
+        'SELECT index.relname, pg_index.indisvalid FROM pg_index '
+        'JOIN pg_class AS index ON index.oid = pg_index.indexrelid '
+        'WHERE pg_index.indrelid = to_regclass(%s)',
+        (table,)
+    )
+    return dict(cursor.fetchall())
+
+
+def test_hot_query_indexes_are_built_concurrently(legacy_postgres, monkeypatch):
+    statements = []
+    execute_sql = legacy_postgres.execute_sql
+
+    def record_sql(sql, *args, **kwargs):
+        statements.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    monkeypatch.setattr(legacy_postgres, 'execute_sql', record_sql)
+
+    add_hot_query_indexes(SchemaMigrator.from_database(legacy_postgres))
+
+    assert len([sql for sql in statements if 'INDEX CONCURRENTLY' in sql]) == 3
+    assert valid_indexes(legacy_postgres, 'records')['records_user_id_active_date_id'] is True
+    assert valid_indexes(legacy_postgres, 'users')['users_cognito_user_id'] is True
+
+
+def test_invalid_index_left_by_a_failed_build_is_rebuilt(legacy_postgres):
+    migrator = SchemaMigrator.from_database(legacy_postgres)
+    first = User.create(username='a@test.com', status=True, cognito_user_id='duplicate')
+    User.create(username='b@test.com', status=True, cognito_user_id='duplicate')
+
+    with pytest.raises(IntegrityError):
+        add_hot_query_indexes(migrator)
+    assert valid_indexes(legacy_postgres, 'users')['users_cognito_user_id'] is False
+
+    first.delete_instance()
+    add_hot_query_indexes(migrator)
+
+    assert valid_indexes(legacy_postgres, 'users')['users_cognito_user_id'] is True
+
+
+@pytest.fixture
+def populated_postgres(postgres):
+    """
+    Fills the records table with records spread over the first half of 2023.
+    """
+    user = User.create(username='test@test.com', status=True, cognito_user_id='test-user')
+    operation = Operation.create(type='addition', cost=10, symbol='+', is_arithmetic=True)
+    start = datetime(2023, 1, 1)
+    Record.insert_many([
+        {
+            'operation': operation.id,
+            'user_id': user.id,
+            'amount': 10,
+            'user_balance': 5000,
+            'operation_response': str(index),
+            'date': start + timedelta(hours=index),
+            'active': True,
+        }
+        for index in range(4000)
+    ]).execute()
+    UsageSummary.rebuild()
+    return postgres
+
+
+def record_states():
+    return {
+        record.id: (record.operation_response, record.active, record.date)
+        for record in Record.select(Record.id, Record.operation_response, Record.active, Record.date)
+    }
+
+
+class RecordWriter(threading.Thread):
+    """
+    Inserts, updates, moves to another month and deletes random records until stopped, keeping
+    the state the records table should end up in.
+    """
+
+    def __init__(self, database, expected):
+        super().__init__()
+        self.database = database
+        self.expected = expected
+        self.stopped = threading.Event()
+        self.writes = 0
+        self.error = None
+
+    def run(self):
+        rng = random.Random(1015)
+        template = Record.select().first()
+        try:
+            while not self.stopped.is_set():
+                self.write(rng, template)
+                self.writes += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.database.close()
+
+    def write(self, rng, template):
+        action = rng.choice(['insert', 'update', 'move', 'delete'])
+        record_id = rng.choice(list(self.expected))
+        if action == 'insert':
+            row_date = datetime(2023, 1, 1) + timedelta(minutes=rng.randrange(300000))
+            record_id = Record.insert(operation=template.operation_id, user_id=template.user_id_id, amount=10,
+                                      user_balance=0, operation_response='inserted', date=row_date).execute()
+            self.expected[record_id] = ('inserted', True, row_date)
+        elif action == 'update':
+            if Record.update(operation_response='updated', active=False).where(Record.id == record_id).execute():
+                self.expected[record_id] = ('updated', False, self.expected[record_id][2])
+        elif action == 'move':
+            row_date = datetime(2023, 6, 1) + timedelta(minutes=rng.randrange(40000))
+            if Record.update(date=row_date).where(Record.id == record_id).execute():
+                self.expected[record_id] = self.expected[record_id][:2] + (row_date,)
+        elif Record.delete().where(Record.id == record_id).execute():
+            del self.expected[record_id]
+
+
+def test_partition_records_during_concurrent_writes(populated_postgres):
+    writer = RecordWriter(populated_postgres, record_states())
+    writer.start()
+    try:
+        assert partition_records(populated_postgres, batch_size=100) is True
+    finally:
+        writer.stopped.set()
+        writer.join()
+
+    assert writer.error is None
+    assert writer.writes > 0
+    assert is_partitioned(populated_postgres)
+    assert populated_postgres.table_exists('records_unpartitioned')
+    assert record_states() == writer.expected
+    cursor = populated_postgres.execute_sql("SELECT indexdef FROM pg_indexes WHERE tablename = 'records'")
+    indexed_columns = {definition.split(' USING btree ')[1] for definition, in cursor.fetchall()}
+    assert indexed_columns == {'(id, date)', '(user_id, active, date, id)', '(operation_id)'}
+    assert partition_records(populated_postgres) is False
+
+    record_id = Record.insert(operation=Operation.select().first().id, user_id=User.select().first().id, amount=10,
+                              user_balance=0, operation_response='new', date=datetime.now()).execute()
+    assert record_id > max(writer.expected)
+
+
+def test_run_migrations_partitions_a_populated_database(populated_postgres):
+    records = record_states()
+
+    assert run_migrations(populated_postgres) == [name for name, _ in MIGRATIONS]
+
+    assert is_partitioned(populated_postgres)
+    assert record_states() == records
+    assert run_migrations(populated_postgres) == []
+
+
+def test_partitioned_records_listing_prunes_partitions(populated_postgres):
+    partition_records(populated_postgres)
+    query = in_date_range(user_records_query('test-user'), datetime(2023, 3, 1), datetime(2023, 4, 1)).limit(10)
+
+    sql, params = query.sql()
+    plan = ' '.join(row[0] for row in populated_postgres.execute_sql(f'EXPLAIN {sql}', params))
+
+    assert 'records_p2023_03' in plan
+    assert 'records_p2023_02' not in plan and 'records_p2023_04' not in plan
+    assert [record.date.month for record in query] == [3] * 10
+
+
+def test_maintenance_of_the_partitioned_records(populated_postgres):
+    partition_records(populated_postgres)
+
+    assert ensure_record_partitions(populated_postgres, months_ahead=2, today=date(2030, 1, 15)) == [
+        'records_p2030_01', 'records_p2030_02', 'records_p2030_03'
+    ]
+    Record.insert(operation=Operation.select().first().id, user_id=User.select().first().id, amount=10,
+                  user_balance=0, operation_response='future', date=datetime(2030, 2, 10)).execute()
+
+    Record.soft_delete_where('test-user', Record.date < datetime(2023, 1, 2))
+    summaries = {summary.operation_id: summary.record_count for summary in UsageSummary.select()}
+    assert archive_records(batch_size=10, retention_days=0) == 24
+    assert RecordArchive.select().count() == 24
+    assert not Record.select().where(Record.active == False).exists()
+    assert {summary.operation_id: summary.record_count for summary in UsageSummary.select()} == summaries
+
+
+def test_partition_records_refuses_an_identity_id(postgres):
+    postgres.execute_sql('ALTER TABLE "records" ALTER COLUMN "id" DROP DEFAULT')
+    postgres.execute_sql('ALTER TABLE "records" ALTER COLUMN "id" ADD GENERATED BY DEFAULT AS IDENTITY')
+
+    with pytest.raises(ValueError):
+        partition_records(postgres)
+    assert not postgres.table_exists('records_partitioned')
+
+
+def column_types(database, table):
+    cursor = database.execute_sql(
+        'SELECT column_name, data_type FROM information_schema.columns WHERE table_name = %s', (table,)
+    )
+    return dict(cursor.fetchall())
+
+
+def test_write_markers_keep_the_precision_of_unix_timestamps(postgres):
+    postgres.drop_tables([RecentWrite])
+    run_migrations(postgres)
+    expires_at = time.time() + 9
+
+    RecentWrite.mark('test-user', expires_at)
+
+    assert column_types(postgres, 'recent_writes')['expires_at'] == 'double precision'
+    assert RecentWrite.expiry('test-user') == pytest.approx(expires_at, abs=1e-3)
+
+
+def test_rate_limit_buckets_refill_with_unix_timestamps(postgres):
+    postgres.drop_tables([RateLimitBucket])
+    run_migrations(postgres)
+    now = time.time()
+
+    assert RateLimitBucket.take('test-user', 2, 1, now) == (True, 1)
+    assert RateLimitBucket.take('test-user', 2, 1, now) == (True, 0)
+    assert RateLimitBucket.take('test-user', 2, 1, now + 0.5)[0] is False
+    allowed, tokens = RateLimitBucket.take('test-user', 2, 1, now + 1.5)
+
+    assert column_types(postgres, 'rate_limit_buckets')['updated_at'] == 'double precision'
+    assert column_types(postgres, 'rate_limit_buckets')['tokens'] == 'double precision'
+    assert allowed is True
+    assert tokens == pytest.approx(0.5, abs=1e-3)
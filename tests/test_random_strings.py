@@ -0,0 +1,227 @@
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from chalicelib import routes as routes_module
+from chalicelib.random_strings import (ALPHANUMERIC_ALPHABET, BufferedRandomStringProvider,
+                                       LocalRandomStringProvider, RandomOrgProvider, RandomStringError)
+
+
+class StubResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+
+class StubSession:
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.calls = []
+
+    def get(self, url, timeout=None):
+        self.calls.append((url, timeout))
+        if self.error:
+            raise self.error
+        return self.response
+
+
+@pytest.fixture
+def generator():
+    generator = routes_module.random_strings
+    provider = generator.provider
+    yield generator
+    generator.set_provider(provider)
+
+
+def get_random_string(gateway, headers, query):
+    response = gateway.handle_request(method='GET', path=f'/v1/random-string?{query}', headers=headers, body='')
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_local_provider_matches_the_random_org_formats(gateway, auth_headers):
+    status, body = get_random_string(gateway, auth_headers, 'numeric=true')
+    assert status == 200
+    assert len(body['data']) == len(set(body['data'])) == 2
+    assert all(len(value) == 3 and value.isdigit() for value in body['data'])
+
+    status, body = get_random_string(gateway, auth_headers, 'numeric=false')
+    assert status == 200
+    assert len(body['data']) == 1
+    assert len(body['data'][0]) == 20 and set(body['data'][0]) <= set(ALPHANUMERIC_ALPHABET)
+
+
+def test_caller_selects_the_number_and_length(gateway, auth_headers):
+    status, body = get_random_string(gateway, auth_headers, 'numeric=true&num=10&len=1')
+
+    assert status == 200
+    assert sorted(body['data']) == [str(digit) for digit in range(10)]
+
+
+@pytest.mark.parametrize('query', ['', 'numeric=true&num=abc', 'numeric=true&num=101', 'numeric=false&len=21',
+                                   'numeric=true&num=11&len=1'])
+def test_random_string_rejects_invalid_parameters(gateway, auth_headers, query):
+    status, _ = get_random_string(gateway, auth_headers, query)
+
+    assert status == 400
+
+
+def test_random_org_provider_uses_its_session():
+    session = StubSession(StubResponse('123\n456\n'))
+    provider = RandomOrgProvider(session=session, timeout=1.5)
+
+    assert provider.generate(True, 2, 3) == ['123', '456']
+    url, timeout = session.calls[0]
+    assert timeout == 1.5
+    assert parse_qs(urlparse(url).query)['num'] == ['2']
+
+
+@pytest.mark.parametrize('session', [
+    StubSession(StubResponse('Error: service unavailable', status_code=503)),
+    StubSession(StubResponse('123\n')),
+    StubSession(error=OSError('connection timed out')),
+])
+def test_random_org_provider_falls_back_to_the_local_provider(session):
+    provider = RandomOrgProvider(fallback=LocalRandomStringProvider(), session=session)
+
+    strings = provider.generate(True, 2, 3)
+
+    assert len(session.calls) == 1
+    assert len(set(strings)) == 2 and all(value.isdigit() for value in strings)
+
+
+def test_random_org_failure_without_fallback_is_a_bad_gateway(gateway, auth_headers, generator):
+    generator.set_provider(RandomOrgProvider(session=StubSession(error=OSError('connection refused'))))
+
+    status, body = get_random_string(gateway, auth_headers, 'numeric=true')
+
+    assert status == 502
+    assert body['error'] == 'Failed to generate random strings'
+    with pytest.raises(RandomStringError):
+        generator.generate(True)
+
+
+class RandomOrgStandIn(ThreadingHTTPServer):
+    """
+    Local HTTP server answering like the random.org strings API, with strings that are unique
+    across requests so any value served twice comes from the buffer.
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RandomOrgHandler)
+        self.requests = []
+        self.counter = itertools.count()
+        self.failing = False
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.01,), daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/strings/'
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class RandomOrgHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(params)
+        if self.server.failing:
+            self.send_response(503)
+            self.end_headers()
+            return
+        num, length = int(params['num']), int(params['len'])
+        body = ''.join(f'{next(self.server.counter):0{length}d}\n' for _ in range(num))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def random_org():
+    server = RandomOrgStandIn()
+    yield server
+    server.close()
+
+
+def buffered_provider(server, batch_size=100, low_water=20):
+    source = RandomOrgProvider(base_url=server.url, timeout=2)
+    return BufferedRandomStringProvider(source, fallback=LocalRandomStringProvider(), batch_size=batch_size,
+                                        low_water=low_water)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'Timed out'
+        time.sleep(0.01)
+
+
+def test_buffer_serves_requests_from_large_batches(random_org):
+    provider = buffered_provider(random_org)
+
+    provider.generate(False, 2, 20)
+    wait_for(lambda: provider.metrics()['refills'] == 1)
+    served = [value for _ in range(40) for value in provider.generate(False, 2, 20)]
+
+    metrics = provider.metrics()
+    assert metrics['hits'] == 40 and metrics['misses'] == 1
+    # The first request missed the buffer and fetched its strings directly, while the refill ran.
+    assert sorted(request['num'] for request in random_org.requests) == ['100', '2']
+    assert metrics['buffered'] == {'alphanumeric:20': 20}
+    assert len(set(served)) == len(served)
+
+
+def test_buffer_refills_below_the_low_water_mark(random_org):
+    provider = buffered_provider(random_org, batch_size=50, low_water=10)
+    provider.generate(True, 2, 3)
+    wait_for(lambda: provider.metrics()['refills'] == 1)
+
+    for _ in range(21):
+        provider.generate(True, 2, 3)
+    wait_for(lambda: provider.metrics()['refills'] == 2)
+
+    assert provider.metrics()['buffered'] == {'numeric:3': 8 + 50}
+    assert sorted(request['num'] for request in random_org.requests) == ['2', '50', '50']
+
+
+def test_buffer_never_serves_a_value_twice(random_org):
+    provider = buffered_provider(random_org, batch_size=200, low_water=100)
+    served = []
+
+    def take():
+        for _ in range(50):
+            served.extend(provider.generate(False, 3, 20))
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(served) == 8 * 50 * 3
+    assert len(set(served)) == len(served)
+    assert provider.metrics()['hits'] > 0
+
+
+def test_buffer_falls_back_when_random_org_fails(random_org):
+    random_org.failing = True
+    provider = buffered_provider(random_org)
+
+    strings = provider.generate(True, 2, 3)
+
+    assert len(set(strings)) == 2 and all(value.isdigit() and len(value) == 3 for value in strings)
+    wait_for(lambda: provider.metrics()['refill_errors'] == 1)
+    assert provider.metrics()['fallbacks'] == 1
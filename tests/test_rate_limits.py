@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+from chalicelib import routes as routes_module
+from chalicelib.models import RateLimitBucket, Record, User
+from chalicelib.rate_limits import InMemoryBucketStore, SqlBucketStore, parse_limit
+
+TAKES = [
+    # (now, allowed, tokens left)
+    (0.0, True, 1.0),
+    (0.0, True, 0.0),
+    (0.0, False, 0.0),
+    (0.5, False, 0.5),
+    (1.0, True, 0.0),
+    (10.0, True, 1.0),
+    (5.0, True, 0.0),
+]
+
+
+@pytest.mark.parametrize('store_class', [InMemoryBucketStore, SqlBucketStore])
+def test_bucket_stores_refill_and_take_tokens(database, store_class):
+    store = store_class()
+
+    takes = [(now, *store.take('test-user:route', 2, 1, now)) for now, _, _ in TAKES]
+
+    assert takes == TAKES
+
+
+def test_sql_buckets_are_kept_per_key(database):
+    store = SqlBucketStore()
+    store.take('test-user:route', 1, 1, 0.0)
+
+    assert store.take('other-user:route', 1, 1, 0.0) == (True, 0.0)
+    assert store.take('test-user:route', 1, 1, 0.0) == (False, 0.0)
+    assert RateLimitBucket.select().count() == 2
+
+
+@pytest.mark.parametrize('value, expected', [('20/5', (20.0, 5.0)), ('1/0.5', (1.0, 0.5)), ('', None)])
+def test_parse_limit(value, expected):
+    assert parse_limit(value) == expected
+
+
+@pytest.mark.parametrize('value', ['20', '0/1', '5/0', 'a/b'])
+def test_parse_limit_rejects_invalid_limits(value):
+    with pytest.raises(ValueError):
+        parse_limit(value)
+
+
+def post_record(gateway, headers, operation):
+    body = json.dumps({'operation_id': operation.id, 'num1': '5', 'num2': '10'})
+    return gateway.handle_request(method='POST', path='/v1/records', headers=headers, body=body)
+
+
+@pytest.mark.parametrize('store_class', [InMemoryBucketStore, SqlBucketStore])
+def test_requests_over_the_limit_get_429(gateway, auth_headers, monkeypatch, operations, store_class):
+    monkeypatch.setattr(routes_module.rate_limiter, 'limits', {'POST /v1/records': (2, 0.25)})
+    monkeypatch.setattr(routes_module.rate_limiter, 'store', store_class())
+
+    responses = [post_record(gateway, auth_headers, operations['+']) for _ in range(3)]
+
+    assert [response['statusCode'] for response in responses] == [200, 200, 429]
+    assert responses[2]['headers']['Retry-After'] == '4'
+    assert json.loads(responses[2]['body']) == {'message': 'Too many requests'}
+    assert Record.select().count() == 2
+
+
+def test_limits_are_per_user_and_route(gateway, auth_headers, monkeypatch, operations):
+    monkeypatch.setattr(routes_module.rate_limiter, 'limits', {'POST /v1/records': (1, 1)})
+    other = User.create(username='other@test.com', status=True, cognito_user_id='other-user')
+
+    assert post_record(gateway, auth_headers, operations['+'])['statusCode'] == 200
+    assert post_record(gateway, auth_headers, operations['+'])['statusCode'] == 429
+    other_headers = {**auth_headers, 'Authorization': other.cognito_user_id}
+    assert post_record(gateway, other_headers, operations['+'])['statusCode'] == 200
+    response = gateway.handle_request(method='GET', path='/v1/operations', headers=auth_headers, body='')
+    assert response['statusCode'] == 200
+
+
+def test_requests_are_allowed_when_the_store_fails(gateway, auth_headers, monkeypatch, operations):
+    class BrokenStore:
+        name = 'broken'
+
+        def take(self, *args, **kwargs):
+            raise RuntimeError('store unavailable')
+
+    monkeypatch.setattr(routes_module.rate_limiter, 'limits', {'POST /v1/records': (1, 1)})
+    monkeypatch.setattr(routes_module.rate_limiter, 'store', BrokenStore())
+
+    assert [post_record(gateway, auth_headers, operations['+'])['statusCode'] for _ in range(2)] == [200, 200]
@@ -0,0 +1,314 @@
+import json
+from datetime import datetime
+
+import pytest
+from playhouse.test_utils import count_queries
+
+from chalicelib.models import Record, User
+
+
+def get_records(gateway, headers, query):
+    response = gateway.handle_request(method='GET', path=f'/v1/records?{query}', headers=headers, body='')
+    return response['statusCode'], json.loads(response['body'])
+
+
+@pytest.mark.parametrize('per_page', [1, 10, 30])
+def test_get_records_query_count_is_constant(gateway, auth_headers, records, per_page):
+    with count_queries() as counter:
+        status, body = get_records(gateway, auth_headers, f'per_page={per_page}&operation_type=')
+
+    assert status == 200
+    assert len(body['data']) == per_page
+    assert body['total_records'] == len(records)
+    assert counter.count == 2
+
+
+def test_get_records_serializes_relations(gateway, auth_headers, records):
+    status, body = get_records(gateway, auth_headers, 'per_page=5&operation_type=ADD')
+
+    assert status == 200
+    assert body['total_records'] == 6
+    assert {record['operation']['type'] for record in body['data']} == {'addition'}
+    assert {record['user_id']['username'] for record in body['data']} == {'test@test.com'}
+
+
+def test_get_records_cursor_walks_every_record_once(gateway, auth_headers, records):
+    seen = []
+    status, body = get_records(gateway, auth_headers, 'per_page=7&operation_type=&count=none')
+    while True:
+        assert status == 200
+        assert body['total_records'] is None
+        seen.extend(record['id'] for record in body['data'])
+        if body['next_cursor'] is None:
+            break
+        status, body = get_records(gateway, auth_headers, f"per_page=7&operation_type=&count=none&cursor={body['next_cursor']}")
+
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == len(set(seen)) == len(records)
+
+
+def test_get_records_cursor_matches_page(gateway, auth_headers, records):
+    _, first_page = get_records(gateway, auth_headers, 'per_page=10&operation_type=')
+    _, second_page = get_records(gateway, auth_headers, 'per_page=10&page=2&operation_type=')
+    _, cursor_page = get_records(gateway, auth_headers, f"per_page=10&operation_type=&cursor={first_page['next_cursor']}")
+
+    assert cursor_page['data'] == second_page['data']
+
+
+def test_get_records_window_count_uses_a_single_query(gateway, auth_headers, records):
+    with count_queries() as counter:
+        status, body = get_records(gateway, auth_headers, 'per_page=10&operation_type=&count=window')
+
+    assert status == 200
+    assert body['total_records'] == len(records)
+    assert counter.count == 1
+
+
+@pytest.mark.parametrize('count_mode', ['exact', 'window'])
+def test_get_records_total_is_the_same_on_cursor_pages(gateway, auth_headers, records, count_mode):
+    _, first_page = get_records(gateway, auth_headers, f'per_page=10&operation_type=&count={count_mode}')
+    _, cursor_page = get_records(gateway, auth_headers,
+                                 f"per_page=10&operation_type=&count={count_mode}&cursor={first_page['next_cursor']}")
+
+    assert first_page['total_records'] == cursor_page['total_records'] == len(records)
+
+
+@pytest.mark.parametrize('query', ['cursor=not-a-cursor', 'count=approximate', 'per_page=0', 'per_page=-1',
+                                   'page=0'])
+def test_get_records_rejects_invalid_parameters(gateway, auth_headers, records, query):
+    status, _ = get_records(gateway, auth_headers, f'operation_type=&{query}')
+
+    assert status == 400
+
+
+def test_get_records_without_operation_type_returns_every_record(gateway, auth_headers, records):
+    status, body = get_records(gateway, auth_headers, 'per_page=5')
+
+    assert status == 200
+    assert len(body['data']) == 5
+    assert body['total_records'] == len(records)
+
+
+@pytest.mark.parametrize('query', [
+    'operation_type=ADD,sub',
+    'operation_type=add&operation_type=sub',
+    'operation_type=add&operation_type=&operation_type=sub',
+])
+def test_get_records_filters_by_several_operation_types(gateway, auth_headers, records, query):
+    status, body = get_records(gateway, auth_headers, f'per_page=30&{query}')
+
+    assert status == 200
+    assert body['total_records'] == 12
+    assert {record['operation']['type'] for record in body['data']} == {'addition', 'subtraction'}
+
+
+def test_get_records_filters_by_operation_id(gateway, auth_headers, records, operations):
+    ids = f"{operations['+'].id},{operations['√'].id}"
+
+    _, by_id = get_records(gateway, auth_headers, f'per_page=30&operation_id={ids}')
+    _, both = get_records(gateway, auth_headers, f'per_page=30&operation_id={ids}&operation_type=square')
+    _, disjoint = get_records(gateway, auth_headers, f"operation_id={operations['+'].id}&operation_type=division")
+
+    assert by_id['total_records'] == len(by_id['data']) == 12
+    assert {record['operation']['symbol'] for record in both['data']} == {'√'}
+    assert both['total_records'] == 6
+    assert disjoint['data'] == [] and disjoint['total_records'] == 0
+
+
+@pytest.mark.parametrize('count_mode', ['exact', 'window'])
+def test_get_records_filters_by_date_range(gateway, auth_headers, records, count_mode):
+    status, body = get_records(gateway, auth_headers, f'per_page=2&count={count_mode}&operation_type=addition'
+                                                      '&date_from=2023-01-01T00:05:00&date_to=2023-01-01T00:20:00')
+
+    assert status == 200
+    assert [record['operation_response'] for record in body['data']] == ['15', '10']
+    assert body['total_records'] == 3
+
+
+def test_get_records_operation_filters_are_indexed_predicates(gateway, auth_headers, records, operations):
+    get_records(gateway, auth_headers, 'operation_type=add')
+
+    with count_queries() as counter:
+        status, body = get_records(gateway, auth_headers, 'operation_type=add&operation_type=div')
+
+    assert status == 200
+    statements = [query.msg[0] for query in counter.get_queries()]
+    assert len(statements) == 2
+    assert not [sql for sql in statements if 'LIKE' in sql.upper() or 'lower' in sql.lower()]
+    assert all('"operation_id" IN (?, ?)' in sql for sql in statements)
+
+
+@pytest.mark.parametrize('query', ['operation_id=abc', 'operation_id=1,x', 'date_from=yesterday'])
+def test_get_records_rejects_invalid_filters(gateway, auth_headers, records, query):
+    status, _ = get_records(gateway, auth_headers, query)
+
+    assert status == 400
+
+
+def post_batch(gateway, headers, items):
+    response = gateway.handle_request(method='POST', path='/v1/records/batch', headers=headers,
+                                      body=json.dumps({'items': items}))
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_create_records_batch_reports_each_item(gateway, auth_headers, operations):
+    items = [
+        {'operation_id': operations['+'].id, 'num1': '2', 'num2': '3'},
+        {'operation_id': 999, 'num1': '2', 'num2': '3'},
+        {'operation_id': operations['/'].id, 'num1': '2', 'num2': '0'},
+        {'operation_id': operations['*'].id, 'num1': '4', 'num2': '5'},
+        {'operation_id': operations['-'].id},
+    ]
+
+    with count_queries() as counter:
+        status, body = post_batch(gateway, auth_headers, items)
+
+    assert status == 200
+    assert body['message'] == '2 of 5 records created successfully'
+    assert body['data'][0]['data']['operation_response'] == 5
+    assert body['data'][0]['data']['user_balance'] == '4990'
+    assert body['data'][3]['data']['operation_response'] == 20
+    assert body['data'][3]['data']['user_balance'] == '4970'
+    assert [set(result) for result in body['data']] == [{'data'}, {'error'}, {'error'}, {'data'}, {'error'}]
+    writes = [query for query in counter.get_queries() if not query.msg[0].startswith('SELECT')]
+    # The balance debit, the records and the usage summaries upsert.
+    assert [query.msg[0].split()[0] for query in writes] == ['UPDATE', 'INSERT', 'INSERT']
+    assert [record.operation_response for record in Record.select().order_by(Record.id)] == ['5', '20']
+
+
+def test_create_records_batch_reports_operands_too_large_for_a_float(gateway, auth_headers, operations):
+    items = [
+        {'operation_id': operations['+'].id, 'num1': '2', 'num2': '3'},
+        {'operation_id': operations['/'].id, 'num1': '1' * 400, 'num2': '3'},
+    ]
+
+    status, body = post_batch(gateway, auth_headers, items)
+
+    assert status == 200
+    assert body['data'][0]['data']['operation_response'] == 5
+    assert body['data'][1]['data']['operation_response'].startswith('Error: Invalid input or expression: ')
+    assert Record.select().count() == 2
+
+
+def test_create_records_batch_is_all_or_nothing_on_balance(gateway, auth_headers, user, operations):
+    User.update(balance=25).execute()
+    items = [{'operation_id': operations['+'].id, 'num1': '1', 'num2': '1'}] * 3
+
+    status, body = post_batch(gateway, auth_headers, items)
+
+    assert status == 400
+    assert body['error'] == 'Insufficient balance for the operation.'
+    assert Record.select().count() == 0
+    assert User.get_by_id(user.id).balance == 25
+
+
+@pytest.mark.parametrize('items', [[], 'not-a-list', [{'operation_id': 1, 'num1': '1', 'num2': '1'}] * 51])
+def test_create_records_batch_rejects_invalid_batches(gateway, auth_headers, operations, items):
+    status, _ = post_batch(gateway, auth_headers, items)
+
+    assert status == 400
+
+
+def delete_record(gateway, headers, record_id):
+    response = gateway.handle_request(method='DELETE', path=f'/v1/records/{record_id}', headers=headers, body='')
+    return response['statusCode'], json.loads(response['body'])
+
+
+def post_bulk_delete(gateway, headers, body):
+    response = gateway.handle_request(method='POST', path='/v1/records/bulk-delete', headers=headers,
+                                      body=json.dumps(body))
+    return response['statusCode'], json.loads(response['body'])
+
+
+def active_ids():
+    return {record.id for record in Record.select(Record.id).where(Record.active == True)}
+
+
+def test_soft_delete_record_is_a_single_update(gateway, auth_headers, records):
+    record_id = min(active_ids())
+    with count_queries() as counter:
+        status, _ = delete_record(gateway, auth_headers, record_id)
+
+    assert status == 200
+    assert record_id not in active_ids()
+    # The returning UPDATE of the record and the usage summaries upsert.
+    assert [query.msg[0].split()[0] for query in counter.get_queries()] == ['UPDATE', 'INSERT']
+
+    status, _ = delete_record(gateway, auth_headers, record_id)
+    assert status == 404
+
+
+def test_soft_delete_record_of_another_user_is_not_found(gateway, auth_headers, records):
+    User.create(username='other@test.com', status=True, cognito_user_id='other-user')
+    record_id = min(active_ids())
+
+    status, _ = delete_record(gateway, {**auth_headers, 'Authorization': 'other-user'}, record_id)
+
+    assert status == 404
+    assert record_id in active_ids()
+
+
+def test_bulk_delete_by_ids_only_deletes_active_records_of_the_user(gateway, auth_headers, records, operations):
+    other_user = User.create(username='other@test.com', status=True, cognito_user_id='other-user')
+    other_record = Record.create(operation=operations['+'], user_id=other_user, amount=10,
+                                 operation_response='1', date=datetime.now())
+    ids = sorted(active_ids() - {other_record.id})[:5]
+    delete_record(gateway, auth_headers, ids[0])
+
+    status, body = post_bulk_delete(gateway, auth_headers, {'ids': ids + [other_record.id]})
+
+    assert status == 200
+    assert sorted(body['data']['deleted_ids']) == ids[1:]
+    assert other_record.id in active_ids()
+    _, page = get_records(gateway, auth_headers, 'operation_type=')
+    assert page['total_records'] == len(records) - 5
+
+
+def test_bulk_delete_by_filter(gateway, auth_headers, records):
+    status, body = post_bulk_delete(gateway, auth_headers, {'filter': {
+        'operation_type': 'addition', 'date_from': '2023-01-01T00:05:00', 'date_to': '2023-01-01T00:20:00'
+    }})
+
+    assert status == 200
+    assert len(body['data']['deleted_ids']) == 3
+    _, page = get_records(gateway, auth_headers, 'operation_type=addition')
+    assert [record['operation_response'] for record in page['data']] == ['25', '20', '0']
+    assert page['total_records'] == 3
+
+
+def test_bulk_delete_by_operation_ids(gateway, auth_headers, records, operations):
+    status, body = post_bulk_delete(gateway, auth_headers, {'filter': {
+        'operation_id': [operations['+'].id, operations['-'].id]
+    }})
+
+    assert status == 200
+    assert len(body['data']['deleted_ids']) == 12
+    _, page = get_records(gateway, auth_headers, 'operation_type=add,sub')
+    assert page['total_records'] == 0
+
+
+def test_bulk_delete_with_an_empty_filter_clears_the_history(gateway, auth_headers, records):
+    status, body = post_bulk_delete(gateway, auth_headers, {'filter': {}})
+
+    assert status == 200
+    assert len(body['data']['deleted_ids']) == len(records)
+    assert active_ids() == set()
+    _, page = get_records(gateway, auth_headers, 'operation_type=')
+    assert page['total_records'] == 0
+
+
+@pytest.mark.parametrize('body', [
+    {},
+    {'ids': [1], 'filter': {}},
+    {'ids': []},
+    {'ids': ['1']},
+    {'ids': list(range(1, 1002))},
+    {'filter': []},
+    {'filter': {'date_to': 'tomorrow'}},
+    {'filter': {'operation_id': ['one']}},
+])
+def test_bulk_delete_rejects_invalid_bodies(gateway, auth_headers, records, body):
+    status, _ = post_bulk_delete(gateway, auth_headers, body)
+
+    assert status == 400
+    assert len(active_ids()) == len(records)
@@ -0,0 +1,129 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+from chalicelib.catalog import OperationCatalog
+from chalicelib.models import Operation, RecentWrite, Record, UsageSummary, User
+
+MODELS = [User, Operation, Record, UsageSummary, RecentWrite]
+
+
+@pytest.fixture
+def replica(tmp_path, database, user, operations):
+    """
+    A second local database standing in for a read replica of 'database', with the same users
+    and operations and a record the primary doesn't have, so reads show where they were served.
+    """
+    replica_db = type(database)(str(tmp_path / 'replica.db'))
+    users = list(User.select().dicts())
+    operation_rows = list(Operation.select().dicts())
+    with replica_db.bind_ctx(MODELS):
+        replica_db.create_tables(MODELS)
+        User.insert_many(users).execute()
+        Operation.insert_many(operation_rows).execute()
+        Record.create(operation=operations['+'].id, user_id=user.id, amount=10, user_balance=0,
+                      operation_response='from the replica', date=datetime(2023, 1, 1))
+    database.replicas = [replica_db]
+    OperationCatalog.get_instance().invalidate()
+    yield replica_db
+    replica_db.close()
+
+
+def get_responses(gateway, auth_headers):
+    response = gateway.handle_request(method='GET', path='/v1/records?operation_type=&count=none', headers=auth_headers, body='')
+    assert response['statusCode'] == 200
+    return [record['operation_response'] for record in json.loads(response['body'])['data']]
+
+
+def test_get_requests_read_from_the_replica(gateway, auth_headers, database, replica):
+    assert get_responses(gateway, auth_headers) == ['from the replica']
+    assert database.is_closed() and replica.is_closed()
+
+
+def test_without_replicas_reads_use_the_primary(gateway, auth_headers, database, user, operations):
+    with database.read_only(user.cognito_user_id):
+        assert Record.select().count() == 0
+
+    assert get_responses(gateway, auth_headers) == []
+
+
+def test_reads_follow_a_write_to_the_primary(gateway, auth_headers, database, replica, operations):
+    body = json.dumps({'operation_id': operations['+'].id, 'num1': '5', 'num2': '10'})
+    response = gateway.handle_request(method='POST', path='/v1/records', headers=auth_headers, body=body)
+    assert response['statusCode'] == 200
+
+    assert get_responses(gateway, auth_headers) == ['15']
+    assert database.wrote_recently('test-user')
+    assert not database.wrote_recently('another-user')
+
+
+def test_reads_follow_a_write_served_by_another_container(gateway, auth_headers, database, replica, operations):
+    body = json.dumps({'operation_id': operations['+'].id, 'num1': '5', 'num2': '10'})
+    response = gateway.handle_request(method='POST', path='/v1/records', headers=auth_headers, body=body)
+    assert response['statusCode'] == 200
+    # The container serving the next request has not seen the write.
+    database._recent_writes.clear()
+
+    assert get_responses(gateway, auth_headers) == ['15']
+    assert RecentWrite.expiry('test-user') > time.time()
+
+
+def test_expired_write_markers_read_from_the_replica(gateway, auth_headers, database, replica):
+    RecentWrite.mark('test-user', time.time() - 1)
+
+    assert get_responses(gateway, auth_headers) == ['from the replica']
+
+
+def test_unreadable_write_markers_read_from_the_primary(gateway, auth_headers, database, replica):
+    database.drop_tables([RecentWrite])
+
+    assert get_responses(gateway, auth_headers) == []
+
+
+def test_reads_return_to_the_replica_after_the_window(gateway, auth_headers, database, replica):
+    database._read_your_writes_window = 0
+    database.record_write('test-user')
+
+    assert get_responses(gateway, auth_headers) == ['from the replica']
+
+
+def test_failed_write_does_not_pin_reads_to_the_primary(gateway, auth_headers, database, replica):
+    body = json.dumps({'operation_id': 999, 'num1': '5', 'num2': '10'})
+    response = gateway.handle_request(method='POST', path='/v1/records', headers=auth_headers, body=body)
+    assert response['statusCode'] >= 400
+
+    assert get_responses(gateway, auth_headers) == ['from the replica']
+
+
+def test_statements_in_transactions_and_writes_use_the_primary(database, replica, user):
+    with database.read_only(user.cognito_user_id):
+        assert Record.select().count() == 1
+        with database.atomic():
+            assert Record.select().count() == 0
+        User.update(balance=1).where(User.id == user.id).execute()
+
+    with replica.bind_ctx(MODELS):
+        assert User.get_by_id(user.id).balance != 1
+    assert User.get_by_id(user.id).balance == 1
+
+
+def test_unhealthy_replica_falls_back_to_the_primary(tmp_path, gateway, auth_headers, database, replica):
+    broken = type(database)(str(tmp_path / 'missing' / 'replica.db'))
+    database.replicas = [broken, replica]
+
+    assert get_responses(gateway, auth_headers) == []
+    assert get_responses(gateway, auth_headers) == ['from the replica']
+    assert get_responses(gateway, auth_headers) == ['from the replica']
+
+
+def test_unhealthy_replica_is_retried_after_the_interval(tmp_path, gateway, auth_headers, database, replica):
+    broken = type(database)(str(tmp_path / 'missing' / 'replica.db'))
+    database.replicas = [broken]
+    database._replica_retry_interval = 0
+
+    assert get_responses(gateway, auth_headers) == []
+    database.replicas[0] = replica
+
+    assert get_responses(gateway, auth_headers) == ['from the replica']
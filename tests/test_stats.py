@@ -0,0 +1,89 @@
+import json
+
+from playhouse.test_utils import count_queries
+
+from chalicelib.catalog import OperationCatalog
+from chalicelib.models import Operation, Record, UsageSummary
+
+
+def request(gateway, headers, method, path, body=None):
+    response = gateway.handle_request(method=method, path=path, headers=headers,
+                                      body=json.dumps(body) if body is not None else '')
+    return response['statusCode'], json.loads(response['body'])
+
+
+def summaries():
+    return sorted(
+        (summary.user_id_id, summary.operation_id, summary.record_count, summary.total_amount, summary.last_activity)
+        for summary in UsageSummary.select()
+    )
+
+
+def test_stats_summarize_created_and_deleted_records(gateway, auth_headers, operations):
+    add = {'operation_id': operations['+'].id, 'num1': '2', 'num2': '3'}
+    multiply = {'operation_id': operations['*'].id, 'num1': '2', 'num2': '3'}
+    request(gateway, auth_headers, 'POST', '/v1/records', add)
+    request(gateway, auth_headers, 'POST', '/v1/records', add)
+    request(gateway, auth_headers, 'POST', '/v1/records/batch', {'items': [multiply, add, multiply]})
+    record_id = Record.select(Record.id).where(Record.operation == operations['*'].id).first().id
+    request(gateway, auth_headers, 'DELETE', f'/v1/records/{record_id}')
+    request(gateway, auth_headers, 'DELETE', f'/v1/records/{record_id}')
+
+    with count_queries() as counter:
+        status, body = request(gateway, auth_headers, 'GET', '/v1/stats')
+
+    assert status == 200
+    assert counter.count == 1
+    by_type = {operation['operation']['type']: operation for operation in body['data']['operations']}
+    assert by_type['addition']['record_count'] == 3
+    assert by_type['addition']['total_amount'] == '30'
+    assert by_type['multiplication']['record_count'] == 1
+    assert by_type['multiplication']['total_amount'] == '20'
+    assert body['data']['record_count'] == 4
+    assert body['data']['total_amount'] == '50'
+    assert body['data']['last_activity'] == max(operation['last_activity'] for operation in by_type.values())
+
+
+def test_incremental_summaries_match_a_rebuild(gateway, auth_headers, operations):
+    items = [{'operation_id': operation.id, 'num1': '9', 'num2': '3'} for operation in operations.values()]
+    request(gateway, auth_headers, 'POST', '/v1/records/batch', {'items': items + items})
+    request(gateway, auth_headers, 'POST', '/v1/records', items[0])
+    for record in list(Record.select().where(Record.operation == operations['/'].id)):
+        request(gateway, auth_headers, 'DELETE', f'/v1/records/{record.id}')
+    incremental = summaries()
+
+    UsageSummary.rebuild()
+
+    assert incremental == summaries()
+
+
+def test_get_records_reads_the_total_from_the_summaries(gateway, auth_headers, records):
+    status, body = request(gateway, auth_headers, 'DELETE', f"/v1/records/{Record.select().first().id}")
+    assert status == 200
+
+    with count_queries() as counter:
+        status, body = request(gateway, auth_headers, 'GET', '/v1/records?operation_type=add')
+
+    assert status == 200
+    active_additions = Record.select().join(Operation).where(Record.active & (Operation.type == 'addition'))
+    assert body['total_records'] == active_additions.count() == 5
+    assert not any('COUNT' in query.msg[0] for query in counter.get_queries())
+
+
+def test_stats_are_empty_without_records(gateway, auth_headers):
+    status, body = request(gateway, auth_headers, 'GET', '/v1/stats')
+
+    assert status == 200
+    assert body['data'] == {'operations': [], 'record_count': 0, 'total_amount': '0', 'last_activity': None}
+
+
+def test_stats_include_operations_missing_from_the_catalog(gateway, auth_headers, user, operations):
+    OperationCatalog.get_instance().serialized()
+    operation = Operation.create(type='power', cost=5, symbol='^', is_arithmetic=True)
+    UsageSummary.record_usage(user.id, [(operation.id, 2, 10, None)])
+
+    status, body = request(gateway, auth_headers, 'GET', '/v1/stats')
+
+    assert status == 200
+    assert [summary['operation']['type'] for summary in body['data']['operations']] == ['power']
+    assert body['data']['total_amount'] == '10'